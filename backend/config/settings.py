@@ -4,6 +4,7 @@ Django settings for Tag Game project.
 from pathlib import Path
 from datetime import timedelta
 from decouple import config
+from celery.schedules import crontab
 import os
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -146,23 +147,39 @@ CORS_ALLOWED_ORIGINS = config(
 )
 CORS_ALLOW_CREDENTIALS = True
 
+# Redis
+REDIS_HOST = config('REDIS_HOST', default='localhost')
+REDIS_PORT = config('REDIS_PORT', default=6379, cast=int)
+# Application data (leaderboards) lives in its own database
+REDIS_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/1"
+
 # Channels (WebSocket)
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
-            'hosts': [(config('REDIS_HOST', default='localhost'), config('REDIS_PORT', default=6379, cast=int))],
+            'hosts': [(REDIS_HOST, REDIS_PORT)],
         },
     },
 }
 
 # Celery Configuration
-CELERY_BROKER_URL = f"redis://{config('REDIS_HOST', default='localhost')}:{config('REDIS_PORT', default=6379, cast=int)}/0"
-CELERY_RESULT_BACKEND = f"redis://{config('REDIS_HOST', default='localhost')}:{config('REDIS_PORT', default=6379, cast=int)}/0"
+CELERY_BROKER_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
+CELERY_RESULT_BACKEND = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'snapshot-player-stats': {
+        'task': 'game.tasks.snapshot_player_stats',
+        'schedule': crontab(hour=0, minute=10),
+    },
+    'audit-user-totals': {
+        'task': 'game.tasks.audit_user_totals',
+        'schedule': crontab(minute=40),
+    },
+}
 
 # Admin Credentials
 ADMIN_USERNAME = config('ADMIN_USERNAME', default='admin')
@@ -0,0 +1,188 @@
+from django.utils import timezone
+from .models import GameSettings, Tag, Achievement
+from .intervals import CatchIntervals
+
+
+AUTOMATIC_ACHIEVEMENTS = {
+    'worst_player': {
+        'title': 'Worst Player',
+        'description': 'Player with the lowest points',
+        'icon': '💩',
+    },
+    'fastest_player': {
+        'title': 'Fastest Player',
+        'description': 'Player with the least time holding the tag',
+        'icon': '⚡',
+    },
+    'slowest_player': {
+        'title': 'Slowest Player',
+        'description': 'Player with the most time holding the tag',
+        'icon': '🐌',
+    },
+    'most_tags_given': {
+        'title': 'Most Active Tagger',
+        'description': 'Player who tagged others the most',
+        'icon': '🏹',
+    },
+    'most_tags_received': {
+        'title': 'Most Caught',
+        'description': 'Player who was tagged the most',
+        'icon': '🎯',
+    },
+    'fastest_catch': {
+        'title': 'Fastest Catch',
+        'description': 'Caught {tagged}',
+        'icon': '🚀',
+    },
+    'slowest_catch': {
+        'title': 'Slowest Catch',
+        'description': 'Held the tag for the longest time before being caught',
+        'icon': '⏰',
+    },
+}
+
+
+class AchievementEngine:
+    """Keeps automatic achievements up to date without touching custom ones
+
+    Every automatic achievement is a single row per game whose ``metric``
+    holds the current record. Rows are only written when their holder or
+    value changes. Achievements that went to a new holder are collected in
+    ``awarded``.
+    """
+    
+    def __init__(self, settings=None):
+        self.settings = settings or GameSettings.get_settings()
+        self.awarded = []
+        self.existing = {
+            achievement.achievement_type: achievement
+            for achievement in Achievement.objects.filter(
+                game=self.settings, achievement_type__in=AUTOMATIC_ACHIEVEMENTS
+            )
+        }
+    
+    def award(self, achievement_type, user, value, metric, **description_args):
+        """Upsert an automatic achievement, returns True if it changed"""
+        spec = AUTOMATIC_ACHIEVEMENTS[achievement_type]
+        description = spec['description'].format(**description_args)
+        
+        current = self.existing.get(achievement_type)
+        if (
+            current
+            and current.user_id == user.id
+            and current.value == value
+            and current.description == description
+        ):
+            return False
+        
+        self.existing[achievement_type], _ = Achievement.objects.update_or_create(
+            game=self.settings,
+            achievement_type=achievement_type,
+            defaults={
+                'user': user,
+                'title': spec['title'],
+                'description': description,
+                'value': value,
+                'metric': metric,
+                'icon': spec['icon'],
+                'awarded_at': timezone.now(),
+            }
+        )
+        if current is None or current.user_id != user.id:
+            self.awarded.append(self.existing[achievement_type])
+        return True
+    
+    def update_players(self, leaderboard):
+        """Update player records from leaderboard entries"""
+        if not leaderboard:
+            return
+        
+        worst = min(leaderboard, key=lambda x: x['points'])
+        self.award('worst_player', worst['user'], f"{worst['points']} points", worst['points'])
+        
+        fastest = min(leaderboard, key=lambda x: x['time_held'].total_seconds())
+        self.award(
+            'fastest_player', fastest['user'], str(fastest['time_held']),
+            fastest['time_held'].total_seconds()
+        )
+        
+        slowest = max(leaderboard, key=lambda x: x['time_held'].total_seconds())
+        self.award(
+            'slowest_player', slowest['user'], str(slowest['time_held']),
+            slowest['time_held'].total_seconds()
+        )
+        
+        most_tags = max(leaderboard, key=lambda x: x['tags_given'])
+        self.award(
+            'most_tags_given', most_tags['user'], f"{most_tags['tags_given']} tags",
+            most_tags['tags_given']
+        )
+        
+        most_caught = max(leaderboard, key=lambda x: x['tags_received'])
+        self.award(
+            'most_tags_received', most_caught['user'], f"{most_caught['tags_received']} times",
+            most_caught['tags_received']
+        )
+    
+    def award_catch(self, achievement_type, tag, gap):
+        holder = tag.tagger if achievement_type == 'fastest_catch' else tag.tagged
+        self.award(
+            achievement_type, holder, str(gap), gap.total_seconds(),
+            tagged=tag.tagged.full_name
+        )
+    
+    def gap(self, tag):
+        """Time since the verified catch before ``tag``, None for the first catch"""
+        previous = (
+            Tag.objects.filter(game=self.settings, verified=True, tagged_at__lt=tag.tagged_at)
+            .order_by('-tagged_at')
+            .values_list('tagged_at', flat=True)
+            .first()
+        )
+        return None if previous is None else tag.tagged_at - previous
+    
+    def update_catch(self, tag):
+        """Compare the gap closed by a new tag with the catch records"""
+        gap = self.gap(tag)
+        if gap is None:
+            return
+        
+        records = [self.existing.get('fastest_catch'), self.existing.get('slowest_catch')]
+        if any(record is None or record.metric is None for record in records):
+            # No records yet although earlier catches exist
+            self.rebuild_catches()
+            return
+        
+        if gap.total_seconds() < self.existing['fastest_catch'].metric:
+            self.award_catch('fastest_catch', tag, gap)
+        if gap.total_seconds() > self.existing['slowest_catch'].metric:
+            self.award_catch('slowest_catch', tag, gap)
+    
+    def update_changed_catches(self, tags, old_gaps):
+        """Update the catch records after a tag was added, removed or disputed
+
+        ``tags`` are the verified catches whose gap changed and ``old_gaps``
+        the gaps in seconds that changed catches closed before. A record set
+        by one of those may not stand anymore, so the records are searched
+        again; otherwise only the new gaps are compared with them.
+        """
+        records = [self.existing.get('fastest_catch'), self.existing.get('slowest_catch')]
+        if any(record is not None and record.metric in old_gaps for record in records):
+            self.rebuild_catches()
+            return
+        for tag in tags:
+            self.update_catch(tag)
+    
+    def rebuild_catches(self):
+        """Find the fastest and slowest catch over the whole tag history
+
+        Records are dropped when fewer than two catches are left.
+        """
+        for achievement_type, record in zip(
+            ['fastest_catch', 'slowest_catch'], CatchIntervals.catch_records(self.settings)
+        ):
+            if record:
+                tag = Tag.objects.select_related('tagger', 'tagged').get(id=record[0])
+                self.award_catch(achievement_type, tag, record[1])
+            elif self.existing.pop(achievement_type, None):
+                Achievement.objects.filter(game=self.settings, achievement_type=achievement_type).delete()
@@ -1,11 +1,14 @@
 from django.contrib import admin
-from .models import GameSettings, Tag, Achievement, PlayerStats
+from .models import GameSettings, HolderState, Tag, Achievement, PlayerStats, PlayerScore
 
 
 @admin.register(GameSettings)
 class GameSettingsAdmin(admin.ModelAdmin):
-    list_display = ['game_start_date', 'game_end_date', 'is_game_active', 'updated_at']
+    list_display = ['__str__', 'is_current', 'game_start_date', 'game_end_date', 'is_game_active', 'updated_at']
     fieldsets = [
+        ('Game', {
+            'fields': ('name', 'is_current')
+        }),
         ('Game Period', {
             'fields': ('game_start_date', 'game_end_date')
         }),
@@ -24,10 +27,6 @@ class GameSettingsAdmin(admin.ModelAdmin):
         }),
     ]
     
-    def has_add_permission(self, request):
-        # Only allow one instance
-        return not GameSettings.objects.exists()
-    
     def has_delete_permission(self, request, obj=None):
         # Don't allow deletion
         return False
@@ -36,13 +35,13 @@ class GameSettingsAdmin(admin.ModelAdmin):
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     list_display = ['tagger', 'tagged', 'tagged_at', 'points_awarded', 'time_penalty', 'verified']
-    list_filter = ['verified', 'tagged_at']
+    list_filter = ['game', 'verified', 'tagged_at']
     search_fields = ['tagger__username', 'tagged__username']
     readonly_fields = ['points_awarded', 'time_penalty', 'time_held', 'created_at']
     
     fieldsets = [
         ('Tag Details', {
-            'fields': ('tagger', 'tagged', 'tagged_at', 'location', 'notes', 'photo')
+            'fields': ('game', 'tagger', 'tagged', 'tagged_at', 'location', 'notes', 'photo')
         }),
         ('Calculated Values', {
             'fields': ('points_awarded', 'time_penalty', 'time_held')
@@ -56,13 +55,29 @@ class TagAdmin(admin.ModelAdmin):
 @admin.register(Achievement)
 class AchievementAdmin(admin.ModelAdmin):
     list_display = ['user', 'achievement_type', 'title', 'awarded_at']
-    list_filter = ['achievement_type', 'awarded_at']
+    list_filter = ['game', 'achievement_type', 'awarded_at']
     search_fields = ['user__username', 'title']
 
 
 @admin.register(PlayerStats)
 class PlayerStatsAdmin(admin.ModelAdmin):
     list_display = ['user', 'date', 'cumulative_points', 'rank', 'was_tagged']
-    list_filter = ['date', 'was_tagged']
+    list_filter = ['game', 'date', 'was_tagged']
     search_fields = ['user__username']
     readonly_fields = ['date']
+
+
+@admin.register(PlayerScore)
+class PlayerScoreAdmin(admin.ModelAdmin):
+    list_display = ['user', 'game', 'points', 'tags_given', 'tags_received', 'time_held']
+    search_fields = ['user__username']
+    readonly_fields = [
+        'points', 'bonus_points', 'tags_given', 'tags_received',
+        'time_held', 'last_tagged_at', 'updated_at'
+    ]
+
+
+@admin.register(HolderState)
+class HolderStateAdmin(admin.ModelAdmin):
+    list_display = ['game', 'holder', 'since', 'version']
+    readonly_fields = ['holder', 'since', 'version', 'updated_at']
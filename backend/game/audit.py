@@ -0,0 +1,184 @@
+import json
+import time
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from redis import RedisError
+from .models import HolderState, Tag
+from .intervals import CatchIntervals
+from .leaderboard import get_redis
+
+User = get_user_model()
+
+
+class TotalsAudit:
+    """Checks the denormalized User totals against the verified tag log
+
+    Totals span every game, so they are checked against the tags of all
+    games. Players are read in chunks of ``chunk_size`` ids and their totals are
+    recomputed with two aggregate queries per chunk, so memory stays bounded
+    by the chunk. A run stops after ``time_budget`` seconds and the next run
+    resumes the pass where it stopped. The report of the pass (players
+    checked, drifted and repaired, absolute drift per field) is kept in
+    Redis.
+
+    Drifted players are checked again under the holder locks before they are
+    repaired, so tags arriving during the pass are not mistaken for drift.
+    """
+
+    FIELDS = ['total_points', 'total_tags_given', 'total_tags_received', 'total_time_held']
+    CHUNK_SIZE = 500
+    TIME_BUDGET = 30
+    MAX_REPORTED = 50
+
+    REPORT_KEY = 'game:audit:totals'
+
+    def __init__(self, chunk_size=None, time_budget=None, client=None):
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.time_budget = self.TIME_BUDGET if time_budget is None else time_budget
+        self.client = client or get_redis()
+
+    @classmethod
+    def expected(cls, user_ids):
+        """Dict of user id -> totals of the verified tags, in FIELDS order"""
+        tags = Tag.objects.filter(verified=True)
+        totals = {user_id: [0, 0, 0, timedelta()] for user_id in user_ids}
+        for user_id, points, given in (
+            tags.filter(tagger_id__in=user_ids).values('tagger_id')
+            .annotate(points=Sum('points_awarded'), given=Count('id'))
+            .values_list('tagger_id', 'points', 'given')
+        ):
+            totals[user_id][0] += points
+            totals[user_id][1] = given
+        for user_id, penalty, received in (
+            tags.filter(tagged_id__in=user_ids).values('tagged_id')
+            .annotate(penalty=Sum('time_penalty'), received=Count('id'))
+            .values_list('tagged_id', 'penalty', 'received')
+        ):
+            totals[user_id][0] -= penalty
+            totals[user_id][2] = received
+        # From the catch times, so drifted Tag.time_held values show up too
+        for user_id, time_held in CatchIntervals.held_by_player(user_ids=user_ids).items():
+            totals[user_id][3] = time_held
+        return totals
+
+    @classmethod
+    def drift(cls, rows):
+        """Dict of user id -> {field: expected - stored} of drifted players
+
+        ``rows`` are (id, *FIELDS) tuples of stored totals.
+        """
+        expected = cls.expected([row[0] for row in rows])
+        drifted = {}
+        for user_id, *stored in rows:
+            delta = {
+                field: want - have
+                for field, want, have in zip(cls.FIELDS, expected[user_id], stored)
+                if want != have
+            }
+            if delta:
+                drifted[user_id] = delta
+        return drifted
+
+    @classmethod
+    def fix(cls, rows):
+        """Set the totals of drifted players among ``rows``, returns the drift"""
+        drifted = cls.drift(rows)
+        users = []
+        for user_id, *stored in rows:
+            if user_id in drifted:
+                user = User(id=user_id, **dict(zip(cls.FIELDS, stored)))
+                for field, delta in drifted[user_id].items():
+                    setattr(user, field, getattr(user, field) + delta)
+                users.append(user)
+        User.objects.bulk_update(users, cls.FIELDS, batch_size=cls.CHUNK_SIZE)
+        return drifted
+
+    @classmethod
+    def repair(cls, user_ids):
+        """Recheck players under the holder locks and fix their totals
+
+        Returns the drift that was repaired.
+        """
+        with transaction.atomic():
+            # Keep live tags of every game out between the recheck and the update
+            list(HolderState.objects.select_for_update().order_by('pk'))
+            return cls.fix(list(
+                User.objects.filter(id__in=user_ids).order_by('id').values_list('id', *cls.FIELDS)
+            ))
+
+    @classmethod
+    def new_report(cls):
+        return {
+            'started_at': timezone.now().isoformat(),
+            'finished_at': None,
+            'complete': False,
+            'cursor': 0,
+            'checked': 0,
+            'drifted': 0,
+            'repaired': 0,
+            'drift': {field: 0 for field in cls.FIELDS},
+            'players': [],
+        }
+
+    def report(self):
+        """Report of the current or last pass, None if there is none"""
+        try:
+            report = self.client.get(self.REPORT_KEY)
+        except RedisError:
+            return None
+        return json.loads(report) if report else None
+
+    def save(self, report):
+        try:
+            self.client.set(self.REPORT_KEY, json.dumps(report))
+        except RedisError:
+            pass
+
+    def run(self, repair=False, restart=False):
+        """Audit players until the pass ends or the time budget runs out
+
+        Returns the report of the pass so far, ``complete`` is set once
+        every player has been checked.
+        """
+        deadline = time.monotonic() + self.time_budget
+        report = None if restart else self.report()
+        if report is None or report['complete']:
+            report = self.new_report()
+
+        while True:
+            rows = list(
+                User.objects.filter(id__gt=report['cursor']).order_by('id')
+                .values_list('id', *self.FIELDS)[:self.chunk_size]
+            )
+            if not rows:
+                report['complete'] = True
+                report['finished_at'] = timezone.now().isoformat()
+                break
+
+            drifted = self.drift(rows)
+            if drifted and repair:
+                drifted = self.repair(list(drifted))
+                report['repaired'] += len(drifted)
+
+            report['checked'] += len(rows)
+            report['drifted'] += len(drifted)
+            for user_id, delta in drifted.items():
+                # Time held is reported in seconds
+                delta = {
+                    field: value.total_seconds() if isinstance(value, timedelta) else value
+                    for field, value in delta.items()
+                }
+                for field, value in delta.items():
+                    report['drift'][field] += abs(value)
+                if len(report['players']) < self.MAX_REPORTED:
+                    report['players'].append({'user_id': user_id, **delta})
+            report['cursor'] = rows[-1][0]
+
+            if time.monotonic() >= deadline:
+                break
+
+        self.save(report)
+        return report
@@ -0,0 +1,54 @@
+from .models import Tag
+
+
+class TagCalendar:
+    """Tagged days of a game encoded as one bitset per player
+
+    Bit ``i`` of a bitset stands for the ``i``-th day since the first tagged
+    day of the game. The untagged-day bonus of every player then comes from
+    a few shifts and masks over these integers instead of date lookups.
+    """
+    
+    def __init__(self, tagged_days):
+        """Build from an iterable of (user id, local date) pairs"""
+        tagged_days = list(tagged_days)
+        self.start = min((day for _, day in tagged_days), default=None)
+        self.game_days = 0
+        self.player_days = {}
+        
+        for user_id, day in tagged_days:
+            bit = 1 << (day - self.start).days
+            self.game_days |= bit
+            self.player_days[user_id] = self.player_days.get(user_id, 0) | bit
+    
+    @classmethod
+    def from_bitsets(cls, start, game_days, player_days):
+        """Build from bitsets that were already computed, e.g. by a replay"""
+        calendar = cls([])
+        calendar.start = start
+        calendar.game_days = game_days
+        calendar.player_days = dict(player_days)
+        return calendar
+    
+    @classmethod
+    def load(cls, game):
+        """Load the calendar of the verified tags of a game with a single query"""
+        return cls(
+            Tag.objects.filter(game=game, verified=True)
+            .order_by()
+            .values_list('tagged_id', 'tagged_at__date')
+            .distinct()
+        )
+    
+    def isolated_days(self, user_id):
+        """Number of game days on which the player, and both neighbouring days, were not tagged"""
+        days = self.player_days.get(user_id, 0)
+        covered = days | (days << 1) | (days >> 1)
+        return (self.game_days & ~covered).bit_count()
+    
+    def bonuses(self, user_ids, bonus_per_day):
+        """Dict of user id -> untagged-day bonus points"""
+        return {
+            user_id: self.isolated_days(user_id) * bonus_per_day
+            for user_id in user_ids
+        }
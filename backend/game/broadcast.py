@@ -0,0 +1,93 @@
+import json
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.serializers.json import DjangoJSONEncoder
+from redis import RedisError
+from .leaderboard import get_redis
+
+
+def encode_frame(message):
+    """Channel layer event carrying an encoded WebSocket frame
+
+    The frame's type and seq ride along so consumers can coalesce frames
+    without decoding them.
+    """
+    return {
+        'type': 'frame',
+        'kind': message.get('type'),
+        'seq': message.get('seq'),
+        'text': json.dumps(message, cls=DjangoJSONEncoder),
+    }
+
+
+def broadcast(group, message):
+    """Send a message to every socket of a group
+
+    The frame is encoded once here and consumers forward the text as is,
+    so a broadcast costs one ``json.dumps`` however many sockets listen.
+    """
+    async_to_sync(get_channel_layer().group_send)(group, encode_frame(message))
+
+
+class GameStream:
+    """Sequenced broadcasts of a game that reconnecting clients can replay
+
+    Every frame sent to the game's group gets the next ``seq`` of the game
+    and is kept in a Redis stream capped at about ``LENGTH`` frames, under
+    the stream id ``<seq>-0``. A client that reconnects with the last
+    ``seq`` it saw gets the frames it missed, or a snapshot when some of
+    them are gone.
+    """
+
+    LENGTH = 200
+    LOCK_TIMEOUT = 10
+
+    def __init__(self, game, client=None):
+        self.group = game.group_name
+        self.key = f'game:{game.pk}:events'
+        self.seq_key = f'{self.key}:seq'
+        self.lock_key = f'{self.key}:lock'
+        self.client = client or get_redis()
+
+    def publish(self, message):
+        """Broadcast a message with the next sequence number, returns the number
+
+        Without Redis the frame is sent without one, None is returned.
+        """
+        send = async_to_sync(get_channel_layer().group_send)
+        sent = False
+        try:
+            # Frames must enter the stream and reach the group in sequence order
+            with self.client.lock(self.lock_key, timeout=self.LOCK_TIMEOUT):
+                seq = self.client.incr(self.seq_key)
+                event = encode_frame({**message, 'seq': seq})
+                self.client.xadd(
+                    self.key, {'frame': event['text']}, id=f'{seq}-0',
+                    maxlen=self.LENGTH, approximate=True
+                )
+                send(self.group, event)
+                sent = True
+        except RedisError:
+            if sent:
+                # Only releasing the lock failed
+                return seq
+            seq = None
+            send(self.group, encode_frame(message))
+        return seq
+
+    def current(self):
+        """Sequence number of the last frame, 0 before the first one"""
+        return int(self.client.get(self.seq_key) or 0)
+
+    def since(self, seq):
+        """Encoded frames after ``seq``, None if they are not all kept"""
+        current = self.current()
+        if seq == current:
+            return []
+        if not 0 <= seq < current or current - seq > self.LENGTH:
+            return None
+
+        entries = self.client.xrange(self.key, min=f'{seq + 1}-0')
+        if not entries or entries[0][0] != f'{seq + 1}-0'.encode():
+            return None
+        return [fields[b'frame'].decode() for _, fields in entries]
@@ -0,0 +1,93 @@
+import copy
+import os
+import threading
+import time
+import redis
+from django.conf import settings
+from django.db import connection
+from .leaderboard import get_redis
+
+INVALIDATION_CHANNEL = 'game:settings:invalidate'
+
+
+class SettingsCache:
+    """Process-local copies of GameSettings rows
+
+    Every process (daphne, Celery worker) keeps the current game and the
+    games looked up by id in memory, tagged with their ``updated_at``.
+    Saving a game publishes its id and new ``updated_at`` over Redis and a
+    listener thread in each process drops older copies. Copies also expire
+    after ``MAX_AGE`` seconds in case an invalidation message is missed while
+    Redis reconnects.
+
+    Inside a transaction the database is always read, so a transaction sees
+    its own writes and rolled back writes never reach the cache.
+    """
+    
+    MAX_AGE = 300
+    
+    def __init__(self):
+        # Key None is the current game, other keys are game ids
+        self._values = {}
+        self._listener_pid = None
+        self._lock = threading.Lock()
+    
+    def get(self, loader, key=None):
+        if connection.in_atomic_block:
+            return loader()
+        
+        self._ensure_listener()
+        value, loaded_at = self._values.get(key, (None, 0))
+        if value is None or time.monotonic() - loaded_at > self.MAX_AGE:
+            value = loader()
+            self._values[key] = (value, time.monotonic())
+        # Callers may modify their instance before saving it
+        return copy.copy(value)
+    
+    def invalidate(self, updated_at=None, pk=None):
+        """Drop cached copies unless they already match ``updated_at``
+
+        With ``pk``, copies of other games looked up by id are kept.
+        """
+        for key, (value, _) in list(self._values.items()):
+            if updated_at is not None and value.updated_at.isoformat() == updated_at:
+                continue
+            if pk is not None and key is not None and value.pk != pk:
+                continue
+            self._values.pop(key, None)
+    
+    def publish(self, game):
+        """Tell every process that a game changed"""
+        try:
+            get_redis().publish(INVALIDATION_CHANNEL, f'{game.pk} {game.updated_at.isoformat()}')
+        except redis.RedisError:
+            pass
+    
+    def _ensure_listener(self):
+        # Forked workers do not inherit the parent's thread
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+        with self._lock:
+            if self._listener_pid == pid:
+                return
+            self._listener_pid = pid
+            self._values = {}
+            threading.Thread(target=self._listen, daemon=True, name='settings-cache').start()
+    
+    def _listen(self):
+        while True:
+            try:
+                pubsub = redis.Redis.from_url(settings.REDIS_URL).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Messages may have been missed while disconnected
+                self.invalidate()
+                for message in pubsub.listen():
+                    pk, updated_at = message['data'].decode().split(' ', 1)
+                    self.invalidate(updated_at, int(pk))
+            except redis.RedisError:
+                self.invalidate()
+                time.sleep(5)
+
+
+settings_cache = SettingsCache()
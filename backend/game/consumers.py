@@ -1,16 +1,62 @@
+import asyncio
 import json
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from redis import RedisError
+from .models import GameSettings, Tag
+from .broadcast import GameStream
+from .feed import LeaderboardFeed
+from .outbox import Outbox, socket_metrics
+from .game_engine import GameEngine
+from .serializers import LeaderboardSerializer
+from notifications.live import new_tag_data, unread_counts
 
 User = get_user_model()
 
 
 class GameConsumer(AsyncWebsocketConsumer):
-    """WebSocket consumer for real-time game updates"""
+    """WebSocket consumer for real-time updates of one game
+
+    ``ws/game/<id>/`` follows a given game, ``ws/game/`` the current one.
+    Broadcasts arrive as frames encoded by the publisher, see game.broadcast.
+    Clients send ``leaderboard_sync`` with the leaderboard version they have
+    and get the patches or the full leaderboard they are missing.
+
+    Authenticated players also join their own group for events meant for
+    them only: ``tagged``, ``profile``, ``notification``, ``unread_count``
+    and ``achievement``. They get their unread count on connect.
+
+    Game frames carry a ``seq``, see GameStream. A client reconnecting with
+    ``?last_seq=<seq>`` (or sending ``resume`` with ``last_seq``) gets the
+    frames it missed, or a ``snapshot`` of the game when they are gone.
+    Frames may then arrive twice, clients skip a ``seq`` they already have.
+
+    Outgoing frames wait in a bounded Outbox drained by a writer task.
+    Clients send ``ack`` with the last ``seq`` they handled. Sockets that
+    stay too slow are closed with code 4008 and resume from their
+    ``last_seq`` when they reconnect.
+    """
+    
+    RECENT_TAGS = 10
+    SLOW_CLOSE_CODE = 4008
+    
+    game = None
+    room_group_name = None
+    user_group_name = None
+    outbox = None
+    writer = None
+    closing = False
     
     async def connect(self):
-        self.room_group_name = 'game_updates'
+        game = await self.get_game(self.scope['url_route']['kwargs'].get('game_id'))
+        if game is None:
+            await self.close(code=4404)
+            return
+        self.game = game
+        self.room_group_name = game.group_name
         
         # Join room group
         await self.channel_layer.group_add(
@@ -18,9 +64,115 @@ class GameConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         
+        user = self.scope.get('user')
+        if user is not None and user.is_authenticated:
+            self.user_group_name = user.group_name
+            await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+        
         await self.accept()
+        self.outbox = Outbox()
+        self.writer = asyncio.create_task(self.write())
+        socket_metrics.connections += 1
+        
+        if self.user_group_name is not None:
+            await self.send(text_data=json.dumps({
+                'type': 'unread_count',
+                'data': {'count': await self.unread_count(user.pk)}
+            }))
+        
+        last_seq = parse_qs(self.scope.get('query_string', b'').decode()).get('last_seq')
+        if last_seq:
+            await self.resume(last_seq[0])
+    
+    async def resume(self, last_seq):
+        """Send the game frames after ``last_seq``, or a snapshot"""
+        try:
+            frames = await self.missed_frames(int(last_seq))
+        except (TypeError, ValueError):
+            frames = None
+        if frames is None or len(frames) > self.outbox.room():
+            await self.send(text_data=json.dumps(await self.snapshot(), cls=DjangoJSONEncoder))
+            return
+        for frame in frames:
+            await self.send(text_data=frame)
+    
+    @database_sync_to_async
+    def missed_frames(self, last_seq):
+        try:
+            return GameStream(self.game).since(last_seq)
+        except RedisError:
+            return None
+    
+    async def snapshot(self):
+        """Current holder, recent tags and leaderboard, with the seq they follow"""
+        seq, holder, recent_tags = await self.game_state()
+        leaderboard = (await self.leaderboard_since(None))[0]
+        return {
+            'type': 'snapshot',
+            'seq': seq,
+            'data': {
+                'holder': holder,
+                'recent_tags': recent_tags,
+                'leaderboard': {'version': leaderboard['version'], 'data': leaderboard['data']},
+            }
+        }
+    
+    @database_sync_to_async
+    def game_state(self):
+        # Read the seq first, frames after it may already be in the state
+        try:
+            seq = GameStream(self.game).current()
+        except RedisError:
+            seq = None
+        holder = GameEngine.get_current_holder_info(self.game)
+        tags = (
+            Tag.objects.filter(game=self.game, verified=True)
+            .select_related('tagger', 'tagged', 'game')
+            .order_by('-tagged_at')[:self.RECENT_TAGS]
+        )
+        return (
+            seq,
+            {'user': holder['user'], 'since': holder['since'], 'version': holder['version']},
+            [new_tag_data(tag) for tag in tags],
+        )
+    
+    @database_sync_to_async
+    def get_game(self, game_id):
+        if game_id is None:
+            return GameSettings.get_settings()
+        try:
+            return GameSettings.get_game(game_id)
+        except GameSettings.DoesNotExist:
+            return None
+    
+    @database_sync_to_async
+    def unread_count(self, user_id):
+        return unread_counts([user_id])[user_id]
+    
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        """Queue a frame for the writer task"""
+        if close:
+            await super().send(close=close)
+        elif self.outbox is not None:
+            self.outbox.put(text_data, bytes=bytes_data)
+    
+    async def write(self):
+        """Send queued frames one at a time, for as long as the socket is open"""
+        while True:
+            frame = await self.outbox.get()
+            await super().send(**frame)
+            socket_metrics.sent += 1
     
     async def disconnect(self, close_code):
+        if self.writer is not None:
+            self.writer.cancel()
+            self.outbox.clear()
+            socket_metrics.connections -= 1
+            self.writer = None
+        if self.user_group_name is not None:
+            await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+        if self.room_group_name is None:
+            return
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -36,24 +188,40 @@ class GameConsumer(AsyncWebsocketConsumer):
             await self.send(text_data=json.dumps({
                 'type': 'pong'
             }))
+        elif message_type == 'ack':
+            if self.outbox is not None:
+                self.outbox.ack(data.get('seq'))
+        elif message_type == 'resume':
+            await self.resume(data.get('last_seq'))
+        elif message_type == 'leaderboard_sync':
+            for message in await self.leaderboard_since(data.get('version')):
+                await self.send(text_data=json.dumps(message))
+    
+    @database_sync_to_async
+    def leaderboard_since(self, version):
+        """Feed messages from ``version`` on, publishing a first leaderboard if needed"""
+        data = None
+        try:
+            feed = LeaderboardFeed(self.game)
+            messages = feed.since(version)
+            if messages is None:
+                data = LeaderboardSerializer(GameEngine.calculate_leaderboard(self.game), many=True).data
+                feed.publish(data)
+                messages = feed.since(version)
+            return messages
+        except RedisError:
+            if data is None:
+                data = LeaderboardSerializer(GameEngine.calculate_leaderboard(self.game), many=True).data
+            return [{'type': 'leaderboard_update', 'version': None, 'data': data}]
     
-    async def game_update(self, event):
-        """Receive game update from room group and send to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'game_update',
-            'data': event['data']
-        }))
-    
-    async def new_tag(self, event):
-        """Receive new tag notification"""
-        await self.send(text_data=json.dumps({
-            'type': 'new_tag',
-            'data': event['data']
-        }))
-    
-    async def leaderboard_update(self, event):
-        """Receive leaderboard update"""
-        await self.send(text_data=json.dumps({
-            'type': 'leaderboard_update',
-            'data': event['data']
-        }))
+    async def frame(self, event):
+        """Forward a frame encoded by the publisher, see game.broadcast"""
+        if self.outbox is None or self.closing:
+            return
+        self.outbox.put(event.get('text'), event.get('kind'), event.get('seq'), event.get('bytes'))
+        if self.outbox.overdue():
+            # The client resumes from its last seq when it reconnects
+            self.closing = True
+            socket_metrics.slow_disconnects += 1
+            self.outbox.clear()
+            await self.close(code=self.SLOW_CLOSE_CODE)
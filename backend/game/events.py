@@ -0,0 +1,233 @@
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import NamedTuple, Optional
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import GameSnapshot, Tag
+from .bonus import TagCalendar
+
+
+class PlayerTotals(NamedTuple):
+    """Running totals of one player in a GameState
+
+    ``time_held`` follows the scoring rules, the sum of gaps between the
+    player's catches. ``held`` is the time the player actually had the tag,
+    from being caught until tagging someone.
+    """
+
+    points: int = 0
+    tags_given: int = 0
+    tags_received: int = 0
+    time_held: timedelta = timedelta()
+    last_tagged_at: Optional[datetime] = None
+    tagged_days: int = 0
+    held: timedelta = timedelta()
+
+    def to_json(self):
+        return [
+            self.points, self.tags_given, self.tags_received,
+            self.time_held // timedelta(microseconds=1),
+            self.last_tagged_at.isoformat() if self.last_tagged_at else None,
+            format(self.tagged_days, 'x'),
+            self.held // timedelta(microseconds=1),
+        ]
+
+    @classmethod
+    def from_json(cls, data):
+        points, given, received, time_held, last_tagged_at, days, held = data
+        return cls(
+            points, given, received,
+            timedelta(microseconds=time_held),
+            parse_datetime(last_tagged_at) if last_tagged_at else None,
+            int(days, 16),
+            timedelta(microseconds=held),
+        )
+
+
+@dataclass(frozen=True)
+class GameState:
+    """Game totals after folding the verified tag log in order
+
+    States are never modified, ``apply`` returns a new one. Points exclude
+    the untagged-day bonus, which depends on the settings and is computed
+    from the tagged-day bitsets when the state is read, see ``calendar``.
+    Bit ``i`` of the bitsets stands for the ``i``-th day after ``start``.
+    """
+
+    players: dict = field(default_factory=dict)
+    holder_id: Optional[int] = None
+    event_count: int = 0
+    last_tag_id: Optional[int] = None
+    last_tagged_at: Optional[datetime] = None
+    start: Optional[date] = None
+    game_days: int = 0
+
+    def apply(self, tags):
+        """Fold tags, ordered by (tagged_at, id) and later than this state"""
+        players = dict(self.players)
+        holder_id = self.holder_id
+        event_count = self.event_count
+        last_tag_id = self.last_tag_id
+        last_tagged_at = self.last_tagged_at
+        start = self.start
+        game_days = self.game_days
+
+        for tag in tags:
+            day = timezone.localdate(tag.tagged_at)
+            if start is None:
+                start = day
+            bit = 1 << (day - start).days
+            game_days |= bit
+
+            tagger = players.get(tag.tagger_id, PlayerTotals())
+            held = tagger.held
+            if last_tagged_at:
+                held += tag.tagged_at - last_tagged_at
+            players[tag.tagger_id] = tagger._replace(
+                points=tagger.points + tag.points_awarded,
+                tags_given=tagger.tags_given + 1,
+                held=held,
+            )
+
+            # Time held is the sum of gaps between consecutive catches of the player
+            tagged = players.get(tag.tagged_id, PlayerTotals())
+            time_held = tagged.time_held
+            if tagged.last_tagged_at:
+                time_held += tag.tagged_at - tagged.last_tagged_at
+            players[tag.tagged_id] = tagged._replace(
+                points=tagged.points - tag.time_penalty,
+                tags_received=tagged.tags_received + 1,
+                time_held=time_held,
+                last_tagged_at=tag.tagged_at,
+                tagged_days=tagged.tagged_days | bit,
+            )
+
+            holder_id = tag.tagged_id
+            event_count += 1
+            last_tag_id = tag.id
+            last_tagged_at = tag.tagged_at
+
+        return GameState(
+            players, holder_id, event_count, last_tag_id, last_tagged_at, start, game_days
+        )
+
+    def player(self, user_id):
+        return self.players.get(user_id, PlayerTotals())
+
+    def held(self, user_id, at):
+        """Time the player actually had the tag up to ``at``"""
+        held = self.player(user_id).held
+        if user_id == self.holder_id and self.last_tagged_at:
+            held += at - self.last_tagged_at
+        return held
+
+    def calendar(self):
+        """TagCalendar of the folded tags, for untagged-day bonuses"""
+        return TagCalendar.from_bitsets(
+            self.start,
+            self.game_days,
+            {user_id: totals.tagged_days for user_id, totals in self.players.items() if totals.tagged_days},
+        )
+
+    def to_json(self):
+        return {
+            'players': {str(user_id): totals.to_json() for user_id, totals in self.players.items()},
+            'holder_id': self.holder_id,
+            'event_count': self.event_count,
+            'last_tag_id': self.last_tag_id,
+            'last_tagged_at': self.last_tagged_at.isoformat() if self.last_tagged_at else None,
+            'start': self.start.isoformat() if self.start else None,
+            'game_days': format(self.game_days, 'x'),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            {int(user_id): PlayerTotals.from_json(totals) for user_id, totals in data['players'].items()},
+            data['holder_id'],
+            data['event_count'],
+            data['last_tag_id'],
+            parse_datetime(data['last_tagged_at']) if data['last_tagged_at'] else None,
+            date.fromisoformat(data['start']) if data['start'] else None,
+            int(data['game_days'], 16),
+        )
+
+
+class GameLog:
+    """The verified tag log of a game, replayed from periodic snapshots
+
+    A snapshot is written after every ``SNAPSHOT_EVERY`` tags and after the
+    last tag of every day, so a replay only folds the tags since the latest
+    one. Changing past tags drops the snapshots that include them.
+    """
+
+    SNAPSHOT_EVERY = 500
+    BATCH_SIZE = 2000
+
+    def __init__(self, game):
+        self.game = game
+
+    def latest_snapshot(self, until=None):
+        snapshots = GameSnapshot.objects.filter(game=self.game)
+        if until is not None:
+            snapshots = snapshots.filter(last_tagged_at__lte=until)
+        return snapshots.order_by('-last_tagged_at', '-event_count').first()
+
+    def events(self, state, until=None):
+        """Verified tags after ``state``, in replay order"""
+        tags = Tag.objects.filter(game=self.game, verified=True).order_by('tagged_at', 'id').only(
+            'id', 'tagger_id', 'tagged_id', 'tagged_at', 'points_awarded', 'time_penalty'
+        )
+        if state.last_tagged_at:
+            tags = tags.filter(
+                Q(tagged_at__gt=state.last_tagged_at)
+                | Q(tagged_at=state.last_tagged_at, id__gt=state.last_tag_id)
+            )
+        if until is not None:
+            tags = tags.filter(tagged_at__lte=until)
+        return tags
+
+    def replay(self, until=None, checkpoint=True):
+        """State of the game after all tags (up to ``until``)
+
+        Starts from the latest snapshot and folds only the tail, writing new
+        snapshots on the way when ``checkpoint`` is set.
+        """
+        snapshot = self.latest_snapshot(until)
+        state = GameState.from_json(snapshot.state) if snapshot else GameState()
+
+        snapshots = []
+        segment = []
+        segment_day = None
+        for tag in self.events(state, until).iterator(chunk_size=self.BATCH_SIZE):
+            day = timezone.localdate(tag.tagged_at)
+            if segment and day != segment_day:
+                state = state.apply(segment)
+                segment = []
+                snapshots.append(self.snapshot(state))
+            segment.append(tag)
+            segment_day = day
+
+            if (state.event_count + len(segment)) % self.SNAPSHOT_EVERY == 0:
+                state = state.apply(segment)
+                segment = []
+                snapshots.append(self.snapshot(state))
+
+        state = state.apply(segment)
+        if checkpoint and snapshots:
+            GameSnapshot.objects.bulk_create(snapshots, ignore_conflicts=True)
+        return state
+
+    def snapshot(self, state):
+        return GameSnapshot(
+            game=self.game,
+            event_count=state.event_count,
+            last_tag_id=state.last_tag_id,
+            last_tagged_at=state.last_tagged_at,
+            state=state.to_json(),
+        )
+
+    def invalidate(self, since):
+        """Drop snapshots that include tags from ``since`` on"""
+        GameSnapshot.objects.filter(game=self.game, last_tagged_at__gte=since).delete()
@@ -0,0 +1,122 @@
+import json
+from datetime import timedelta
+from .leaderboard import get_redis
+
+
+class LeaderboardFeed:
+    """Versioned leaderboard pushed to WebSocket clients as patches
+
+    The last published leaderboard is kept in Redis with a version number.
+    Publishing a new one sends only the entries that changed, as a patch
+    from the previous version. The last ``HISTORY`` patches are kept so a
+    client that missed a few can catch up; clients further behind get the
+    full leaderboard instead.
+
+    Messages are the WebSocket frames as sent to clients:
+
+    - ``leaderboard_update``: ``version`` and the full leaderboard in ``data``
+    - ``leaderboard_patch``: ``version``, the ``base`` version it applies to,
+      ``changed`` entries with ``user_id`` and only the fields that changed,
+      also within the nested user (new players get the whole entry), and
+      the ``removed`` user ids
+    """
+
+    HISTORY = 50
+    TTL = timedelta(days=7)
+    LOCK_TIMEOUT = 10
+
+    def __init__(self, game, client=None):
+        self.key = f'game:{game.pk}:leaderboard:feed'
+        self.patches_key = f'{self.key}:patches'
+        self.lock_key = f'{self.key}:lock'
+        self.client = client or get_redis()
+
+    @staticmethod
+    def diff(old, new):
+        """Changed entries and removed user ids from one serialized leaderboard to another"""
+        before = {entry['user']['id']: entry for entry in old}
+        changed = []
+        for entry in new:
+            user_id = entry['user']['id']
+            previous = before.pop(user_id, None)
+            fields = entry if previous is None else LeaderboardFeed.changed_fields(previous, entry)
+            if fields:
+                changed.append({'user_id': user_id, **fields})
+        return changed, list(before)
+
+    @staticmethod
+    def changed_fields(old, new):
+        """Fields of ``new`` that differ from ``old``, nested dicts are compared field by field"""
+        fields = {}
+        for field, value in new.items():
+            previous = old.get(field)
+            if isinstance(value, dict) and isinstance(previous, dict):
+                value = LeaderboardFeed.changed_fields(previous, value)
+                if value:
+                    fields[field] = value
+            elif value != previous:
+                fields[field] = value
+        return fields
+
+    def snapshot(self):
+        """Last published leaderboard as a ``leaderboard_update`` message, None if there is none"""
+        value = self.client.get(self.key)
+        return None if value is None else json.loads(value)
+
+    def publish(self, entries):
+        """Store a new serialized leaderboard, returns the message to broadcast
+
+        That is a patch from the previous version, the full leaderboard if
+        nothing was published yet, or None if nothing changed.
+        """
+        with self.client.lock(self.lock_key, timeout=self.LOCK_TIMEOUT):
+            previous = self.snapshot()
+            version = previous['version'] + 1 if previous else 1
+            snapshot = {'type': 'leaderboard_update', 'version': version, 'data': entries}
+
+            message = snapshot
+            if previous:
+                changed, removed = self.diff(previous['data'], entries)
+                if not changed and not removed:
+                    return None
+                message = {
+                    'type': 'leaderboard_patch',
+                    'version': version,
+                    'base': previous['version'],
+                    'changed': changed,
+                    'removed': removed,
+                }
+
+            pipe = self.client.pipeline()
+            pipe.set(self.key, json.dumps(snapshot), ex=self.TTL)
+            if previous:
+                pipe.lpush(self.patches_key, json.dumps(message))
+                pipe.ltrim(self.patches_key, 0, self.HISTORY - 1)
+            else:
+                pipe.delete(self.patches_key)
+            pipe.expire(self.patches_key, self.TTL)
+            pipe.execute()
+        return message
+
+    def since(self, version):
+        """Messages that bring a client at ``version`` up to date
+
+        Patches when the client is at most ``HISTORY`` versions behind,
+        otherwise the full leaderboard. None if nothing was published yet.
+        """
+        snapshot = self.snapshot()
+        if snapshot is None:
+            return None
+        if version == snapshot['version']:
+            return []
+
+        if isinstance(version, int) and 0 < snapshot['version'] - version <= self.HISTORY:
+            # Newest first
+            patches = [
+                json.loads(patch)
+                for patch in self.client.lrange(self.patches_key, 0, snapshot['version'] - version - 1)
+            ]
+            patches.reverse()
+            if patches and patches[0]['base'] == version and patches[-1]['version'] == snapshot['version']:
+                return patches
+        return [snapshot]
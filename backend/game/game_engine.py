@@ -1,119 +1,652 @@
 from django.utils import timezone
-from django.db.models import F, Q, Sum, Count
+from django.db import connection, transaction
+from django.db.models import F, Q
 from django.contrib.auth import get_user_model
-from datetime import timedelta
-from .models import GameSettings, Tag, Achievement, PlayerStats
+from datetime import datetime, timedelta
+from redis import RedisError
+from .models import GameSettings, HolderState, Tag, Achievement, PlayerStats, PlayerScore
+from .leaderboard import RedisLeaderboard
+from .holder import HolderCache
+from .bonus import TagCalendar
+from .achievements import AchievementEngine, AUTOMATIC_ACHIEVEMENTS
+from .events import GameLog
+from .scoring import ScoringReplay
+from .broadcast import broadcast
+from .serializers import AchievementSerializer
+from users.serializers import UserSerializer
 
 User = get_user_model()
 
 
+class HolderConflict(ValueError):
+    """The tag changed hands before this tag could be committed"""
+    
+    def __init__(self, holder, message):
+        super().__init__(message)
+        self.holder = holder
+
+
 class GameEngine:
     """Core game logic for calculating points, penalties, and achievements"""
     
     @staticmethod
-    def get_current_tag_holder():
+    def get_holder_state(settings=None):
+        """Get the holder state row, creating it from settings or the tag log"""
+        settings = settings or GameSettings.get_settings()
+        state = HolderState.objects.select_related('holder').filter(game=settings).first()
+        if state:
+            return state
+        
+        # First check if there's a configured current holder in settings,
+        # otherwise get from latest tag
+        holder = settings.current_tag_holder
+        if holder is None:
+            latest_tag = (
+                Tag.objects.filter(game=settings, verified=True)
+                .select_related('tagged').order_by('-tagged_at').first()
+            )
+            holder = latest_tag.tagged if latest_tag else None
+        
+        since = settings.tag_holder_since
+        if holder:
+            last_tag = Tag.objects.filter(game=settings, tagged=holder).order_by('-tagged_at').first()
+            if last_tag:
+                since = last_tag.tagged_at
+        
+        state, created = HolderState.objects.get_or_create(
+            game=settings,
+            defaults={'holder': holder, 'since': since}
+        )
+        return state
+    
+    @staticmethod
+    def holder_info(state):
+        """Cacheable description of the holder state"""
+        return {
+            'user_id': state.holder_id,
+            'user': UserSerializer(state.holder).data if state.holder else None,
+            'since': state.since.isoformat() if state.since else None,
+            'version': state.version,
+        }
+    
+    @staticmethod
+    def get_current_holder_info(settings=None):
+        """Current holder as a dict of user_id, serialized user, since and version
+
+        Outside transactions this is a single Redis lookup; a miss or a Redis
+        error falls back to the holder state row.
+        """
+        settings = settings or GameSettings.get_settings()
+        use_cache = not connection.in_atomic_block
+        if use_cache:
+            try:
+                info = HolderCache(settings).get()
+                if info is not None:
+                    return info
+            except RedisError:
+                use_cache = False
+        
+        info = GameEngine.holder_info(GameEngine.get_holder_state(settings))
+        if use_cache:
+            try:
+                # Never overwrite a newer value written by a handoff
+                HolderCache(settings).set(info, only_if_missing=True)
+            except RedisError:
+                pass
+        return info
+    
+    @staticmethod
+    def get_holder_info_for(settings, user, expected_version=None):
+        """Current holder info as seen by ``user`` tagging at ``expected_version``
+
+        The cache may lag a handoff, so a cached answer that would turn the
+        user away is confirmed against the holder state row.
+        """
+        info = GameEngine.get_current_holder_info(settings)
+        if info['user_id'] != user.id or expected_version not in (None, info['version']):
+            info = GameEngine.holder_info(GameEngine.get_holder_state(settings))
+        return info
+    
+    @staticmethod
+    def get_current_tag_holder(settings=None):
         """Get the player currently holding the tag"""
-        # First check if there's a configured current holder in settings
-        settings = GameSettings.get_settings()
-        if settings.current_tag_holder:
-            return settings.current_tag_holder
-        
-        # Otherwise get from latest tag
-        latest_tag = Tag.objects.filter(verified=True).order_by('-created_at').first()
-        return latest_tag.tagged_user if latest_tag else None
+        return GameEngine.get_holder_state(settings).holder
     
     @staticmethod
-    def calculate_leaderboard():
-        """Calculate current leaderboard with live data"""
-        settings = GameSettings.get_settings()
-        users = User.objects.filter(is_approved=True, is_participating=True)
+    def previous_holder_id(settings, holder):
+        """Id of the player who handed the tag to ``holder`` with a tag
+
+        ``holder`` is the current holder info. None if the holder got the tag
+        some other way, e.g. from an admin.
+        """
+        if not holder['user_id'] or not holder['since']:
+            return None
+        last = (
+            Tag.objects.filter(game=settings, tagged_id=holder['user_id'], verified=True)
+            .order_by('-tagged_at').values_list('tagger_id', 'tagged_at').first()
+        )
+        if last and last[1] == datetime.fromisoformat(holder['since']):
+            return last[0]
+        return None
+    
+    @staticmethod
+    def set_holder(settings, holder, since=None):
+        """Hand the tag to a player outside of a tag, e.g. by an admin"""
+        GameEngine.get_holder_state(settings)
+        with transaction.atomic():
+            state = HolderState.objects.select_for_update().get(game=settings)
+            state.holder = holder
+            state.since = since or timezone.now()
+            state.version += 1
+            state.save()
+            
+            info = GameEngine.holder_info(state)
+            transaction.on_commit(lambda: GameEngine.cache_holder_info(settings, info))
+        return state
+    
+    @staticmethod
+    def cache_holder_info(settings, info):
+        """Write holder info to Redis, ignoring outages
+
+        When the write fails the old value is dropped if possible, so readers
+        fall back to the holder state row rather than see the old holder.
+        """
+        try:
+            HolderCache(settings).set(info)
+        except RedisError:
+            try:
+                HolderCache(settings).clear()
+            except RedisError:
+                pass
+    
+    @staticmethod
+    def calculate_leaderboard(settings=None):
+        """Calculate current leaderboard from the materialized scores"""
+        settings = settings or GameSettings.get_settings()
+        holder_id = GameEngine.get_current_holder_info(settings)['user_id']
+        now = timezone.now()
+        
+        scores = list(
+            PlayerScore.objects
+            .filter(game=settings, user__is_approved=True, user__is_participating=True)
+            .select_related('user')
+        )
+        # Players without a score row yet are listed with empty totals
+        scores += [
+            PlayerScore(game=settings, user=user)
+            for user in User.objects.filter(is_approved=True, is_participating=True).exclude(scores__game=settings)
+        ]
+        scores.sort(key=lambda score: (-score.points, score.user_id))
+        
+        leaderboard = []
+        for rank, score in enumerate(scores, start=1):
+            is_current_holder = score.user_id == holder_id
+            time_held = score.time_held
+            if is_current_holder and score.last_tagged_at:
+                time_held += now - score.last_tagged_at
+            
+            leaderboard.append({
+                'rank': rank,
+                'user': score.user,
+                'points': score.points,
+                'tags_given': score.tags_given,
+                'tags_received': score.tags_received,
+                'time_held': time_held,
+                'is_current_holder': is_current_holder
+            })
+        
+        return leaderboard
+    
+    @staticmethod
+    def calculate_leaderboard_as_of(as_of, settings=None):
+        """Calculate the leaderboard as it stood at ``as_of``
+
+        Replays the tag log from the nearest snapshot before ``as_of``, so a
+        historical query reads one snapshot and the tags after it.
+        """
+        settings = settings or GameSettings.get_settings()
+        state = GameLog(settings).replay(until=as_of, checkpoint=False)
+        
+        players = {
+            user.id: user
+            for user in User.objects.filter(is_approved=True, is_participating=True)
+        }
+        
         leaderboard = []
-        current_holder = GameEngine.get_current_tag_holder()
+        for score in GameEngine.rank_state(settings, state, as_of, list(players)):
+            leaderboard.append({
+                'rank': score['rank'],
+                'user': players[score['user_id']],
+                'points': score['points'],
+                'tags_given': score['tags_given'],
+                'tags_received': score['tags_received'],
+                'time_held': score['time_held'],
+                'is_current_holder': score['is_current_holder']
+            })
+        
+        return leaderboard
+    
+    @staticmethod
+    def rank_state(settings, state, at, user_ids):
+        """Scores of a replayed state ordered by rank
+
+        Each score dict also gets ``user_id``, ``rank`` and
+        ``is_current_holder``; the holder's time held runs up to ``at``.
+        """
+        holder_id = state.holder_id or settings.current_tag_holder_id
+        scores = GameEngine.calculate_scores(settings, user_ids, state)
+        
+        ranked = sorted(scores.items(), key=lambda item: (-item[1]['points'], item[0]))
+        for rank, (user_id, score) in enumerate(ranked, start=1):
+            score['user_id'] = user_id
+            score['rank'] = rank
+            score['is_current_holder'] = user_id == holder_id
+            if score['is_current_holder'] and score['last_tagged_at']:
+                score['time_held'] += at - score['last_tagged_at']
+        
+        return [score for _, score in ranked]
+    
+    @staticmethod
+    def calculate_scores(settings, user_ids, state=None):
+        """Derive score totals for the given players from the tag log
+
+        The log is replayed from its latest snapshot, so the cost depends on
+        the tags since then rather than on the length of the game. Pass a
+        replayed ``state`` to score an earlier point of the game.
+        """
+        state = state or GameLog(settings).replay()
+        bonuses = GameEngine.calculate_untagged_bonuses(settings, user_ids, state.calendar())
+        
+        scores = {}
+        for user_id in user_ids:
+            totals = state.player(user_id)
+            scores[user_id] = {
+                'points': totals.points + bonuses[user_id],
+                'bonus_points': bonuses[user_id],
+                'tags_given': totals.tags_given,
+                'tags_received': totals.tags_received,
+                'time_held': totals.time_held,
+                'last_tagged_at': totals.last_tagged_at,
+            }
+        
+        return scores
+    
+    @staticmethod
+    def rebuild_scores(settings=None, state=None):
+        """Recompute all materialized PlayerScore rows from the tag log
+
+        Pass the replayed ``state`` of the whole log if it is at hand.
+        """
+        settings = settings or GameSettings.get_settings()
+        
+        user_ids = set(
+            User.objects.filter(is_approved=True, is_participating=True)
+            .values_list('id', flat=True)
+        )
+        user_ids |= set(
+            PlayerScore.objects.filter(game=settings).values_list('user_id', flat=True)
+        )
         
-        for user in users:
-            # Get all tags where user was tagged (they held the tag)
-            tags_received = Tag.objects.filter(tagged=user, verified=True).order_by('tagged_at')
+        scores = GameEngine.calculate_scores(settings, sorted(user_ids), state)
+        PlayerScore.objects.bulk_create(
+            [
+                PlayerScore(game=settings, user_id=user_id, **values)
+                for user_id, values in scores.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['game', 'user'],
+            update_fields=[
+                'points', 'bonus_points', 'tags_given', 'tags_received',
+                'time_held', 'last_tagged_at', 'updated_at'
+            ],
+        )
+        transaction.on_commit(lambda: GameEngine.sync_leaderboard(settings))
+        return len(scores)
+    
+    @staticmethod
+    def rescore_game(settings=None, progress=None, chunk_size=500, since=None):
+        """Replay verified tags under the current scoring rules
+
+        Points, penalties and time held of every tag are recomputed in memory
+        and only changed tags are written, in chunks with bulk_update. User
+        totals move by the changes of the replayed tags, scores are rebuilt
+        afterwards. New tags wait on the holder lock until the rescore is
+        done. ``progress`` is called with (tags done, total) after every chunk.
+        
+        With ``since`` only tags from that time on are replayed, starting
+        from the state of the game just before it, and achievements are left
+        to the caller; a full rescore recalculates them. Returns the number
+        of changed tags.
+        """
+        settings = settings or GameSettings.get_settings()
+        GameEngine.get_holder_state(settings)
+        fields = ['points_awarded', 'time_penalty', 'time_held']
+        
+        with transaction.atomic():
+            HolderState.objects.select_for_update().get(game=settings)
             
-            total_points = 0
-            total_time_held = timedelta()
+            tags = Tag.objects.filter(game=settings, verified=True).order_by('tagged_at', 'id').only(
+                'id', 'tagger_id', 'tagged_id', 'tagged_at', *fields
+            )
+            state = None
+            if since:
+                state = GameLog(settings).replay(until=since - timedelta(microseconds=1))
+                tags = tags.filter(tagged_at__gte=since)
+            total = tags.count()
+            replay = ScoringReplay(
+                settings,
+                User.objects.filter(is_approved=True, is_participating=True).values_list('id', flat=True),
+                state
+            )
             
-            # Calculate points from tagging others
-            tags_given = Tag.objects.filter(tagger=user, verified=True)
-            for tag in tags_given:
-                total_points += tag.points_awarded
+            done = changed = 0
+            first_changed_at = None
+            pending = []
+            totals = {}
+            for tag in tags.iterator(chunk_size=chunk_size):
+                stored = [getattr(tag, field) for field in fields]
+                replay.score(tag)
+                if [getattr(tag, field) for field in fields] != stored:
+                    pending.append(tag)
+                    first_changed_at = first_changed_at or tag.tagged_at
+                    GameEngine.count_tag(totals, tag, 1)
+                    GameEngine.count_tag(totals, Tag(
+                        tagger_id=tag.tagger_id, tagged_id=tag.tagged_id, **dict(zip(fields, stored))
+                    ), -1)
+                
+                done += 1
+                if len(pending) >= chunk_size or done % chunk_size == 0:
+                    Tag.objects.bulk_update(pending, fields)
+                    changed += len(pending)
+                    pending = []
+                    if progress:
+                        progress(done, total)
             
-            # Calculate penalties from being caught
-            for tag in tags_received:
-                total_points -= tag.time_penalty
+            Tag.objects.bulk_update(pending, fields)
+            changed += len(pending)
+            if progress:
+                progress(done, total)
             
-            # Add bonus for untagged days
-            total_points += GameEngine.calculate_untagged_bonus(user, settings)
+            if first_changed_at:
+                GameLog(settings).invalidate(first_changed_at)
+            GameEngine.add_user_totals(totals)
+            GameEngine.follow_tag_log(settings, replay.state, since)
+            GameEngine.rebuild_scores(settings, replay.state)
+            if since is None:
+                GameEngine.calculate_achievements(settings)
+        
+        return changed
+    
+    @staticmethod
+    def follow_tag_log(settings, state, changed_at=None):
+        """Hand the tag to the last tagged player of the log after history changed
+
+        The holder is kept when it was set after the last remaining tag by
+        something other than a changed tag, i.e. by an admin. Without any tag
+        left the configured holder of the game gets the tag back.
+        """
+        holder = HolderState.objects.select_for_update().get(game=settings)
+        if state.last_tagged_at is None:
+            # No tag left, the configured holder has it again unless an admin handed it on
+            if changed_at and holder.since == changed_at and holder.holder_id != settings.current_tag_holder_id:
+                GameEngine.set_holder(settings, settings.current_tag_holder, settings.tag_holder_since)
+            return
+        if holder.holder_id == state.holder_id:
+            return
+        if holder.since and holder.since > state.last_tagged_at and holder.since != changed_at:
+            return
+        GameEngine.set_holder(settings, User.objects.get(id=state.holder_id), state.last_tagged_at)
+    
+    @staticmethod
+    def change_tag(tag, delete=False, verified=True):
+        """Delete a tag or change its verification, then rescore the game after it
+
+        Only the tags from the changed one on are replayed, in the same
+        transaction as the change. User totals move by the tag and the
+        replayed tags, and only the catch records the tag can affect are
+        searched again.
+        """
+        settings = GameSettings.get_game(tag.game_id)
+        with transaction.atomic():
+            engine = AchievementEngine(settings)
+            following = (
+                Tag.objects.filter(game=settings, verified=True, tagged_at__gt=tag.tagged_at)
+                .order_by('tagged_at').first()
+            )
+            # Gaps of the catches before the change, the tag's own and the next one
+            gaps = [engine.gap(catch) for catch in (tag, following) if catch and catch.verified]
             
-            # Calculate total time held
-            for i, tag in enumerate(tags_received):
-                if i < len(tags_received) - 1:
-                    next_tag = tags_received[i + 1]
-                    time_diff = next_tag.tagged_at - tag.tagged_at
-                else:
-                    # If this is the last tag and user is current holder
-                    if user == current_holder:
-                        time_diff = timezone.now() - tag.tagged_at
-                    else:
-                        time_diff = timedelta()
-                
-                total_time_held += time_diff
+            totals = {}
+            if tag.verified:
+                GameEngine.count_tag(totals, tag, -1)
+            if delete:
+                tag.delete()
+            else:
+                tag.verified = verified
+                tag.save()
+                if verified:
+                    GameEngine.count_tag(totals, tag, 1)
+            GameEngine.add_user_totals(totals)
             
-            leaderboard.append({
-                'user': user,
-                'points': total_points,
-                'tags_given': tags_given.count(),
-                'tags_received': tags_received.count(),
-                'time_held': total_time_held,
-                'is_current_holder': user == current_holder
-            })
-        
-        # Sort by points (descending)
-        leaderboard.sort(key=lambda x: x['points'], reverse=True)
+            changed = GameEngine.rescore_game(settings, since=tag.tagged_at)
+            
+            engine.update_players(GameEngine.calculate_leaderboard(settings))
+            engine.update_changed_catches(
+                [catch for catch in (tag, following) if catch and catch.pk and catch.verified],
+                [gap.total_seconds() for gap in gaps if gap is not None]
+            )
+            awarded = engine.awarded
+            transaction.on_commit(lambda: GameEngine.push_achievements(awarded))
+            return changed
+    
+    @staticmethod
+    def count_tag(totals, tag, sign):
+        """Add what a tag counts for to the User totals deltas in ``totals``, or take it away
+
+        ``totals`` maps user ids to {field: delta} dicts, see add_user_totals.
+        """
+        tagger = totals.setdefault(tag.tagger_id, {})
+        tagger['total_points'] = tagger.get('total_points', 0) + sign * tag.points_awarded
+        tagger['total_tags_given'] = tagger.get('total_tags_given', 0) + sign
+        tagged = totals.setdefault(tag.tagged_id, {})
+        tagged['total_points'] = tagged.get('total_points', 0) - sign * tag.time_penalty
+        tagged['total_tags_received'] = tagged.get('total_tags_received', 0) + sign
+        tagged['total_time_held'] = tagged.get('total_time_held', timedelta()) + sign * tag.time_held
+    
+    @staticmethod
+    def add_user_totals(totals):
+        """Apply {field: delta} dicts keyed by user id to the denormalized User totals"""
+        for user_id, deltas in totals.items():
+            deltas = {field: F(field) + delta for field, delta in deltas.items() if delta}
+            if deltas:
+                User.objects.filter(id=user_id).update(**deltas)
+    
+    @staticmethod
+    def get_redis_leaderboard(settings):
+        """Redis leaderboard of the game, rebuilt from PlayerScore on a cold start"""
+        board = RedisLeaderboard(settings)
+        if not board.exists():
+            board.rebuild(dict(
+                PlayerScore.objects
+                .filter(game=settings, user__is_approved=True, user__is_participating=True)
+                .values_list('user_id', 'points')
+            ))
+        return board
+    
+    @staticmethod
+    def sync_leaderboard(settings, user_ids=None):
+        """Copy materialized points of some (or all) players to Redis"""
+        try:
+            board = RedisLeaderboard(settings)
+            if user_ids is None:
+                board.clear()
+                GameEngine.get_redis_leaderboard(settings)
+                return
+            
+            points = dict(
+                PlayerScore.objects
+                .filter(
+                    game=settings, user_id__in=user_ids,
+                    user__is_approved=True, user__is_participating=True
+                )
+                .values_list('user_id', 'points')
+            )
+            board.update(points)
+            board.remove([user_id for user_id in user_ids if user_id not in points])
+        except RedisError:
+            # Force a rebuild on next use rather than serve stale ranks
+            try:
+                board.clear()
+            except RedisError:
+                pass
+    
+    @staticmethod
+    def sync_player(user):
+        """Add or drop a player after their approval or participation changed
+
+        A player joining a game gets their score row here, so reading the
+        leaderboard never has to rebuild the scores.
+        """
+        playing = user.is_approved and user.is_participating
+        for settings in GameSettings.objects.filter(game_end_date__gte=timezone.now()):
+            if playing and not PlayerScore.objects.filter(game=settings, user=user).exists():
+                PlayerScore.objects.get_or_create(
+                    game=settings, user=user,
+                    defaults=GameEngine.calculate_scores(settings, [user.id])[user.id]
+                )
+            GameEngine.sync_leaderboard(settings, [user.id])
+    
+    @staticmethod
+    def leaderboard_around(user, radius=2, settings=None):
+        """Leaderboard entries within ``radius`` ranks of a player"""
+        settings = settings or GameSettings.get_settings()
+        try:
+            window = GameEngine.get_redis_leaderboard(settings).around(user.id, radius)
+        except RedisError:
+            leaderboard = GameEngine.calculate_leaderboard(settings)
+            rank = next(
+                (entry['rank'] for entry in leaderboard if entry['user'] == user),
+                None
+            )
+            if rank is None:
+                return []
+            return leaderboard[max(rank - 1 - radius, 0):rank + radius]
         
-        # Add rank
-        for i, entry in enumerate(leaderboard, start=1):
-            entry['rank'] = i
+        holder_id = GameEngine.get_current_holder_info(settings)['user_id']
+        now = timezone.now()
+        scores = {
+            score.user_id: score
+            for score in PlayerScore.objects.filter(
+                game=settings, user_id__in=[user_id for _, user_id, _ in window]
+            ).select_related('user')
+        }
         
-        return leaderboard
+        entries = []
+        for rank, user_id, points in window:
+            score = scores[user_id]
+            is_current_holder = score.user_id == holder_id
+            time_held = score.time_held
+            if is_current_holder and score.last_tagged_at:
+                time_held += now - score.last_tagged_at
+            
+            entries.append({
+                'rank': rank,
+                'user': score.user,
+                'points': score.points,
+                'tags_given': score.tags_given,
+                'tags_received': score.tags_received,
+                'time_held': time_held,
+                'is_current_holder': is_current_holder
+            })
+        return entries
+    
+    @staticmethod
+    def calculate_untagged_bonuses(settings, user_ids, calendar=None):
+        """Calculate untagged-day bonus points for many players at once
+
+        The game's day calendar is loaded once and shared by all players.
+        Returns a dict of user id -> bonus points.
+        """
+        calendar = calendar or TagCalendar.load(settings)
+        return calendar.bonuses(user_ids, settings.bonus_untagged_day)
     
     @staticmethod
     def calculate_untagged_bonus(user, settings):
         """Calculate bonus points for days user was not tagged"""
-        # Get all unique dates with tags
-        all_tag_dates = set(
-            Tag.objects.filter(verified=True)
-            .values_list('tagged_at__date', flat=True)
+        return GameEngine.calculate_untagged_bonuses(settings, [user.id])[user.id]
+    
+    @staticmethod
+    def apply_untagged_bonus_delta(settings, tagged, date):
+        """Adjust materialized bonuses for a catch of ``tagged`` on ``date``
+
+        Must run before the new tag is stored. Only days within one day of
+        ``date`` can change their bonus status, so comparing a five day window
+        of the tag calendar with and without the catch gives the change for
+        every player.
+        Returns the ids of players whose points changed.
+        """
+        one_day = timedelta(days=1)
+        window = set(
+            Tag.objects.filter(
+                game=settings,
+                verified=True,
+                tagged_at__date__range=(date - 2 * one_day, date + 2 * one_day)
+            )
+            .order_by()
+            .values_list('tagged_id', 'tagged_at__date')
             .distinct()
         )
+        before = TagCalendar(window)
+        after = TagCalendar(window | {(tagged.id, date)})
         
-        # Get dates user was tagged
-        user_tagged_dates = set(
-            Tag.objects.filter(tagged=user, verified=True)
-            .values_list('tagged_at__date', flat=True)
-        )
+        deltas = {}
+        for user_id in after.player_days:
+            delta = after.isolated_days(user_id) - before.isolated_days(user_id)
+            deltas.setdefault(delta, []).append(user_id)
+        new_day = after.game_days.bit_count() - before.game_days.bit_count()
         
-        bonus_points = 0
+        bonus = settings.bonus_untagged_day
+        changed = set()
         
-        for date in all_tag_dates:
-            if date not in user_tagged_dates:
-                # Check previous and next day
-                prev_day = date - timedelta(days=1)
-                next_day = date + timedelta(days=1)
-                
-                if prev_day not in user_tagged_dates and next_day not in user_tagged_dates:
-                    bonus_points += settings.bonus_untagged_day
+        if new_day:
+            # Players without catches in the window simply gain the new day
+            gainers = set(
+                PlayerScore.objects.filter(game=settings)
+                .exclude(user_id__in=after.player_days)
+                .values_list('user_id', flat=True)
+            )
+            deltas.setdefault(new_day, []).extend(gainers)
+        
+        for delta, user_ids in deltas.items():
+            if delta and user_ids:
+                PlayerScore.objects.filter(game=settings, user_id__in=user_ids).update(
+                    points=F('points') + delta * bonus,
+                    bonus_points=F('bonus_points') + delta * bonus
+                )
+                changed.update(user_ids)
         
-        return bonus_points
+        return changed
+    
+    @staticmethod
+    def check_holder(holder, tagger, tagged, expected_version=None):
+        """Raise HolderConflict unless tagger holds the tag at the expected version"""
+        if holder['user_id'] and holder['user_id'] != tagger.id:
+            raise HolderConflict(
+                holder, f"Cannot tag {tagged.username}, current holder is {holder['user']['username']}"
+            )
+        if expected_version is not None and expected_version != holder['version']:
+            raise HolderConflict(holder, "The tag has changed hands, reload and try again")
     
     @staticmethod
-    def process_new_tag(tagger, tagged, location=None, notes=None, photo=None):
-        """Process a new tag event and calculate points/penalties"""
-        settings = GameSettings.get_settings()
+    def process_new_tag(tagger, tagged, location=None, notes=None, photo=None, expected_version=None,
+                        settings=None):
+        """Process a new tag event and calculate points/penalties
+
+        Pass the holder version the client saw as ``expected_version`` to
+        reject the tag if anyone has tagged since. The tag goes to the game
+        ``settings``, the current game by default.
+        """
+        settings = settings or GameSettings.get_settings()
         
         # Verify game is active
         if not settings.is_game_active:
@@ -128,170 +661,158 @@ class GameEngine:
         if not tagged.is_participating:
             raise ValueError(f"User {tagged.username} is not participating in the game")
         
-        # Verify tagged player is the current holder
-        current_holder = GameEngine.get_current_tag_holder()
-        if current_holder and current_holder != tagged:
-            raise ValueError(f"Cannot tag {tagged.username}, current holder is {current_holder.username}")
-        
-        # Get previous tag to calculate time held
-        previous_tag = Tag.objects.filter(tagged=tagged, verified=True).order_by('-tagged_at').first()
-        
-        if previous_tag:
-            time_held = timezone.now() - previous_tag.tagged_at
-        else:
-            # First tag of the game or this player's first time holding
-            time_held = timedelta()
-        
-        # Calculate penalty for time held
-        hours_held = time_held.total_seconds() / 3600
-        time_penalty = int(hours_held) * settings.time_penalty_per_hour
-        
-        # Get current leaderboard to determine tagged player's rank
-        leaderboard = GameEngine.calculate_leaderboard()
-        tagged_rank = next(
-            (entry['rank'] for entry in leaderboard if entry['user'] == tagged),
-            len(leaderboard)
-        )
-        
-        # Award points based on rank
-        points_list = settings.tag_points_list
-        if tagged_rank <= len(points_list):
-            points_awarded = points_list[tagged_rank - 1]
-        else:
-            points_awarded = points_list[-1]
-        
-        # Create the tag record
-        tag = Tag.objects.create(
-            tagger=tagger,
-            tagged=tagged,
-            tagged_at=timezone.now(),
-            location=location,
-            notes=notes,
-            photo=photo,
-            points_awarded=points_awarded,
-            time_penalty=time_penalty,
-            time_held=time_held,
-            verified=True
+        # Verify tagger is the current holder, cheaply before taking any lock
+        GameEngine.check_holder(
+            GameEngine.get_holder_info_for(settings, tagger, expected_version), tagger, tagged, expected_version
         )
+        GameEngine.get_holder_state(settings)
         
-        # Update user statistics
-        tagger.total_tags_given = F('total_tags_given') + 1
-        tagger.total_points = F('total_points') + points_awarded
-        tagger.save()
-        tagger.refresh_from_db()
-        
-        tagged.total_tags_received = F('total_tags_received') + 1
-        tagged.total_points = F('total_points') - time_penalty
-        tagged.total_time_held = F('total_time_held') + time_held
-        tagged.save()
-        tagged.refresh_from_db()
-
-        # Recalculate achievements after each verified tag to keep them up-to-date
-        GameEngine.calculate_achievements()
+        with transaction.atomic():
+            # Hand the tag over; the row lock serializes concurrent tags and
+            # the losers fail here before any scoring work
+            state = HolderState.objects.select_for_update().select_related('holder').get(game=settings)
+            GameEngine.check_holder(GameEngine.holder_info(state), tagger, tagged, expected_version)
+            
+            now = timezone.now()
+            
+            if PlayerScore.objects.filter(game=settings, user__in=[tagger, tagged]).count() < 2:
+                GameEngine.rebuild_scores(settings)
+            
+            # Lock both score rows so concurrent tags apply one after another
+            scores = {
+                score.user_id: score
+                for score in PlayerScore.objects.select_for_update().filter(
+                    game=settings, user__in=[tagger, tagged]
+                )
+            }
+            
+            # Determine tagged player's rank from the committed scores, Redis
+            # may not have caught up with the previous tag yet
+            tagged_points = scores[tagged.id].points
+            tagged_rank = PlayerScore.objects.filter(
+                game=settings, user__is_approved=True, user__is_participating=True
+            ).filter(
+                Q(points__gt=tagged_points) | Q(points=tagged_points, user_id__lt=tagged.id)
+            ).count() + 1
+            
+            # Award points based on rank
+            points_list = settings.tag_points_list
+            if tagged_rank <= len(points_list):
+                points_awarded = points_list[tagged_rank - 1]
+            else:
+                points_awarded = points_list[-1]
+            
+            # Get previous tag to calculate time held
+            previous_tag = (
+                Tag.objects.filter(game=settings, tagged=tagged, verified=True)
+                .order_by('-tagged_at').first()
+            )
+            
+            if previous_tag:
+                time_held = now - previous_tag.tagged_at
+            else:
+                # First tag of the game or this player's first time holding
+                time_held = timedelta()
+            
+            # Calculate penalty for time held
+            hours_held = time_held.total_seconds() / 3600
+            time_penalty = int(hours_held) * settings.time_penalty_per_hour
+            
+            changed = GameEngine.apply_untagged_bonus_delta(settings, tagged, timezone.localdate(now))
+            
+            # Create the tag record
+            tag = Tag.objects.create(
+                game=settings,
+                tagger=tagger,
+                tagged=tagged,
+                tagged_at=now,
+                location=location,
+                notes=notes,
+                photo=photo,
+                points_awarded=points_awarded,
+                time_penalty=time_penalty,
+                time_held=time_held,
+                verified=True
+            )
+            
+            # Update user statistics
+            tagger.total_tags_given = F('total_tags_given') + 1
+            tagger.total_points = F('total_points') + points_awarded
+            tagger.save()
+            tagger.refresh_from_db()
+            
+            tagged.total_tags_received = F('total_tags_received') + 1
+            tagged.total_points = F('total_points') - time_penalty
+            tagged.total_time_held = F('total_time_held') + time_held
+            tagged.save()
+            tagged.refresh_from_db()
+            
+            # Update materialized scores
+            PlayerScore.objects.filter(pk=scores[tagger.id].pk).update(
+                points=F('points') + points_awarded,
+                tags_given=F('tags_given') + 1
+            )
+            PlayerScore.objects.filter(pk=scores[tagged.id].pk).update(
+                points=F('points') - time_penalty,
+                tags_received=F('tags_received') + 1,
+                time_held=F('time_held') + time_held,
+                last_tagged_at=now
+            )
+            
+            changed |= {tagger.id, tagged.id}
+            transaction.on_commit(lambda: GameEngine.sync_leaderboard(settings, changed))
+            
+            state.holder = tagged
+            state.since = now
+            state.version += 1
+            state.save()
+            
+            info = GameEngine.holder_info(state)
+            transaction.on_commit(lambda: GameEngine.cache_holder_info(settings, info))
         
         return tag
     
     @staticmethod
-    def calculate_achievements():
-        """Calculate and award achievements to players"""
-        Achievement.objects.all().delete()  # Clear old achievements
-        
-        leaderboard = GameEngine.calculate_leaderboard()
-        
-        if not leaderboard:
-            return
-        
-        # Worst Player (lowest points)
-        worst = min(leaderboard, key=lambda x: x['points'])
-        Achievement.objects.create(
-            user=worst['user'],
-            achievement_type='worst_player',
-            title='Worst Player',
-            description='Player with the lowest points',
-            value=f"{worst['points']} points",
-            icon='💩'
-        )
-        
-        # Fastest Player (least time held)
-        fastest = min(leaderboard, key=lambda x: x['time_held'].total_seconds())
-        Achievement.objects.create(
-            user=fastest['user'],
-            achievement_type='fastest_player',
-            title='Fastest Player',
-            description='Player with the least time holding the tag',
-            value=str(fastest['time_held']),
-            icon='⚡'
-        )
-        
-        # Slowest Player (most time held)
-        slowest = max(leaderboard, key=lambda x: x['time_held'].total_seconds())
-        Achievement.objects.create(
-            user=slowest['user'],
-            achievement_type='slowest_player',
-            title='Slowest Player',
-            description='Player with the most time holding the tag',
-            value=str(slowest['time_held']),
-            icon='🐌'
-        )
-        
-        # Most Active Tagger
-        most_tags = max(leaderboard, key=lambda x: x['tags_given'])
-        Achievement.objects.create(
-            user=most_tags['user'],
-            achievement_type='most_tags_given',
-            title='Most Active Tagger',
-            description='Player who tagged others the most',
-            value=f"{most_tags['tags_given']} tags",
-            icon='🏹'
-        )
-        
-        # Most Caught
-        most_caught = max(leaderboard, key=lambda x: x['tags_received'])
-        Achievement.objects.create(
-            user=most_caught['user'],
-            achievement_type='most_tags_received',
-            title='Most Caught',
-            description='Player who was tagged the most',
-            value=f"{most_caught['tags_received']} times",
-            icon='🎯'
-        )
+    def update_derived_state(tag_ids, settings=None):
+        """Update achievements affected by new tags, returns the leaderboard
+
+        Runs in the background after a burst of tags, see game.tasks.
+        """
+        settings = settings or GameSettings.get_settings()
+        leaderboard = GameEngine.calculate_leaderboard(settings)
         
-        # Fastest/Slowest catches
-        tags = Tag.objects.filter(verified=True).order_by('tagged_at')
+        engine = AchievementEngine(settings)
+        engine.update_players(leaderboard)
+        for tag in (
+            Tag.objects.filter(game=settings, id__in=tag_ids, verified=True)
+            .select_related('tagger', 'tagged')
+            .order_by('tagged_at')
+        ):
+            engine.update_catch(tag)
         
-        if len(tags) > 1:
-            min_time = None
-            max_time = None
-            fastest_tag = None
-            slowest_tag = None
-            
-            for i in range(len(tags) - 1):
-                time_diff = tags[i + 1].tagged_at - tags[i].tagged_at
-                
-                if min_time is None or time_diff < min_time:
-                    min_time = time_diff
-                    fastest_tag = tags[i + 1]
-                
-                if max_time is None or time_diff > max_time:
-                    max_time = time_diff
-                    slowest_tag = tags[i + 1]
-            
-            if fastest_tag:
-                Achievement.objects.create(
-                    user=fastest_tag.tagger,
-                    achievement_type='fastest_catch',
-                    title='Fastest Catch',
-                    description=f'Caught {fastest_tag.tagged.full_name}',
-                    value=str(min_time),
-                    icon='🚀'
-                )
+        awarded = engine.awarded
+        transaction.on_commit(lambda: GameEngine.push_achievements(awarded))
+        return leaderboard
+    
+    @staticmethod
+    def push_achievements(achievements):
+        """Tell the new holders of achievements on their sockets"""
+        for achievement in achievements:
+            broadcast(
+                achievement.user.group_name,
+                {'type': 'achievement', 'data': AchievementSerializer(achievement).data}
+            )
+    
+    @staticmethod
+    def calculate_achievements(settings=None):
+        """Recalculate all automatic achievements of a game from scratch
+
+        Custom achievements created by admins are kept.
+        """
+        settings = settings or GameSettings.get_settings()
+        with transaction.atomic():
+            Achievement.objects.filter(game=settings, achievement_type__in=AUTOMATIC_ACHIEVEMENTS).delete()
             
-            if slowest_tag:
-                Achievement.objects.create(
-                    user=slowest_tag.tagged,
-                    achievement_type='slowest_catch',
-                    title='Slowest Catch',
-                    description=f'Held the tag for the longest time before being caught',
-                    value=str(max_time),
-                    icon='⏰'
-                )
+            engine = AchievementEngine(settings)
+            engine.update_players(GameEngine.calculate_leaderboard(settings))
+            engine.rebuild_catches()
@@ -0,0 +1,27 @@
+import json
+from .leaderboard import get_redis
+
+
+class HolderCache:
+    """Redis copy of the current holder for cheap polling and tag checks
+
+    The value holds the holder id, the serialized holder and the handoff
+    time. It is rewritten after every handoff and expires after ``TTL``
+    seconds, which bounds how stale the embedded profile can get.
+    """
+    
+    TTL = 60
+    
+    def __init__(self, game, client=None):
+        self.key = f'game:{game.pk}:holder'
+        self.client = client or get_redis()
+    
+    def get(self):
+        value = self.client.get(self.key)
+        return None if value is None else json.loads(value)
+    
+    def set(self, info, only_if_missing=False):
+        self.client.set(self.key, json.dumps(info), ex=self.TTL, nx=only_if_missing)
+    
+    def clear(self):
+        self.client.delete(self.key)
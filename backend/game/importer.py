@@ -0,0 +1,150 @@
+import csv
+import json
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import GameSettings, HolderState, Tag
+from .events import GameLog
+from .scoring import ScoringReplay
+from .game_engine import GameEngine
+
+User = get_user_model()
+
+
+class TagImport:
+    """Loads a stream of past tags in bulk
+
+    Rows name the tagger and tagged player by username and carry an ISO 8601
+    ``tagged_at``, optionally ``location`` and ``notes``. They are checked as
+    a chain of handoffs after the existing log, scored with an in-memory
+    replay and written with bulk_create, followed by one rebuild of scores
+    and achievements.
+    """
+
+    REQUIRED_FIELDS = ('tagger', 'tagged', 'tagged_at')
+    BATCH_SIZE = 1000
+
+    def __init__(self, settings=None):
+        self.settings = settings or GameSettings.get_settings()
+
+    @staticmethod
+    def read(file, format=None):
+        """Rows of a CSV or JSON file as dicts"""
+        if format is None:
+            format = 'json' if file.name.endswith('.json') else 'csv'
+        if format == 'json':
+            return json.load(file)
+        return list(csv.DictReader(file))
+
+    def validate(self, rows, state):
+        """Unsaved tags for the rows, raises ValueError on the first bad row"""
+        usernames = {row.get(field) for row in rows for field in ('tagger', 'tagged')}
+        users = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+
+        tags = []
+        holder_id = state.holder_id
+        last_tagged_at = state.last_tagged_at
+        for number, row in enumerate(rows, start=1):
+            missing = [field for field in self.REQUIRED_FIELDS if not row.get(field)]
+            if missing:
+                raise ValueError(f"Row {number}: missing {', '.join(missing)}")
+
+            for field in ('tagger', 'tagged'):
+                if row[field] not in users:
+                    raise ValueError(f"Row {number}: unknown player {row[field]}")
+            tagger_id, tagged_id = users[row['tagger']], users[row['tagged']]
+            if tagger_id == tagged_id:
+                raise ValueError(f"Row {number}: {row['tagger']} cannot tag themselves")
+            if holder_id and tagger_id != holder_id:
+                raise ValueError(f"Row {number}: {row['tagger']} does not hold the tag")
+
+            try:
+                tagged_at = parse_datetime(row['tagged_at'])
+            except ValueError:
+                tagged_at = None
+            if tagged_at is None:
+                raise ValueError(f"Row {number}: invalid tagged_at {row['tagged_at']}")
+            if timezone.is_naive(tagged_at):
+                tagged_at = timezone.make_aware(tagged_at)
+            if last_tagged_at and tagged_at <= last_tagged_at:
+                raise ValueError(f"Row {number}: tags must be in order and after {last_tagged_at.isoformat()}")
+
+            tags.append(Tag(
+                game=self.settings,
+                tagger_id=tagger_id,
+                tagged_id=tagged_id,
+                tagged_at=tagged_at,
+                location=row.get('location') or None,
+                notes=row.get('notes') or None,
+                verified=True,
+            ))
+            holder_id = tagged_id
+            last_tagged_at = tagged_at
+
+        return tags
+
+    def run(self, rows, dry_run=False):
+        """Import the rows, returns the scored tags"""
+        GameEngine.get_holder_state(self.settings)
+
+        with transaction.atomic():
+            # Keep live tags out while the log is extended
+            HolderState.objects.select_for_update().get(game=self.settings)
+
+            state = GameLog(self.settings).replay()
+            tags = self.validate(rows, state)
+            if not tags:
+                return tags
+
+            user_ids = set(
+                User.objects.filter(is_approved=True, is_participating=True)
+                .values_list('id', flat=True)
+            )
+            user_ids |= {tag.tagger_id for tag in tags} | {tag.tagged_id for tag in tags}
+            replay = ScoringReplay(self.settings, user_ids, state)
+            for tag in tags:
+                replay.score(tag)
+
+            if dry_run:
+                return tags
+
+            Tag.objects.bulk_create(tags, batch_size=self.BATCH_SIZE)
+            GameLog(self.settings).invalidate(tags[0].tagged_at)
+            self.update_user_totals(tags)
+
+            last = tags[-1]
+            GameEngine.set_holder(self.settings, User.objects.get(id=last.tagged_id), last.tagged_at)
+            GameEngine.rebuild_scores(self.settings)
+            GameEngine.calculate_achievements(self.settings)
+
+        return tags
+
+    def update_user_totals(self, tags):
+        """Add the imported tags to the denormalized User totals"""
+        totals = {}
+        for tag in tags:
+            tagger = totals.setdefault(tag.tagger_id, [0, 0, 0, timedelta()])
+            tagger[0] += tag.points_awarded
+            tagger[1] += 1
+            tagged = totals.setdefault(tag.tagged_id, [0, 0, 0, timedelta()])
+            tagged[0] -= tag.time_penalty
+            tagged[2] += 1
+            tagged[3] += tag.time_held
+
+        users = []
+        for user_id, (points, given, received, time_held) in totals.items():
+            user = User(id=user_id)
+            user.total_points = F('total_points') + points
+            user.total_tags_given = F('total_tags_given') + given
+            user.total_tags_received = F('total_tags_received') + received
+            user.total_time_held = F('total_time_held') + time_held
+            users.append(user)
+
+        User.objects.bulk_update(
+            users,
+            ['total_points', 'total_tags_given', 'total_tags_received', 'total_time_held'],
+            batch_size=self.BATCH_SIZE,
+        )
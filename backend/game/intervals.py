@@ -0,0 +1,116 @@
+from django.db import connection
+from django.db.models import F, Window, ExpressionWrapper, DurationField, Min, Max
+from django.db.models.functions import Lag
+from datetime import timedelta
+from .models import Tag
+
+
+class CatchIntervals:
+    """Catch interval analytics computed by the database
+
+    Intervals come from ``LAG`` window functions, so tags are never loaded
+    into Python. Databases without window support (old SQLite builds) fall
+    back to a single streamed pass over (id, tagged_at) pairs.
+    """
+    
+    @staticmethod
+    def gaps(game):
+        """Verified tags annotated with the time since the previous catch of the game"""
+        return Tag.objects.filter(game=game, verified=True).annotate(
+            gap=ExpressionWrapper(
+                F('tagged_at') - Window(Lag('tagged_at'), order_by=F('tagged_at').asc()),
+                output_field=DurationField()
+            )
+        )
+    
+    @staticmethod
+    def hold_intervals(game=None):
+        """Verified tags annotated with the time since the tagged player's previous catch
+
+        This is the interval stored as Tag.time_held when the tag is created.
+        Without a game the tags of every game are covered.
+        """
+        tags = Tag.objects.filter(verified=True)
+        if game is not None:
+            tags = tags.filter(game=game)
+        return tags.annotate(
+            held=ExpressionWrapper(
+                F('tagged_at') - Window(
+                    Lag('tagged_at'),
+                    partition_by=[F('game'), F('tagged')],
+                    order_by=F('tagged_at').asc()
+                ),
+                output_field=DurationField()
+            )
+        )
+    
+    @staticmethod
+    def catch_records(game):
+        """Fastest and slowest catch of a game as (tag id, gap) pairs, or None
+
+        Ties go to the earlier catch.
+        """
+        if not connection.features.supports_over_clause:
+            return CatchIntervals._scan_catch_records(game)
+        
+        gaps = CatchIntervals.gaps(game).filter(gap__isnull=False).values_list('id', 'gap')
+        return (
+            gaps.order_by('gap', 'tagged_at').first(),
+            gaps.order_by('-gap', 'tagged_at').first(),
+        )
+    
+    @staticmethod
+    def _scan_catch_records(game):
+        fastest = slowest = None
+        previous = None
+        
+        for tag_id, tagged_at in (
+            Tag.objects.filter(game=game, verified=True)
+            .order_by('tagged_at')
+            .values_list('id', 'tagged_at')
+            .iterator()
+        ):
+            if previous is not None:
+                gap = tagged_at - previous
+                if fastest is None or gap < fastest[1]:
+                    fastest = (tag_id, gap)
+                if slowest is None or gap > slowest[1]:
+                    slowest = (tag_id, gap)
+            previous = tagged_at
+        
+        return fastest, slowest
+    
+    @staticmethod
+    def held_by_player(game=None, user_ids=None):
+        """Dict of user id -> sum of hold intervals up to their last catch
+
+        Without a game the sums span every game. Players without catches
+        are left out.
+        """
+        if connection.vendor == 'postgresql':
+            intervals = CatchIntervals.hold_intervals(game)
+            if user_ids is not None:
+                # Partitions are per player, so this keeps their intervals intact
+                intervals = intervals.filter(tagged_id__in=user_ids)
+            sql, params = intervals.order_by().values('tagged_id', 'held').query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT tagged_id, COALESCE(SUM(held), INTERVAL '0')
+                    FROM ({sql}) intervals
+                    GROUP BY tagged_id
+                """, params)
+                return dict(cursor.fetchall())
+        
+        # The intervals of a player telescope to last catch minus first catch
+        tags = Tag.objects.filter(verified=True)
+        if game is not None:
+            tags = tags.filter(game=game)
+        if user_ids is not None:
+            tags = tags.filter(tagged_id__in=user_ids)
+        held = {}
+        for row in (
+            tags.order_by().values('game', 'tagged')
+            .annotate(first=Min('tagged_at'), last=Max('tagged_at'))
+        ):
+            held[row['tagged']] = held.get(row['tagged'], timedelta()) + row['last'] - row['first']
+        return held
@@ -0,0 +1,94 @@
+import redis
+from django.conf import settings
+from datetime import timedelta
+
+_client = None
+
+
+def get_redis():
+    """Shared Redis client for application data"""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_connect_timeout=1,
+            socket_timeout=1
+        )
+    return _client
+
+
+class RedisLeaderboard:
+    """Sorted-set mirror of PlayerScore.points for O(log n) rank windows
+
+    It serves the leaderboard around a player. Tags rank the tagged player
+    from the locked score rows instead, since the set is only updated after
+    the previous tag commits.
+
+    Members are user ids. The score packs points and the user id together so
+    that ties are broken by user id, exactly like the database ordering. The
+    key carries the settings version, so changing the scoring rules starts a
+    fresh set that is rebuilt from the database on first use.
+    """
+    
+    SCALE = 2 ** 24
+    TTL = timedelta(days=7)
+    
+    def __init__(self, game, client=None):
+        version = int(game.updated_at.timestamp() * 1_000_000)
+        self.key = f'game:{game.pk}:leaderboard:{version}'
+        self.client = client or get_redis()
+    
+    @classmethod
+    def encode(cls, user_id, points):
+        return points * cls.SCALE - user_id
+    
+    @classmethod
+    def decode(cls, member, score):
+        user_id = int(member)
+        return user_id, round((score + user_id) / cls.SCALE)
+    
+    def exists(self):
+        return bool(self.client.exists(self.key))
+    
+    def rebuild(self, points):
+        """Replace the whole set from a dict of user id -> points"""
+        pipe = self.client.pipeline()
+        pipe.delete(self.key)
+        if points:
+            pipe.zadd(self.key, {
+                user_id: self.encode(user_id, value) for user_id, value in points.items()
+            })
+        pipe.expire(self.key, self.TTL)
+        pipe.execute()
+    
+    def update(self, points):
+        """Set the points of some players from a dict of user id -> points"""
+        if not points:
+            return
+        pipe = self.client.pipeline()
+        pipe.zadd(self.key, {
+            user_id: self.encode(user_id, value) for user_id, value in points.items()
+        })
+        pipe.expire(self.key, self.TTL)
+        pipe.execute()
+    
+    def remove(self, user_ids):
+        if user_ids:
+            self.client.zrem(self.key, *user_ids)
+    
+    def clear(self):
+        self.client.delete(self.key)
+    
+    def _range(self, start, stop):
+        members = self.client.zrevrange(self.key, start, stop, withscores=True)
+        return [
+            (rank, *self.decode(member, score))
+            for rank, (member, score) in enumerate(members, start=start + 1)
+        ]
+    
+    def around(self, user_id, radius):
+        """List of (rank, user id, points) within ``radius`` ranks of a player"""
+        rank = self.client.zrevrank(self.key, user_id)
+        if rank is None:
+            return []
+        return self._range(max(rank - radius, 0), rank + radius)
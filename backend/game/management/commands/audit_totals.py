@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from game.audit import TotalsAudit
+
+
+class Command(BaseCommand):
+    help = 'Check the denormalized player totals against the tag log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Fix drifted totals')
+        parser.add_argument('--chunk-size', type=int, help='Players checked per query')
+        parser.add_argument('--time-budget', type=float, help='Stop after this many seconds, the next run resumes')
+        parser.add_argument('--restart', action='store_true', help='Start a new pass instead of resuming')
+
+    def handle(self, *args, **options):
+        audit = TotalsAudit(chunk_size=options['chunk_size'], time_budget=options['time_budget'])
+        report = audit.run(repair=options['repair'], restart=options['restart'])
+
+        for player in report['players']:
+            drift = ', '.join(f'{field}={value:+g}' for field, value in player.items() if field != 'user_id')
+            self.stdout.write(f"User {player['user_id']}: {drift}")
+
+        progress = 'Checked' if report['complete'] else 'Pass not finished, checked'
+        self.stdout.write(self.style.SUCCESS(
+            f"{progress} {report['checked']} players, {report['drifted']} drifted, {report['repaired']} repaired"
+        ))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from game.models import GameSettings
+from game.stats import DailyStats
+
+
+class Command(BaseCommand):
+    help = 'Build missing daily PlayerStats rows of the running game'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Rewrite days that already have rows')
+        parser.add_argument('--batch-days', type=int, default=DailyStats.BATCH_DAYS,
+                            help='Days built from one replay')
+        parser.add_argument('--game', type=int, help='Game id, defaults to the current game')
+
+    def handle(self, *args, **options):
+        try:
+            settings = GameSettings.get_game(options['game']) if options['game'] else None
+        except GameSettings.DoesNotExist:
+            raise CommandError(f"Game {options['game']} does not exist")
+
+        days = 0
+        for first, last, rows in DailyStats(settings).backfill(options['rebuild'], options['batch_days']):
+            days += (last - first).days + 1
+            self.stdout.write(f'{first} - {last}: {rows} rows')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully built player stats for {days} days')
+        )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from game.models import GameSettings
+from game.importer import TagImport
+
+
+class Command(BaseCommand):
+    help = 'Import past tags from a CSV or JSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File with tagger, tagged and tagged_at per tag')
+        parser.add_argument('--format', choices=['csv', 'json'], help='Defaults to the file extension')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and score without saving')
+        parser.add_argument('--game', type=int, help='Game id, defaults to the current game')
+
+    def handle(self, *args, **options):
+        try:
+            importer = TagImport(GameSettings.get_game(options['game']) if options['game'] else None)
+            with open(options['path'], newline='') as file:
+                rows = importer.read(file, options['format'])
+            tags = importer.run(rows, dry_run=options['dry_run'])
+        except GameSettings.DoesNotExist:
+            raise CommandError(f"Game {options['game']} does not exist")
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{len(tags)} tags are valid'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Successfully imported {len(tags)} tags'))
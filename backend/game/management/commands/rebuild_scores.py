@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from game.models import GameSettings
+from game.game_engine import GameEngine
+
+
+class Command(BaseCommand):
+    help = 'Recompute materialized player scores from the tag log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--game', type=int, help='Game id, defaults to the current game')
+
+    def handle(self, *args, **options):
+        try:
+            settings = GameSettings.get_game(options['game']) if options['game'] else None
+        except GameSettings.DoesNotExist:
+            raise CommandError(f"Game {options['game']} does not exist")
+
+        count = GameEngine.rebuild_scores(settings)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully rebuilt scores for {count} players')
+        )
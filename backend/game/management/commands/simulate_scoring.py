@@ -0,0 +1,51 @@
+import json
+import os
+from django.core.management.base import BaseCommand, CommandError
+from game.models import GameSettings
+from game.events import GameState
+from game.importer import TagImport
+from game.simulator import ScoringSimulator
+
+
+class Command(BaseCommand):
+    help = 'Compare final standings under candidate scoring rules without changing any scores'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'candidates',
+            help='JSON list of settings overrides, e.g. [{"time_penalty_per_hour": 2}], or a file holding one'
+        )
+        parser.add_argument('--tags', help='Replay a past game from a CSV or JSON tag file instead of this game')
+        parser.add_argument('--top', type=int, default=10, help='Players shown per candidate')
+        parser.add_argument('--game', type=int, help='Game id, defaults to the current game')
+
+    def handle(self, *args, **options):
+        try:
+            settings = GameSettings.get_game(options['game']) if options['game'] else GameSettings.get_settings()
+        except GameSettings.DoesNotExist:
+            raise CommandError(f"Game {options['game']} does not exist")
+
+        try:
+            if os.path.isfile(options['candidates']):
+                with open(options['candidates']) as file:
+                    candidates = json.load(file)
+            else:
+                candidates = json.loads(options['candidates'])
+
+            if options['tags']:
+                importer = TagImport(settings)
+                with open(options['tags'], newline='') as file:
+                    tags = importer.validate(importer.read(file), GameState())
+                simulator = ScoringSimulator(tags, [])
+            else:
+                simulator = ScoringSimulator.from_log(settings)
+
+            results = simulator.standings(settings, candidates)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for number, result in enumerate(results, start=1):
+            overrides = ', '.join(f'{field}={value}' for field, value in candidates[number - 1].items())
+            self.stdout.write(self.style.SUCCESS(f'Candidate {number}: {overrides or "current settings"}'))
+            for entry in result['standings'][:options['top']]:
+                self.stdout.write(f"{entry['rank']:>4}  {entry['username']:<20} {entry['points']:>8}")
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:12
+
+import datetime
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.IntegerField(default=0)),
+                ('bonus_points', models.IntegerField(default=0, help_text='Part of points coming from untagged-day bonuses')),
+                ('tags_given', models.IntegerField(default=0)),
+                ('tags_received', models.IntegerField(default=0)),
+                ('time_held', models.DurationField(default=datetime.timedelta, help_text='Time held up to the last catch')),
+                ('last_tagged_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='game.gamesettings')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-points'],
+                'indexes': [models.Index(fields=['game', '-points'], name='game_player_game_id_332b51_idx')],
+                'unique_together': {('game', 'user')},
+            },
+        ),
+    ]
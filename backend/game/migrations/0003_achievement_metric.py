@@ -0,0 +1,35 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def remove_duplicate_achievements(apps, schema_editor):
+    """Keep only the newest row of each automatic achievement type"""
+    Achievement = apps.get_model('game', 'Achievement')
+    seen = set()
+    for achievement in Achievement.objects.exclude(achievement_type='custom').order_by('-awarded_at', '-id'):
+        if achievement.achievement_type in seen:
+            achievement.delete()
+        seen.add(achievement.achievement_type)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0002_playerscore'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='achievement',
+            name='metric',
+            field=models.FloatField(blank=True, help_text='Numeric value used to compare candidates', null=True),
+        ),
+        migrations.RunPython(remove_duplicate_achievements, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='achievement',
+            constraint=models.UniqueConstraint(condition=models.Q(('achievement_type', 'custom'), _negated=True), fields=('achievement_type',), name='unique_automatic_achievement'),
+        ),
+    ]
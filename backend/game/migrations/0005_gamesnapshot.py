@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-18 19:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0004_holderstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_count', models.PositiveIntegerField(help_text='Number of tags folded into the state')),
+                ('last_tag_id', models.BigIntegerField(help_text='Last tag folded into the state')),
+                ('last_tagged_at', models.DateTimeField(help_text='Time of the last tag folded into the state')),
+                ('state', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='game.gamesettings')),
+            ],
+            options={
+                'ordering': ['-last_tagged_at'],
+                'indexes': [models.Index(fields=['game', '-last_tagged_at'], name='game_gamesn_game_id_dc6b30_idx')],
+                'unique_together': {('game', 'event_count')},
+            },
+        ),
+    ]
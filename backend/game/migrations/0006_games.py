@@ -0,0 +1,67 @@
+# Generated by Django 5.0.1 on 2026-10-18 20:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0005_gamesnapshot'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='achievement',
+            name='unique_automatic_achievement',
+        ),
+        migrations.RemoveIndex(
+            model_name='playerstats',
+            name='game_player_date_4fd720_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='playerstats',
+            name='game_player_cumulat_7671ed_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='tag',
+            name='game_tag_tagged__dff9f8_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='tag',
+            name='game_tag_tagger__a1ab32_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='tag',
+            name='game_tag_tagged__74241b_idx',
+        ),
+        migrations.AlterUniqueTogether(
+            name='playerstats',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='achievement',
+            name='game',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='achievements', to='game.gamesettings'),
+        ),
+        migrations.AddField(
+            model_name='gamesettings',
+            name='is_current',
+            field=models.BooleanField(default=False, help_text='Game used when a request names no game'),
+        ),
+        migrations.AddField(
+            model_name='gamesettings',
+            name='name',
+            field=models.CharField(blank=True, help_text='Name of the game or season', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='playerstats',
+            name='game',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='game.gamesettings'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='game',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tags', to='game.gamesettings'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-18 20:15
+
+from datetime import timedelta
+from django.db import migrations
+from django.utils import timezone
+
+
+def assign_current_game(apps, schema_editor):
+    """Make the existing settings row the current game and give it every row"""
+    GameSettings = apps.get_model('game', 'GameSettings')
+    game = GameSettings.objects.order_by('pk').first()
+    models_with_game = [apps.get_model('game', name) for name in ('Tag', 'Achievement', 'PlayerStats')]
+    if game is None:
+        if not any(model.objects.exists() for model in models_with_game):
+            return
+        game = GameSettings.objects.create(
+            game_start_date=timezone.now(),
+            game_end_date=timezone.now() + timedelta(days=30)
+        )
+    GameSettings.objects.filter(pk=game.pk).update(is_current=True)
+    for model in models_with_game:
+        model.objects.filter(game__isnull=True).update(game=game)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0006_games'),
+    ]
+
+    operations = [
+        migrations.RunPython(assign_current_game, migrations.RunPython.noop),
+    ]
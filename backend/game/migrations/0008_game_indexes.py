@@ -0,0 +1,63 @@
+# Generated by Django 5.0.1 on 2026-10-18 20:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0007_assign_current_game'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='achievement',
+            name='game',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='achievements', to='game.gamesettings'),
+        ),
+        migrations.AlterField(
+            model_name='playerstats',
+            name='game',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='game.gamesettings'),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='game',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tags', to='game.gamesettings'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='playerstats',
+            unique_together={('game', 'user', 'date')},
+        ),
+        migrations.AddIndex(
+            model_name='achievement',
+            index=models.Index(fields=['game', 'user'], name='game_achiev_game_id_94015e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playerstats',
+            index=models.Index(fields=['game', 'date'], name='game_player_game_id_6c782d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playerstats',
+            index=models.Index(fields=['game', '-cumulative_points'], name='game_player_game_id_c64321_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['game', '-tagged_at'], name='game_tag_game_id_b2256c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['game', 'tagger'], name='game_tag_game_id_7ffe72_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['game', 'tagged'], name='game_tag_game_id_c0dd74_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='achievement',
+            constraint=models.UniqueConstraint(condition=models.Q(('achievement_type', 'custom'), _negated=True), fields=('game', 'achievement_type'), name='unique_automatic_achievement'),
+        ),
+    ]
@@ -2,12 +2,20 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from datetime import timedelta
+from .cache import settings_cache
 
 User = get_user_model()
 
 
 class GameSettings(models.Model):
-    """Singleton model for game configuration (admin configurable)"""
+    """A game (season) and its configuration (admin configurable)
+
+    Tags, achievements and stats belong to one game, so several games can
+    run side by side and old seasons stay out of the way of the current one.
+    """
+    
+    name = models.CharField(max_length=100, blank=True, help_text='Name of the game or season')
+    is_current = models.BooleanField(default=False, help_text='Game used when a request names no game')
     
     # Game period
     game_start_date = models.DateTimeField()
@@ -56,23 +64,40 @@ class GameSettings(models.Model):
         verbose_name_plural = 'Game Settings'
     
     def save(self, *args, **kwargs):
-        # Ensure only one instance exists (singleton pattern)
-        self.pk = 1
         super().save(*args, **kwargs)
+        if self.is_current:
+            # Only one game is current
+            GameSettings.objects.filter(is_current=True).exclude(pk=self.pk).update(is_current=False)
     
     @classmethod
     def get_settings(cls):
-        obj, created = cls.objects.get_or_create(
-            pk=1,
-            defaults={
-                'game_start_date': timezone.now(),
-                'game_end_date': timezone.now() + timedelta(days=30)
-            }
-        )
+        """The current game"""
+        return settings_cache.get(cls._load_settings)
+    
+    @classmethod
+    def get_game(cls, pk):
+        """A game by id, raises DoesNotExist"""
+        return settings_cache.get(lambda: cls.objects.get(pk=pk), key=int(pk))
+    
+    @classmethod
+    def _load_settings(cls):
+        obj = cls.objects.filter(is_current=True).first()
+        if obj is None:
+            obj = cls.objects.create(
+                is_current=True,
+                game_start_date=timezone.now(),
+                game_end_date=timezone.now() + timedelta(days=30)
+            )
         return obj
     
     def __str__(self):
-        return f"Game Settings ({self.game_start_date.date()} - {self.game_end_date.date()})"
+        period = f"{self.game_start_date.date()} - {self.game_end_date.date()}"
+        return f"{self.name} ({period})" if self.name else f"Game Settings ({period})"
+    
+    @property
+    def group_name(self):
+        """Channel layer group of the game's WebSocket clients"""
+        return f'game_{self.pk}'
     
     @property
     def is_game_active(self):
@@ -91,9 +116,34 @@ class GameSettings(models.Model):
         ]
 
 
+class HolderState(models.Model):
+    """Who holds the tag right now, changed atomically on every handoff"""
+    
+    game = models.OneToOneField(GameSettings, on_delete=models.CASCADE, related_name='holder_state')
+    holder = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    since = models.DateTimeField(null=True, blank=True, help_text='When did the holder get the tag')
+    version = models.PositiveIntegerField(default=0, help_text='Incremented on every handoff')
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Holder State'
+    
+    def __str__(self):
+        holder = self.holder.username if self.holder else 'nobody'
+        return f"{holder} since {self.since}"
+
+
 class Tag(models.Model):
     """Record of each tag event"""
     
+    game = models.ForeignKey(GameSettings, on_delete=models.CASCADE, related_name='tags')
     tagger = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -125,9 +175,9 @@ class Tag(models.Model):
     class Meta:
         ordering = ['-tagged_at']
         indexes = [
-            models.Index(fields=['-tagged_at']),
-            models.Index(fields=['tagger']),
-            models.Index(fields=['tagged']),
+            models.Index(fields=['game', '-tagged_at']),
+            models.Index(fields=['game', 'tagger']),
+            models.Index(fields=['game', 'tagged']),
         ]
     
     def __str__(self):
@@ -152,17 +202,30 @@ class Achievement(models.Model):
         ('custom', 'Custom Achievement'),
     ]
     
+    game = models.ForeignKey(GameSettings, on_delete=models.CASCADE, related_name='achievements')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='achievements')
     achievement_type = models.CharField(max_length=50, choices=ACHIEVEMENT_TYPES)
     title = models.CharField(max_length=200)
     description = models.TextField()
     value = models.CharField(max_length=100, blank=True, help_text='Achievement value (time, count, etc.)')
+    metric = models.FloatField(null=True, blank=True, help_text='Numeric value used to compare candidates')
     
     icon = models.CharField(max_length=50, default='🏆')
     awarded_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-awarded_at']
+        indexes = [
+            models.Index(fields=['game', 'user']),
+        ]
+        constraints = [
+            # Automatic achievements have a single holder per game
+            models.UniqueConstraint(
+                fields=['game', 'achievement_type'],
+                condition=~models.Q(achievement_type='custom'),
+                name='unique_automatic_achievement'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.title}"
@@ -171,6 +234,7 @@ class Achievement(models.Model):
 class PlayerStats(models.Model):
     """Daily snapshot of player statistics"""
     
+    game = models.ForeignKey(GameSettings, on_delete=models.CASCADE, related_name='daily_stats')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_stats')
     date = models.DateField()
     
@@ -189,11 +253,59 @@ class PlayerStats(models.Model):
     
     class Meta:
         ordering = ['-date', '-cumulative_points']
-        unique_together = ['user', 'date']
+        unique_together = ['game', 'user', 'date']
         indexes = [
-            models.Index(fields=['date']),
-            models.Index(fields=['-cumulative_points']),
+            models.Index(fields=['game', 'date']),
+            models.Index(fields=['game', '-cumulative_points']),
         ]
     
     def __str__(self):
         return f"{self.user.username} - {self.date}"
+
+
+class PlayerScore(models.Model):
+    """Materialized running totals of a player, maintained on every tag"""
+    
+    game = models.ForeignKey(GameSettings, on_delete=models.CASCADE, related_name='scores')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='scores')
+    
+    points = models.IntegerField(default=0)
+    bonus_points = models.IntegerField(default=0, help_text='Part of points coming from untagged-day bonuses')
+    tags_given = models.IntegerField(default=0)
+    tags_received = models.IntegerField(default=0)
+    time_held = models.DurationField(default=timedelta, help_text='Time held up to the last catch')
+    last_tagged_at = models.DateTimeField(null=True, blank=True)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-points']
+        unique_together = ['game', 'user']
+        indexes = [
+            models.Index(fields=['game', '-points']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.points} points"
+
+
+class GameSnapshot(models.Model):
+    """Checkpoint of the folded tag log, replays continue from the latest one"""
+    
+    game = models.ForeignKey(GameSettings, on_delete=models.CASCADE, related_name='snapshots')
+    event_count = models.PositiveIntegerField(help_text='Number of tags folded into the state')
+    last_tag_id = models.BigIntegerField(help_text='Last tag folded into the state')
+    last_tagged_at = models.DateTimeField(help_text='Time of the last tag folded into the state')
+    state = models.JSONField()
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-last_tagged_at']
+        unique_together = ['game', 'event_count']
+        indexes = [
+            models.Index(fields=['game', '-last_tagged_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_count} tags up to {self.last_tagged_at}"
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+
+class SocketMetrics:
+    """Counters of the WebSocket connections served by this process"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.connections = 0
+        self.queued = 0
+        self.max_queue_depth = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.slow_disconnects = 0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+socket_metrics = SocketMetrics()
+
+
+class Outbox:
+    """Bounded queue of the frames waiting to be sent on one socket
+
+    The consumer only queues frames and a separate task sends them, so a
+    slow client never holds up its channel layer inbox or the fanout to
+    other sockets. A new ``leaderboard_update`` replaces every queued
+    leaderboard frame; the client is told the seqs it will not get with a
+    ``coalesced`` frame. Once ``MAX_FRAMES`` are queued new frames are
+    dropped.
+
+    Servers like daphne buffer whatever is sent without blocking, so the
+    queue alone does not show a slow client. Clients acknowledge the last
+    ``seq`` they handled instead, and the outbox compares it with the last
+    one it sent. A socket that stays full, or whose client stays more than
+    ``MAX_FRAMES`` seqs behind, for ``GRACE`` seconds is ``overdue`` and
+    should be closed. Clients that never acknowledge are only bounded by
+    the queue.
+    """
+
+    MAX_FRAMES = 300
+    GRACE = 10
+    SUPERSEDES = {'leaderboard_update': {'leaderboard_update', 'leaderboard_patch'}}
+
+    def __init__(self, metrics=None):
+        self.frames = deque()
+        self.ready = asyncio.Event()
+        self.full_since = None
+        self.sent_seq = None
+        self.acked_seq = None
+        self.behind_since = None
+        self.metrics = metrics or socket_metrics
+
+    def __len__(self):
+        return len(self.frames)
+
+    def room(self):
+        """Number of frames that can still be queued"""
+        return self.MAX_FRAMES - len(self.frames)
+
+    def put(self, text=None, kind=None, seq=None, bytes=None):
+        """Queue a frame, returns False if it was dropped"""
+        superseded = self.SUPERSEDES.get(kind)
+        if superseded and any(frame[0] in superseded for frame in self.frames):
+            self.coalesce(superseded)
+
+        if not self.room():
+            if self.full_since is None:
+                self.full_since = time.monotonic()
+            self.metrics.dropped += 1
+            return False
+
+        self.full_since = None
+        self.frames.append((kind, seq, {'text_data': text, 'bytes_data': bytes}))
+        self.queued(1)
+        return True
+
+    def coalesce(self, kinds):
+        """Drop the queued frames of some kinds"""
+        kept = deque(frame for frame in self.frames if frame[0] not in kinds)
+        seqs = [seq for kind, seq, _ in self.frames if kind in kinds and seq is not None]
+        self.metrics.coalesced += len(self.frames) - len(kept)
+        self.queued(len(kept) - len(self.frames))
+        self.frames = kept
+        if seqs:
+            # Sent first, so the client does not wait for them
+            text = json.dumps({'type': 'coalesced', 'seqs': seqs})
+            self.frames.appendleft(('coalesced', None, {'text_data': text, 'bytes_data': None}))
+            self.queued(1)
+
+    def queued(self, count):
+        self.metrics.queued += count
+        if count > 0:
+            self.metrics.max_queue_depth = max(self.metrics.max_queue_depth, len(self.frames))
+            self.ready.set()
+
+    def ack(self, seq):
+        """Record the last seq the client has handled"""
+        if isinstance(seq, int) and (self.acked_seq is None or seq > self.acked_seq):
+            self.acked_seq = seq
+            self.check_lag()
+    
+    def lag(self):
+        """Number of seqs sent that the client has not acknowledged"""
+        if self.sent_seq is None or self.acked_seq is None:
+            return 0
+        return max(self.sent_seq - self.acked_seq, 0)
+    
+    def check_lag(self):
+        if self.lag() <= self.MAX_FRAMES:
+            self.behind_since = None
+        elif self.behind_since is None:
+            self.behind_since = time.monotonic()
+    
+    def overdue(self):
+        """Whether the queue has been full, or the client behind, for longer than ``GRACE``"""
+        now = time.monotonic()
+        return any(
+            since is not None and now - since > self.GRACE
+            for since in (self.full_since, self.behind_since)
+        )
+
+    async def get(self):
+        """Next frame as ``send`` keyword arguments, waits for one"""
+        while not self.frames:
+            self.ready.clear()
+            await self.ready.wait()
+        _, seq, frame = self.frames.popleft()
+        self.queued(-1)
+        if seq is not None:
+            self.sent_seq = seq
+            self.check_lag()
+        return frame
+
+    def clear(self):
+        self.queued(-len(self.frames))
+        self.frames.clear()
@@ -0,0 +1,48 @@
+from datetime import timedelta
+from .events import GameState
+
+
+class ScoringReplay:
+    """Scores tags in memory the way process_new_tag does
+
+    The rank of the tagged player, and so the points of the tagger, depend on
+    everything before the tag. Folding scored tags into a GameState keeps
+    that running standing without touching the database.
+    """
+
+    def __init__(self, settings, user_ids, state=None):
+        self.settings = settings
+        self.points_list = settings.tag_points_list
+        self.user_ids = set(user_ids)
+        self.state = state or GameState()
+
+    def rank(self, user_id):
+        """Rank of a player among ``user_ids`` before the next tag"""
+        user_ids = self.user_ids | {user_id}
+        bonuses = self.state.calendar().bonuses(user_ids, self.settings.bonus_untagged_day)
+        points = {uid: self.state.player(uid).points + bonuses[uid] for uid in user_ids}
+
+        own = points[user_id]
+        return 1 + sum(
+            1 for uid, other in points.items()
+            if other > own or (other == own and uid < user_id)
+        )
+
+    def score(self, tag):
+        """Set points_awarded, time_penalty and time_held of the next tag"""
+        rank = self.rank(tag.tagged_id)
+        if rank <= len(self.points_list):
+            points_awarded = self.points_list[rank - 1]
+        else:
+            points_awarded = self.points_list[-1]
+
+        previous = self.state.player(tag.tagged_id).last_tagged_at
+        time_held = tag.tagged_at - previous if previous else timedelta()
+        hours_held = time_held.total_seconds() / 3600
+
+        tag.points_awarded = points_awarded
+        tag.time_penalty = int(hours_held) * self.settings.time_penalty_per_hour
+        tag.time_held = time_held
+
+        self.state = self.state.apply([tag])
+        return tag
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import GameSettings, Tag, Achievement, PlayerStats
+from .models import GameSettings, HolderState, Tag, Achievement, PlayerStats
 from users.serializers import UserSerializer
 
 User = get_user_model()
@@ -12,7 +12,7 @@ class GameSettingsSerializer(serializers.ModelSerializer):
     class Meta:
         model = GameSettings
         fields = [
-            'id', 'game_start_date', 'game_end_date',
+            'id', 'name', 'is_current', 'game_start_date', 'game_end_date',
             'tag_points_rank_1', 'tag_points_rank_2', 'tag_points_rank_3',
             'tag_points_rank_4', 'tag_points_rank_5', 'tag_points_rank_other',
             'time_penalty_per_hour', 'bonus_untagged_day',
@@ -21,6 +21,15 @@ class GameSettingsSerializer(serializers.ModelSerializer):
             'is_game_active', 'updated_at', 'current_tag_holder', 'tag_holder_since'
         ]
         read_only_fields = ['id', 'is_game_active', 'updated_at', 'tag_holder_since']
+    
+    def to_representation(self, instance):
+        """Report the live holder, tags hand it on without touching the settings"""
+        data = super().to_representation(instance)
+        state = HolderState.objects.filter(game=instance).values('holder_id', 'since').first()
+        if state:
+            data['current_tag_holder'] = state['holder_id']
+            data['tag_holder_since'] = serializers.DateTimeField().to_representation(state['since'])
+        return data
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -31,13 +40,13 @@ class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = [
-            'id', 'tagger', 'tagger_name', 'tagged', 'tagged_name',
+            'id', 'game', 'tagger', 'tagger_name', 'tagged', 'tagged_name',
             'tagged_at', 'tag_date', 'location', 'notes', 'photo',
             'points_awarded', 'time_penalty', 'time_held',
             'verified', 'created_at'
         ]
         read_only_fields = [
-            'id', 'points_awarded', 'time_penalty', 'time_held',
+            'id', 'game', 'points_awarded', 'time_penalty', 'time_held',
             'verified', 'created_at'
         ]
 
@@ -47,6 +56,7 @@ class CreateTagSerializer(serializers.Serializer):
     location = serializers.CharField(max_length=200, required=False, allow_blank=True)
     notes = serializers.CharField(required=False, allow_blank=True)
     photo = serializers.ImageField(required=False)
+    holder_version = serializers.IntegerField(required=False, help_text='Holder version the client saw')
     
     def validate_tagged_user_id(self, value):
         try:
@@ -68,10 +78,10 @@ class AchievementSerializer(serializers.ModelSerializer):
     class Meta:
         model = Achievement
         fields = [
-            'id', 'user', 'user_name', 'achievement_type',
+            'id', 'game', 'user', 'user_name', 'achievement_type',
             'title', 'description', 'value', 'icon', 'awarded_at'
         ]
-        read_only_fields = ['id', 'awarded_at']
+        read_only_fields = ['id', 'game', 'awarded_at']
 
 
 class PlayerStatsSerializer(serializers.ModelSerializer):
@@ -80,13 +90,13 @@ class PlayerStatsSerializer(serializers.ModelSerializer):
     class Meta:
         model = PlayerStats
         fields = [
-            'id', 'user', 'user_name', 'date',
+            'id', 'game', 'user', 'user_name', 'date',
             'was_tagged', 'tags_given_today', 'tags_received_today',
             'points_earned_today', 'time_held_today',
             'cumulative_points', 'cumulative_tags_given',
             'cumulative_tags_received', 'cumulative_time_held', 'rank'
         ]
-        read_only_fields = ['id']
+        read_only_fields = ['id', 'game']
 
 
 class LeaderboardSerializer(serializers.Serializer):
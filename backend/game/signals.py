@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from .models import GameSettings, Tag
+from .cache import settings_cache
+from .events import GameLog
+
+
+@receiver(post_save, sender=GameSettings)
+def invalidate_settings_cache(sender, instance, **kwargs):
+    """Drop cached settings in this and every other process"""
+    settings_cache.invalidate(pk=instance.pk)
+    transaction.on_commit(lambda: settings_cache.publish(instance))
+
+
+@receiver(pre_save, sender=Tag)
+def remember_tag_time(sender, instance, **kwargs):
+    """Keep the stored time of an edited tag, it may be moved to a later time"""
+    if instance.pk:
+        instance._stored_tagged_at = (
+            Tag.objects.filter(pk=instance.pk).values_list('tagged_at', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_snapshots(sender, instance, **kwargs):
+    """Drop game snapshots that include a changed tag"""
+    since = instance.tagged_at
+    stored = getattr(instance, '_stored_tagged_at', None)
+    if stored and stored < since:
+        since = stored
+    GameLog(instance.game).invalidate(since)
@@ -0,0 +1,146 @@
+import numpy as np
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from .models import Tag
+
+User = get_user_model()
+
+
+class ScoringSimulator:
+    """What-if standings of a tag log under candidate scoring rules
+
+    All candidates are replayed together: running points are a candidates x
+    players array, so each tag costs a few array operations no matter how
+    many variants are compared. Nothing is written to the database.
+    """
+
+    POINT_FIELDS = [
+        'tag_points_rank_1', 'tag_points_rank_2', 'tag_points_rank_3',
+        'tag_points_rank_4', 'tag_points_rank_5', 'tag_points_rank_other'
+    ]
+    FIELDS = POINT_FIELDS + ['time_penalty_per_hour', 'bonus_untagged_day']
+    MAX_CANDIDATES = 50
+
+    def __init__(self, tags, user_ids):
+        """Build from tags in replay order and the ids of ranked players"""
+        self.tags = [(tag.tagger_id, tag.tagged_id, tag.tagged_at) for tag in tags]
+        self.user_ids = sorted(
+            set(user_ids)
+            | {tagger_id for tagger_id, _, _ in self.tags}
+            | {tagged_id for _, tagged_id, _ in self.tags}
+        )
+
+    @classmethod
+    def from_log(cls, game):
+        """Simulator over the verified tags of a game"""
+        tags = Tag.objects.filter(game=game, verified=True).order_by('tagged_at', 'id').only(
+            'tagger_id', 'tagged_id', 'tagged_at'
+        )
+        return cls(tags, User.objects.filter(is_approved=True, is_participating=True).values_list('id', flat=True))
+
+    def candidate_settings(self, settings, candidates):
+        """Complete candidates with the values of ``settings``
+
+        Raises ValueError for unknown fields or values that are not integers.
+        """
+        if not isinstance(candidates, list) or not 1 <= len(candidates) <= self.MAX_CANDIDATES:
+            raise ValueError(f'Pass a list of 1 to {self.MAX_CANDIDATES} candidates')
+
+        complete = []
+        for number, candidate in enumerate(candidates, start=1):
+            if not isinstance(candidate, dict):
+                raise ValueError(f'Candidate {number}: expected an object of settings')
+            unknown = set(candidate) - set(self.FIELDS)
+            if unknown:
+                raise ValueError(f"Candidate {number}: unknown fields {', '.join(sorted(unknown))}")
+            values = {field: getattr(settings, field) for field in self.FIELDS}
+            for field, value in candidate.items():
+                if isinstance(value, bool) or not isinstance(value, int):
+                    raise ValueError(f'Candidate {number}: {field} must be an integer')
+                values[field] = value
+            complete.append(values)
+        return complete
+
+    def hold_hours(self):
+        """Whole hours since the previous catch of the tagged player, per tag"""
+        last_caught = {}
+        hours = []
+        for _, tagged_id, tagged_at in self.tags:
+            previous = last_caught.get(tagged_id)
+            held = tagged_at - previous if previous else timedelta()
+            hours.append(int(held.total_seconds() / 3600))
+            last_caught[tagged_id] = tagged_at
+        return hours
+
+    def run(self, candidates):
+        """Final points of every player, a candidates x players array
+
+        ``candidates`` are complete dicts of FIELDS, see candidate_settings.
+        """
+        index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        rows = np.arange(len(candidates))
+        points_table = np.array([[c[field] for field in self.POINT_FIELDS] for c in candidates], dtype=np.int64)
+        penalty = np.array([c['time_penalty_per_hour'] for c in candidates], dtype=np.int64)
+        bonus = np.array([c['bonus_untagged_day'] for c in candidates], dtype=np.int64)
+
+        points = np.zeros((len(candidates), len(self.user_ids)), dtype=np.int64)
+        isolated = np.zeros(len(self.user_ids), dtype=np.int64)
+
+        # Tagged days per player as bitsets, as in TagCalendar
+        start = None
+        game_days = 0
+        player_days = [0] * len(self.user_ids)
+
+        def isolated_days(i):
+            days = player_days[i]
+            return (game_days & ~(days | (days << 1) | (days >> 1))).bit_count()
+
+        for (tagger_id, tagged_id, tagged_at), hours in zip(self.tags, self.hold_hours()):
+            tagger, tagged = index[tagger_id], index[tagged_id]
+
+            # Rank of the tagged player: ahead are more points, or equal points and a lower id
+            totals = points + bonus[:, None] * isolated[None, :]
+            own = totals[:, tagged][:, None]
+            ahead = (totals > own).sum(axis=1) + (totals[:, :tagged] == own).sum(axis=1)
+            awarded = points_table[rows, np.minimum(ahead, len(self.POINT_FIELDS) - 1)]
+
+            points[:, tagger] += awarded
+            points[:, tagged] -= hours * penalty
+
+            day = timezone.localdate(tagged_at)
+            start = start or day
+            bit = 1 << (day - start).days
+            new_day = not game_days & bit
+            game_days |= bit
+            player_days[tagged] |= bit
+            if new_day:
+                isolated = np.array([isolated_days(i) for i in range(len(self.user_ids))], dtype=np.int64)
+            else:
+                isolated[tagged] = isolated_days(tagged)
+
+        return points + bonus[:, None] * isolated[None, :]
+
+    def standings(self, settings, candidates):
+        """Final standings under each candidate, with the candidate's full settings"""
+        candidates = self.candidate_settings(settings, candidates)
+        final = self.run(candidates)
+        usernames = dict(User.objects.filter(id__in=self.user_ids).values_list('id', 'username'))
+
+        results = []
+        for values, row in zip(candidates, final):
+            # Stable sort on points keeps ties in user id order
+            order = np.argsort(-row, kind='stable')
+            results.append({
+                'settings': values,
+                'standings': [
+                    {
+                        'rank': rank,
+                        'user_id': self.user_ids[i],
+                        'username': usernames.get(self.user_ids[i]),
+                        'points': int(row[i]),
+                    }
+                    for rank, i in enumerate(order, start=1)
+                ],
+            })
+        return results
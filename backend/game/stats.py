@@ -0,0 +1,231 @@
+import json
+from datetime import datetime, time, timedelta
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+from redis import RedisError
+from .models import GameSettings, PlayerStats, Tag
+from .events import GameLog
+from .game_engine import GameEngine
+from .leaderboard import get_redis
+
+User = get_user_model()
+
+
+class DailyStats:
+    """Writes PlayerStats, the end-of-day history of every player
+
+    Cumulative values come from the game state replayed up to the end of a
+    day. Per-day values are the difference to the previous day, so time
+    held over midnight is split between the two days. Time held here is the
+    time players actually had the tag, not the catch gaps used for scoring.
+    """
+
+    BATCH_DAYS = 31
+
+    UPDATE_FIELDS = [
+        'was_tagged', 'tags_given_today', 'tags_received_today', 'points_earned_today',
+        'time_held_today', 'cumulative_points', 'cumulative_tags_given',
+        'cumulative_tags_received', 'cumulative_time_held', 'rank'
+    ]
+
+    def __init__(self, settings=None):
+        self.settings = settings or GameSettings.get_settings()
+        self.log = GameLog(self.settings)
+        self.user_ids = list(
+            User.objects.filter(is_approved=True, is_participating=True).values_list('id', flat=True)
+        )
+
+    @staticmethod
+    def day_end(day):
+        """Last moment of a local day"""
+        midnight = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+        return midnight - timedelta(microseconds=1)
+
+    def first_day(self):
+        """First day of the game, or of its first tag if that is earlier"""
+        first = timezone.localdate(self.settings.game_start_date)
+        first_tag_at = (
+            Tag.objects.filter(game=self.settings, verified=True).order_by('tagged_at')
+            .values_list('tagged_at', flat=True).first()
+        )
+        if first_tag_at:
+            first = min(first, timezone.localdate(first_tag_at))
+        return first
+
+    def last_day(self):
+        """Last complete day of the game"""
+        yesterday = timezone.localdate() - timedelta(days=1)
+        return min(yesterday, timezone.localdate(self.settings.game_end_date))
+
+    def cumulative(self, state, day):
+        """Dict of user id -> ranked totals at the end of ``day``"""
+        midnight = self.day_end(day) + timedelta(microseconds=1)
+        scores = {}
+        for score in GameEngine.rank_state(self.settings, state, midnight, self.user_ids):
+            score['held'] = state.held(score['user_id'], midnight)
+            scores[score['user_id']] = score
+        return scores
+
+    def build(self, first, last):
+        """PlayerStats rows of all players for the days from ``first`` to ``last``"""
+        state = self.log.replay(until=self.day_end(first - timedelta(days=1)))
+        previous = self.cumulative(state, first - timedelta(days=1))
+
+        tags_by_day = {}
+        for tag in self.log.events(state, until=self.day_end(last)).iterator(chunk_size=GameLog.BATCH_SIZE):
+            tags_by_day.setdefault(timezone.localdate(tag.tagged_at), []).append(tag)
+
+        rows = []
+        day = first
+        while day <= last:
+            state = state.apply(tags_by_day.get(day, []))
+            current = self.cumulative(state, day)
+            for user_id, score in current.items():
+                before = previous[user_id]
+                rows.append(PlayerStats(
+                    game=self.settings,
+                    user_id=user_id,
+                    date=day,
+                    was_tagged=score['tags_received'] > before['tags_received'],
+                    tags_given_today=score['tags_given'] - before['tags_given'],
+                    tags_received_today=score['tags_received'] - before['tags_received'],
+                    points_earned_today=score['points'] - before['points'],
+                    time_held_today=score['held'] - before['held'],
+                    cumulative_points=score['points'],
+                    cumulative_tags_given=score['tags_given'],
+                    cumulative_tags_received=score['tags_received'],
+                    cumulative_time_held=score['held'],
+                    rank=score['rank'],
+                ))
+            previous = current
+            day += timedelta(days=1)
+
+        return rows
+
+    def write(self, rows):
+        PlayerStats.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['game', 'user', 'date'],
+            update_fields=self.UPDATE_FIELDS,
+        )
+        transaction.on_commit(lambda: StatsSeries(self.settings).bump_version())
+        return len(rows)
+
+    def snapshot(self, day):
+        """Write the rows of one finished day, returns the number of rows"""
+        if day < self.first_day() or day > timezone.localdate(self.settings.game_end_date):
+            return 0
+        return self.write(self.build(day, day))
+
+    def backfill(self, rebuild=False, batch_days=None):
+        """Write missing days (or all with ``rebuild``) in batches of days
+
+        Yields (first day, last day, rows written) after each batch.
+        """
+        batch_days = batch_days or self.BATCH_DAYS
+        first, last = self.first_day(), self.last_day()
+        existing = set() if rebuild else set(
+            PlayerStats.objects.filter(game=self.settings, date__range=(first, last))
+            .values_list('date', flat=True).distinct()
+        )
+        missing = [
+            first + timedelta(days=offset)
+            for offset in range((last - first).days + 1)
+            if first + timedelta(days=offset) not in existing
+        ]
+
+        while missing:
+            # Consecutive missing days share one replay
+            batch = [missing.pop(0)]
+            while missing and len(batch) < batch_days and missing[0] == batch[-1] + timedelta(days=1):
+                batch.append(missing.pop(0))
+
+            rows = self.write(self.build(batch[0], batch[-1]))
+            yield batch[0], batch[-1], rows
+
+
+class StatsSeries:
+    """Columnar points/rank history of players, for charts
+
+    Series are cached in Redis under a version of the PlayerStats rows that
+    DailyStats bumps on every write, so a cached payload never outlives the
+    rows it was built from.
+    """
+
+    RESOLUTIONS = ('day', 'week')
+    MAX_PLAYERS = 50
+    TTL = 24 * 60 * 60
+
+    def __init__(self, game, client=None):
+        self.game = game
+        self.version_key = f'game:{game.pk}:stats:version'
+        self.client = client or get_redis()
+
+    def version(self):
+        return int(self.client.get(self.version_key) or 0)
+
+    def bump_version(self):
+        try:
+            self.client.incr(self.version_key)
+        except RedisError:
+            pass
+
+    @staticmethod
+    def sample(dates, resolution='day', every=1):
+        """Dates kept by downsampling, the latest one is always kept"""
+        if resolution == 'week':
+            # Last day of every ISO week
+            weeks = {}
+            for day in dates:
+                weeks[day.isocalendar()[:2]] = day
+            dates = sorted(weeks.values())
+        return dates[::-1][::every][::-1]
+
+    def build(self, user_ids, resolution='day', every=1):
+        """Series built from the PlayerStats rows, with one array per value"""
+        stats = PlayerStats.objects.filter(game=self.game, user_id__in=user_ids)
+        dates = self.sample(
+            list(stats.order_by('date').values_list('date', flat=True).distinct()),
+            resolution, every
+        )
+        index = {day: i for i, day in enumerate(dates)}
+
+        players = {
+            user_id: {'points': [None] * len(dates), 'rank': [None] * len(dates)}
+            for user_id in user_ids
+        }
+        for user_id, day, points, rank in stats.filter(date__in=dates).values_list(
+            'user_id', 'date', 'cumulative_points', 'rank'
+        ):
+            players[user_id]['points'][index[day]] = points
+            players[user_id]['rank'][index[day]] = rank
+
+        return {
+            'dates': [day.isoformat() for day in dates],
+            'players': {str(user_id): values for user_id, values in players.items()},
+        }
+
+    def get(self, user_ids, resolution='day', every=1):
+        """Series of the given players, from Redis outside transactions"""
+        user_ids = sorted(set(user_ids))
+        if connection.in_atomic_block:
+            return self.build(user_ids, resolution, every)
+
+        try:
+            key = 'game:{}:stats:series:{}:{}:{}:{}'.format(
+                self.game.pk, self.version(), resolution, every, ','.join(map(str, user_ids))
+            )
+            cached = self.client.get(key)
+            if cached is not None:
+                return json.loads(cached)
+        except RedisError:
+            return self.build(user_ids, resolution, every)
+
+        series = self.build(user_ids, resolution, every)
+        try:
+            self.client.set(key, json.dumps(series), ex=self.TTL)
+        except RedisError:
+            pass
+        return series
@@ -0,0 +1,112 @@
+from celery import shared_task
+from datetime import date, timedelta
+from django.db import transaction
+from django.utils import timezone
+from redis import RedisError
+from .leaderboard import get_redis
+
+# Tags arriving within this window are folded into one recomputation
+DERIVED_UPDATE_DELAY = 2
+
+# Per game, formatted with the game id
+PENDING_TAGS_KEY = 'game:{}:derived:pending'
+SCHEDULED_KEY = 'game:{}:derived:scheduled'
+
+
+def schedule_derived_update(tag_id, game_id):
+    """Queue achievement/leaderboard recomputation for a new tag of a game
+
+    Only the first tag of a burst enqueues the task; later ones just join the
+    pending list that the task drains when it runs.
+    """
+    try:
+        client = get_redis()
+        pipe = client.pipeline()
+        pipe.rpush(PENDING_TAGS_KEY.format(game_id), tag_id)
+        pipe.set(SCHEDULED_KEY.format(game_id), 1, nx=True, ex=DERIVED_UPDATE_DELAY * 30)
+        _, scheduled = pipe.execute()
+    except RedisError:
+        # Without Redis there is no broker either, do the work inline
+        update_derived_state.apply(kwargs={'game_id': game_id, 'tag_ids': [tag_id]})
+        return
+    
+    if scheduled:
+        transaction.on_commit(
+            lambda: update_derived_state.apply_async((game_id,), countdown=DERIVED_UPDATE_DELAY)
+        )
+
+
+@shared_task
+def update_derived_state(game_id, tag_ids=None):
+    """Recompute achievements for pending tags and broadcast the leaderboard
+
+    Clients get a patch of the entries that changed, see LeaderboardFeed.
+    """
+    from .models import GameSettings
+    from .feed import LeaderboardFeed
+    from .game_engine import GameEngine
+    from .serializers import LeaderboardSerializer
+    from .broadcast import GameStream
+    
+    if tag_ids is None:
+        pipe = get_redis().pipeline()
+        pipe.lrange(PENDING_TAGS_KEY.format(game_id), 0, -1)
+        pipe.delete(PENDING_TAGS_KEY.format(game_id))
+        pipe.delete(SCHEDULED_KEY.format(game_id))
+        pending, _, _ = pipe.execute()
+        tag_ids = [int(tag_id) for tag_id in pending]
+    
+    if not tag_ids:
+        return
+    
+    settings = GameSettings.get_game(game_id)
+    leaderboard = GameEngine.update_derived_state(tag_ids, settings)
+    data = LeaderboardSerializer(leaderboard, many=True).data
+    
+    try:
+        message = LeaderboardFeed(settings).publish(data)
+    except RedisError:
+        # Unversioned, clients just replace their leaderboard
+        message = {'type': 'leaderboard_update', 'version': None, 'data': data}
+    if message is not None:
+        GameStream(settings).publish(message)
+
+
+@shared_task
+def snapshot_player_stats(day=None):
+    """Write the PlayerStats rows of a finished day, yesterday by default
+
+    Covers every game still running on that day. Scheduled nightly by
+    celery beat, see CELERY_BEAT_SCHEDULE.
+    """
+    from .models import GameSettings
+    from .stats import DailyStats
+    
+    day = date.fromisoformat(day) if day else timezone.localdate() - timedelta(days=1)
+    games = GameSettings.objects.filter(game_end_date__date__gte=day - timedelta(days=1))
+    return sum(DailyStats(settings).snapshot(day) for settings in games)
+
+
+@shared_task(bind=True)
+def rescore_game(self, game_id=None):
+    """Rescore every tag of a game under its rules, reporting progress"""
+    from .models import GameSettings
+    from .game_engine import GameEngine
+    
+    def progress(done, total):
+        self.update_state(state='PROGRESS', meta={'done': done, 'total': total})
+    
+    settings = GameSettings.get_game(game_id) if game_id else None
+    return {'changed': GameEngine.rescore_game(settings, progress=progress)}
+
+
+@shared_task
+def audit_user_totals(repair=True):
+    """Check a time-boxed slice of the User totals against the tag log
+
+    Scheduled by celery beat, every run continues the pass of the last one.
+    """
+    from .audit import TotalsAudit
+    
+    report = TotalsAudit().run(repair=repair)
+    return {field: report[field] for field in ('complete', 'checked', 'drifted', 'repaired')}
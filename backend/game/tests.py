@@ -1,11 +1,58 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
 from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
-from datetime import timedelta
-from .models import GameSettings, Tag, Achievement, PlayerStats
-from .game_engine import GameEngine
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.db.models import F
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import time
+import asyncio
+from io import StringIO
+import csv
+import os
+import tempfile
+import json
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from redis import RedisError
+from rest_framework_simplejwt.tokens import RefreshToken
+from notifications.models import Notification
+from notifications.tasks import send_tag_notification
+from users.middleware import JWTAuthMiddlewareStack
+from .models import (
+    GameSettings, HolderState, Tag, Achievement, PlayerStats, PlayerScore, GameSnapshot
+)
+from .game_engine import GameEngine, HolderConflict
+from .leaderboard import RedisLeaderboard, get_redis
+from .bonus import TagCalendar
+from .achievements import AchievementEngine
+from .intervals import CatchIntervals
+from .cache import SettingsCache, settings_cache
+from .holder import HolderCache
+from .events import GameLog, GameState
+from .stats import DailyStats, StatsSeries
+from .scoring import ScoringReplay
+from .simulator import ScoringSimulator
+from .audit import TotalsAudit
+from .feed import LeaderboardFeed
+from .broadcast import GameStream, broadcast, encode_frame
+from .outbox import Outbox, SocketMetrics, socket_metrics
+from .consumers import GameConsumer
+from .serializers import LeaderboardSerializer
+from .routing import websocket_urlpatterns
+from .tasks import (
+    schedule_derived_update, update_derived_state, snapshot_player_stats, rescore_game,
+    PENDING_TAGS_KEY, SCHEDULED_KEY
+)
 
 User = get_user_model()
 
@@ -214,3 +261,1971 @@ class AchievementTests(TestCase):
         
         for achievement in achievements:
             self.assertIn(achievement.achievement_type, valid_types)
+
+    def test_custom_achievements_are_kept(self):
+        """Test that automatic updates never remove custom achievements"""
+        custom = Achievement.objects.create(
+            game=self.settings,
+            user=self.user2, achievement_type='custom',
+            title='Best Costume', description='Dressed up as a tag'
+        )
+        tag = GameEngine.process_new_tag(self.user1, self.user2)
+        GameEngine.update_derived_state([tag.id])
+        GameEngine.calculate_achievements()
+
+        self.assertTrue(Achievement.objects.filter(id=custom.id).exists())
+
+    def test_incremental_matches_full_rebuild(self):
+        """Test that per-tag updates agree with a full recalculation"""
+        user3 = User.objects.create_user(
+            username='player3',
+            email='p3@test.com',
+            password='pass123', is_approved=True
+        )
+        holder = self.user1
+        tag_ids = []
+        for tagged in [self.user2, user3, self.user1, self.user2]:
+            tag_ids.append(GameEngine.process_new_tag(holder, tagged).id); self.settings.current_tag_holder = tagged; self.settings.save()
+            holder = tagged
+        # Two coalesced bursts
+        GameEngine.update_derived_state(tag_ids[:1])
+        GameEngine.update_derived_state(tag_ids[1:])
+
+        def records():
+            return {
+                achievement.achievement_type: (achievement.user_id, achievement.metric)
+                for achievement in Achievement.objects.exclude(
+                    achievement_type__in=['custom', 'fastest_player', 'slowest_player']
+                )
+            }
+
+        incremental = records()
+        GameEngine.calculate_achievements()
+        self.assertEqual(incremental, records())
+        self.assertEqual(
+            Achievement.objects.filter(achievement_type='fastest_catch').count(), 1
+        )
+
+    def test_unchanged_achievement_not_rewritten(self):
+        """Test that an unchanged holder and value cause no write"""
+        tag = GameEngine.process_new_tag(self.user1, self.user2); self.settings.current_tag_holder = self.user2; self.settings.save()
+        GameEngine.update_derived_state([tag.id])
+        engine = AchievementEngine()
+        achievement = engine.existing['most_tags_given']
+
+        with self.assertNumQueries(0):
+            changed = engine.award(
+                'most_tags_given', self.user1, achievement.value, achievement.metric
+            )
+        self.assertFalse(changed)
+
+
+class LeaderboardQueryTests(TestCase):
+    """Test that the leaderboard is built from aggregate queries"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'player{i}',
+                email=f'p{i}@test.com',
+                password='pass123', is_approved=True
+            )
+            for i in range(4)
+        ]
+        self.settings = GameSettings.get_settings()
+        self.settings.current_tag_holder = self.users[0]
+        self.settings.save()
+
+        start = timezone.localtime().replace(hour=12, minute=0) - timedelta(days=5)
+        Tag.objects.create(
+            game=self.settings,
+            tagger=self.users[0], tagged=self.users[1], tagged_at=start,
+            points_awarded=50, time_penalty=0
+        )
+        Tag.objects.create(
+            game=self.settings,
+            tagger=self.users[1], tagged=self.users[2], tagged_at=start + timedelta(hours=3),
+            points_awarded=40, time_penalty=10
+        )
+        Tag.objects.create(
+            game=self.settings,
+            tagger=self.users[2], tagged=self.users[1], tagged_at=start + timedelta(days=2),
+            points_awarded=30, time_penalty=20
+        )
+        GameEngine.rebuild_scores(self.settings)
+
+    def test_leaderboard_values(self):
+        """Test points, counts and time held per player"""
+        leaderboard = {entry['user']: entry for entry in GameEngine.calculate_leaderboard()}
+        bonus = self.settings.bonus_untagged_day
+
+        player1 = leaderboard[self.users[1]]
+        self.assertEqual(player1['tags_given'], 1)
+        self.assertEqual(player1['tags_received'], 2)
+        self.assertEqual(player1['time_held'], timedelta(days=2))
+        self.assertEqual(player1['points'], 40 - 20)
+
+        player3 = leaderboard[self.users[3]]
+        self.assertEqual(player3['points'], 2 * bonus)
+        self.assertEqual(player3['time_held'], timedelta())
+        self.assertEqual(
+            sorted(entry['rank'] for entry in leaderboard.values()),
+            [1, 2, 3, 4]
+        )
+
+    def test_query_count_independent_of_players(self):
+        """Test that adding players does not add queries"""
+        GameEngine.calculate_leaderboard()
+        with self.assertNumQueries(4):
+            GameEngine.calculate_leaderboard()
+
+        for i in range(4, 20):
+            User.objects.create_user(
+                username=f'player{i}',
+                email=f'p{i}@test.com',
+                password='pass123', is_approved=True
+            )
+
+        GameEngine.calculate_leaderboard()
+        with self.assertNumQueries(4):
+            GameEngine.calculate_leaderboard()
+
+
+class PlayerScoreTests(TestCase):
+    """Test materialized player scores"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'player{i}',
+                email=f'p{i}@test.com',
+                password='pass123', is_approved=True
+            )
+            for i in range(4)
+        ]
+        self.settings = GameSettings.get_settings()
+        self.settings.current_tag_holder = self.users[0]
+        self.settings.save()
+
+    def assertScoresMatchTagLog(self):
+        expected = GameEngine.calculate_scores(self.settings, [user.id for user in self.users])
+        for score in PlayerScore.objects.filter(game=self.settings):
+            values = expected[score.user_id]
+            self.assertEqual(score.points, values['points'])
+            self.assertEqual(score.bonus_points, values['bonus_points'])
+            self.assertEqual(score.tags_given, values['tags_given'])
+            self.assertEqual(score.tags_received, values['tags_received'])
+            self.assertEqual(score.time_held, values['time_held'])
+            self.assertEqual(score.last_tagged_at, values['last_tagged_at'])
+
+    def test_process_new_tag_updates_scores(self):
+        """Test that scores follow tags without a rebuild"""
+        holder = self.users[0]
+        for tagged in [self.users[1], self.users[2], self.users[1], self.users[3]]:
+            GameEngine.process_new_tag(holder, tagged)
+            self.settings.current_tag_holder = tagged
+            self.settings.save()
+            holder = tagged
+
+        self.assertEqual(PlayerScore.objects.filter(game=self.settings).count(), 4)
+        self.assertScoresMatchTagLog()
+
+    def test_untagged_bonus_delta(self):
+        """Test incremental bonuses against a full recomputation"""
+        GameEngine.rebuild_scores(self.settings)
+        start = timezone.localtime().replace(hour=12, minute=0) - timedelta(days=20)
+        catches = [(1, 0), (2, 0), (1, 2), (3, 3), (2, 5), (1, 4), (0, 9), (3, 7), (2, 8), (1, 6)]
+
+        for tagged_index, day in catches:
+            tagged = self.users[tagged_index]
+            tagged_at = start + timedelta(days=day)
+            GameEngine.apply_untagged_bonus_delta(self.settings, tagged, tagged_at.date())
+            Tag.objects.create(game=self.settings, tagger=self.users[0], tagged=tagged, tagged_at=tagged_at)
+
+        bonuses = GameEngine.calculate_untagged_bonuses(
+            self.settings, [user.id for user in self.users]
+        )
+        for score in PlayerScore.objects.filter(game=self.settings):
+            self.assertEqual(score.bonus_points, bonuses[score.user_id])
+
+    def test_rebuild_scores_command(self):
+        """Test rebuilding scores from the tag log"""
+        Tag.objects.create(
+            game=self.settings,
+            tagger=self.users[0], tagged=self.users[1],
+            points_awarded=50, time_penalty=5
+        )
+        call_command('rebuild_scores', stdout=StringIO())
+
+        self.assertEqual(PlayerScore.objects.filter(game=self.settings).count(), 4)
+        self.assertScoresMatchTagLog()
+
+    def test_approval_creates_score(self):
+        """Test that approving a player writes their score and reading the leaderboard does not"""
+        GameEngine.process_new_tag(self.users[0], self.users[1])
+        player = User.objects.create_user(username='late', email='late@test.com', password='pass123')
+        admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='admin123')
+
+        # Listed with empty totals until they are approved
+        with mock.patch.object(GameEngine, 'rebuild_scores') as rebuild:
+            User.objects.filter(pk=player.pk).update(is_approved=True)
+            entry, = [entry for entry in GameEngine.calculate_leaderboard() if entry['user'] == player]
+        rebuild.assert_not_called()
+        self.assertEqual((entry['points'], entry['tags_given']), (0, 0))
+
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        client.post(f'/api/users/{player.id}/approve/')
+        score = PlayerScore.objects.get(game=self.settings, user=player)
+        expected = GameEngine.calculate_scores(self.settings, [player.id])[player.id]
+        self.assertEqual(score.points, expected['points'])
+
+
+def redis_available():
+    try:
+        return get_redis().ping()
+    except RedisError:
+        return False
+
+
+class RedisLeaderboardTests(TestCase):
+    """Test the sorted-set leaderboard"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'player{i}',
+                email=f'p{i}@test.com',
+                password='pass123', is_approved=True
+            )
+            for i in range(6)
+        ]
+        self.settings = GameSettings.get_settings()
+        self.settings.current_tag_holder = self.users[0]
+        self.settings.save()
+        for tagger, tagged, points in [(0, 1, 50), (1, 2, 40), (2, 3, 40), (3, 4, 10)]:
+            Tag.objects.create(
+                game=self.settings,
+                tagger=self.users[tagger], tagged=self.users[tagged],
+                points_awarded=points
+            )
+        GameEngine.rebuild_scores(self.settings)
+
+    def test_score_encoding(self):
+        """Test that packed scores keep points and break ties by user id"""
+        for points in [-120, 0, 35, 5000]:
+            encoded = RedisLeaderboard.encode(42, points)
+            self.assertEqual(RedisLeaderboard.decode(b'42', encoded), (42, points))
+        self.assertGreater(RedisLeaderboard.encode(1, 10), RedisLeaderboard.encode(2, 10))
+        self.assertGreater(RedisLeaderboard.encode(2, 11), RedisLeaderboard.encode(1, 10))
+
+    @skipUnless(redis_available(), 'Redis is not available')
+    def test_matches_database_leaderboard(self):
+        """Test around queries against the database ordering"""
+        GameEngine.sync_leaderboard(self.settings)
+        board = GameEngine.get_redis_leaderboard(self.settings)
+        leaderboard = GameEngine.calculate_leaderboard()
+        expected = [(entry['rank'], entry['user'].id, entry['points']) for entry in leaderboard]
+
+        for index, (_, user_id, _) in enumerate(expected):
+            self.assertEqual(board.around(user_id, 1), expected[max(index - 1, 0):index + 2])
+
+        around = GameEngine.leaderboard_around(User.objects.get(id=expected[3][1]), radius=1)
+        self.assertEqual([entry['rank'] for entry in around], [3, 4, 5])
+
+    @skipUnless(redis_available(), 'Redis is not available')
+    def test_cold_start_rebuild(self):
+        """Test that a missing set is rebuilt from the score table"""
+        RedisLeaderboard(self.settings).clear()
+        self.assertEqual(GameEngine.get_redis_leaderboard(self.settings).around(self.users[0].id, 0)[0][0], 1)
+
+
+class TagCalendarTests(TestCase):
+    """Test bitset based untagged-day bonuses"""
+
+    def test_isolated_days(self):
+        """Test isolated untagged days against a day by day walk"""
+        start = timezone.localdate() - timedelta(days=30)
+        days = [start + timedelta(days=offset) for offset in [0, 1, 4, 6, 7, 10, 15, 16, 20]]
+        tagged_days = [
+            (user_id, day)
+            for user_id, offsets in {1: [0, 4, 10], 2: [1, 6, 7, 16], 3: [15, 20]}.items()
+            for day in [start + timedelta(days=offset) for offset in offsets]
+        ]
+        calendar = TagCalendar(tagged_days)
+
+        for user_id in [1, 2, 3, 4]:
+            user_days = {day for owner, day in tagged_days if owner == user_id}
+            expected = sum(
+                1 for day in days
+                if not user_days & {day - timedelta(days=1), day, day + timedelta(days=1)}
+            )
+            self.assertEqual(calendar.isolated_days(user_id), expected)
+
+        self.assertEqual(calendar.bonuses([4], 35), {4: 35 * len(days)})
+
+    def test_empty_calendar(self):
+        """Test a game without tags"""
+        self.assertEqual(TagCalendar([]).bonuses([1, 2], 35), {1: 0, 2: 0})
+
+
+class CatchIntervalTests(TestCase):
+    """Test window-function catch intervals"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'player{i}',
+                email=f'p{i}@test.com',
+                password='pass123', is_approved=True
+            )
+            for i in range(3)
+        ]
+        self.settings = GameSettings.get_settings()
+        start = timezone.now() - timedelta(days=3)
+        previous = {}
+        for tagger, tagged, hours in [(0, 1, 0), (1, 2, 5), (2, 1, 6), (1, 0, 20), (0, 2, 21), (2, 1, 40)]:
+            tagged_at = start + timedelta(hours=hours)
+            Tag.objects.create(
+                game=self.settings,
+                tagger=self.users[tagger], tagged=self.users[tagged], tagged_at=tagged_at,
+                time_held=tagged_at - previous.get(tagged, tagged_at)
+            )
+            previous[tagged] = tagged_at
+
+    def test_gaps(self):
+        """Test the time between consecutive catches of the game"""
+        gaps = [gap for _, gap in CatchIntervals.gaps(self.settings).order_by('tagged_at').values_list('id', 'gap')]
+        self.assertEqual(
+            gaps,
+            [None] + [timedelta(hours=hours) for hours in [5, 1, 14, 1, 19]]
+        )
+
+    def test_hold_intervals_match_stored_time_held(self):
+        """Test that windowed intervals reproduce Tag.time_held"""
+        for tag in CatchIntervals.hold_intervals(self.settings):
+            self.assertEqual(tag.held or timedelta(), tag.time_held)
+
+    def test_catch_records(self):
+        """Test fastest and slowest catch against the streamed fallback"""
+        fastest, slowest = CatchIntervals.catch_records(self.settings)
+        self.assertEqual(fastest[1], timedelta(hours=1))
+        self.assertEqual(slowest[1], timedelta(hours=19))
+        self.assertEqual((fastest, slowest), CatchIntervals._scan_catch_records(self.settings))
+
+    def test_held_by_player(self):
+        """Test per-player sums of hold intervals, within a game and across games"""
+        held = CatchIntervals.held_by_player(self.settings)
+        self.assertEqual(held[self.users[1].id], timedelta(hours=40))
+        self.assertEqual(held[self.users[2].id], timedelta(hours=16))
+        self.assertEqual(held[self.users[0].id], timedelta())
+
+        other = GameSettings.objects.create(
+            name='Other', game_start_date=timezone.now() - timedelta(days=1),
+            game_end_date=timezone.now() + timedelta(days=1)
+        )
+        now = timezone.now()
+        for hours in [0, 3]:
+            Tag.objects.create(
+                game=other, tagger=self.users[0], tagged=self.users[1],
+                tagged_at=now - timedelta(hours=hours)
+            )
+        held = CatchIntervals.held_by_player(user_ids=[self.users[1].id])
+        self.assertEqual(held, {self.users[1].id: timedelta(hours=43)})
+
+
+class DerivedUpdateTaskTests(TestCase):
+    """Test debounced background recomputation after tags"""
+
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username='player1',
+            email='p1@test.com',
+            password='pass123', is_approved=True
+        )
+        self.user2 = User.objects.create_user(
+            username='player2',
+            email='p2@test.com',
+            password='pass123', is_approved=True
+        )
+        self.settings = GameSettings.get_settings()
+        self.settings.current_tag_holder = self.user1
+        self.settings.save()
+
+    def test_create_tag_defers_achievements(self):
+        """Test that the tag request does not compute achievements"""
+        client = APIClient()
+        client.force_authenticate(user=self.user1)
+
+        with mock.patch('game.views.schedule_derived_update') as schedule, \
+                mock.patch('game.views.send_tag_notification'):
+            response = client.post(
+                '/api/game/tags/create_tag/',
+                {'tagged_user_id': self.user2.id},
+                format='json'
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        schedule.assert_called_once_with(response.data['tag']['id'], self.settings.pk)
+        self.assertFalse(Achievement.objects.exists())
+
+    def test_runs_inline_without_redis(self):
+        """Test the synchronous fallback when Redis is unavailable"""
+        tag = GameEngine.process_new_tag(self.user1, self.user2)
+
+        with mock.patch('game.tasks.get_redis', side_effect=RedisError):
+            schedule_derived_update(tag.id, self.settings.pk)
+
+        self.assertTrue(Achievement.objects.filter(achievement_type='most_tags_given').exists())
+
+    @skipUnless(redis_available(), 'Redis is not available')
+    def test_burst_is_coalesced(self):
+        """Test that a burst of tags enqueues a single recomputation"""
+        keys = PENDING_TAGS_KEY.format(self.settings.pk), SCHEDULED_KEY.format(self.settings.pk)
+        get_redis().delete(*keys)
+
+        with mock.patch.object(update_derived_state, 'apply_async') as apply_async, \
+                self.captureOnCommitCallbacks(execute=True):
+            for tag_id in [1, 2, 3]:
+                schedule_derived_update(tag_id, self.settings.pk)
+
+        apply_async.assert_called_once()
+        self.assertEqual(get_redis().lrange(keys[0], 0, -1), [b'1', b'2', b'3'])
+        get_redis().delete(*keys)
+
+
+class SettingsCacheTests(TransactionTestCase):
+    """Test the process-local GameSettings cache"""
+
+    def setUp(self):
+        settings_cache.invalidate()
+        listener = mock.patch.object(SettingsCache, '_ensure_listener')
+        listener.start()
+        self.addCleanup(listener.stop)
+        self.addCleanup(settings_cache.invalidate)
+
+    def test_steady_state_does_not_query(self):
+        """Test that repeated reads are served from memory"""
+        GameSettings.get_settings()
+        with self.assertNumQueries(0):
+            GameSettings.get_settings()
+            GameSettings.get_settings()
+
+    def test_save_invalidates(self):
+        """Test that saving the settings refreshes the cached copy"""
+        settings = GameSettings.get_settings()
+        settings.bonus_untagged_day = 99
+        self.assertEqual(GameSettings.get_settings().bonus_untagged_day, 35)
+
+        settings.save()
+        self.assertEqual(GameSettings.get_settings().bonus_untagged_day, 99)
+
+    def test_invalidation_message(self):
+        """Test messages from other processes"""
+        settings = GameSettings.get_settings()
+        settings_cache.invalidate(settings.updated_at.isoformat())
+        with self.assertNumQueries(0):
+            GameSettings.get_settings()
+
+        settings_cache.invalidate(timezone.now().isoformat())
+        with self.assertNumQueries(1):
+            GameSettings.get_settings()
+
+    def test_transactions_read_database(self):
+        """Test that reads inside a transaction bypass the cache"""
+        GameSettings.get_settings()
+        with transaction.atomic():
+            with self.assertNumQueries(1):
+                GameSettings.get_settings()
+
+
+class HolderStateTests(TestCase):
+    """Test the denormalized current holder"""
+
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username='player1', email='p1@test.com', password='pass123', is_approved=True
+        )
+        self.user2 = User.objects.create_user(
+            username='player2', email='p2@test.com', password='pass123', is_approved=True
+        )
+        self.user3 = User.objects.create_user(
+            username='player3', email='p3@test.com', password='pass123', is_approved=True
+        )
+        self.settings = GameSettings.get_settings()
+        self.settings.current_tag_holder = self.user1
+        self.settings.save()
+        self.client = APIClient()
+
+    def test_handoff_updates_state(self):
+        """Test that a tag moves the holder and bumps the version"""
+        version = GameEngine.get_holder_state(self.settings).version
+        tag = GameEngine.process_new_tag(self.user1, self.user2)
+
+        state = HolderState.objects.get(game=self.settings)
+        self.assertEqual(state.holder, self.user2)
+        self.assertEqual(state.since, tag.tagged_at)
+        self.assertEqual(state.version, version + 1)
+
+        # The settings field is only the seed, the old holder cannot tag again
+        with self.assertRaises(ValueError):
+            GameEngine.process_new_tag(self.user1, self.user3)
+        GameEngine.process_new_tag(self.user2, self.user3)
+        self.assertEqual(GameEngine.get_current_tag_holder(), self.user3)
+
+    def test_current_holder_endpoint(self):
+        """Test the current holder endpoint"""
+        self.client.force_authenticate(user=self.user1)
+        self.client.post('/api/game/tags/create_tag/', {'tagged_user_id': self.user2.id})
+
+        response = self.client.get('/api/game/tags/current_holder/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user']['id'], self.user2.id)
+        self.assertIsNotNone(response.data['since'])
+
+    def test_admin_override(self):
+        """Test that changing the holder in the settings hands the tag over"""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@test.com', password='admin123'
+        )
+        GameEngine.process_new_tag(self.user1, self.user2)
+        self.client.force_authenticate(user=admin)
+        response = self.client.patch(
+            f'/api/game/settings/{self.settings.id}/', {'current_tag_holder': self.user3.id}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(GameEngine.get_current_tag_holder(), self.user3)
+
+        # Back to the configured holder, who lost the tag to a tag since
+        GameEngine.process_new_tag(self.user3, self.user2)
+        response = self.client.patch(
+            f'/api/game/settings/{self.settings.id}/', {'current_tag_holder': self.user3.id}, format='json'
+        )
+        self.assertEqual(GameEngine.get_current_tag_holder(), self.user3)
+        self.assertEqual(response.data['current_tag_holder'], self.user3.id)
+
+        GameEngine.process_new_tag(self.user3, self.user1)
+        response = self.client.get(f'/api/game/settings/{self.settings.id}/')
+        self.assertEqual(response.data['current_tag_holder'], self.user1.id)
+
+    def test_cache_and_fallback(self):
+        """Test that the holder is read from Redis and falls back to the database"""
+        cached = {'user_id': self.user3.id, 'user': None, 'since': None, 'version': 7}
+        with mock.patch('game.game_engine.connection', in_atomic_block=False), \
+                mock.patch.object(HolderCache, 'get', return_value=cached):
+            self.assertEqual(GameEngine.get_current_holder_info(self.settings), cached)
+
+        with mock.patch('game.game_engine.connection', in_atomic_block=False), \
+                mock.patch.object(HolderCache, 'get', side_effect=RedisError):
+            info = GameEngine.get_current_holder_info(self.settings)
+        self.assertEqual(info['user_id'], self.user1.id)
+
+    def test_failed_cache_write_drops_stale_holder(self):
+        """Test that a failed holder write clears the key and the tag check uses the database"""
+        with mock.patch.object(HolderCache, 'set', side_effect=RedisError), \
+                mock.patch.object(HolderCache, 'clear') as clear:
+            GameEngine.cache_holder_info(self.settings, {})
+        clear.assert_called_once()
+
+        # A stale cached holder does not reject the real holder
+        stale = GameEngine.get_current_holder_info(self.settings)
+        GameEngine.process_new_tag(self.user1, self.user2)
+        self.client.force_authenticate(user=self.user2)
+        with mock.patch.object(GameEngine, 'get_current_holder_info', return_value=stale):
+            response = self.client.post('/api/game/tags/create_tag/', {'tagged_user_id': self.user3.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_lost_race_conflicts(self):
+        """Test that a tag from a holder who was just tagged fails with the new holder"""
+        GameEngine.process_new_tag(self.user1, self.user2)
+        with self.assertRaises(HolderConflict) as caught:
+            GameEngine.process_new_tag(self.user1, self.user3)
+        self.assertEqual(caught.exception.holder['user_id'], self.user2.id)
+
+    def test_stale_version_returns_409(self):
+        """Test that a tag made against an old holder version is rejected"""
+        version = GameEngine.get_current_holder_info()['version']
+        self.client.force_authenticate(user=self.user1)
+        response = self.client.post(
+            '/api/game/tags/create_tag/',
+            {'tagged_user_id': self.user2.id, 'holder_version': version + 1},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['holder']['id'], self.user1.id)
+        self.assertEqual(response.data['holder_version'], version)
+
+        response = self.client.post(
+            '/api/game/tags/create_tag/',
+            {'tagged_user_id': self.user2.id, 'holder_version': version},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_lost_race_without_version_returns_409(self):
+        """Test that the previous holder gets 409 without a version and others get 403"""
+        GameEngine.process_new_tag(self.user1, self.user2)
+
+        self.client.force_authenticate(user=self.user1)
+        response = self.client.post('/api/game/tags/create_tag/', {'tagged_user_id': self.user3.id})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['holder']['id'], self.user2.id)
+
+        self.client.force_authenticate(user=self.user3)
+        response = self.client.post('/api/game/tags/create_tag/', {'tagged_user_id': self.user1.id})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class GameLogTests(TestCase):
+    """Test replaying the tag log from snapshots"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'player{i}', email=f'p{i}@test.com', password='pass123', is_approved=True
+            )
+            for i in range(4)
+        ]
+        self.settings = GameSettings.get_settings()
+        self.log = GameLog(self.settings)
+
+        start = timezone.localtime().replace(hour=12, minute=0) - timedelta(days=6)
+        for i in range(12):
+            Tag.objects.create(
+                game=self.settings,
+                tagger=self.users[i % 4], tagged=self.users[(i + 1) % 4],
+                tagged_at=start + timedelta(hours=11 * i),
+                points_awarded=10 + i, time_penalty=i
+            )
+
+    def test_snapshots_do_not_change_state(self):
+        """Test that replaying from snapshots gives the same state as a full replay"""
+        full = self.log.replay(checkpoint=False)
+        self.assertFalse(GameSnapshot.objects.exists())
+
+        self.assertEqual(self.log.replay(), full)
+        self.assertTrue(GameSnapshot.objects.exists())
+        self.assertEqual(self.log.replay(), full)
+        self.assertEqual(full.event_count, 12)
+        self.assertEqual(full.holder_id, self.users[0].id)
+
+        player = full.player(self.users[1].id)
+        self.assertEqual(player.tags_received, 3)
+        self.assertEqual(player.time_held, timedelta(hours=88))
+
+    def test_replay_reads_only_the_tail(self):
+        """Test that a replay starts from the latest snapshot"""
+        with mock.patch.object(GameLog, 'SNAPSHOT_EVERY', 5):
+            self.log.replay()
+            snapshot = self.log.latest_snapshot()
+            self.assertEqual(snapshot.event_count, 10)
+            tail = self.log.events(GameState.from_json(snapshot.state))
+            self.assertEqual(tail.count(), 2)
+
+    def test_changed_tag_drops_later_snapshots(self):
+        """Test that deleting a past tag invalidates the snapshots containing it"""
+        self.log.replay()
+        tag = Tag.objects.order_by('tagged_at')[3]
+        tag.delete()
+        self.assertFalse(GameSnapshot.objects.filter(last_tagged_at__gte=tag.tagged_at).exists())
+        self.assertEqual(self.log.replay(), self.log.replay(checkpoint=False))
+
+    def test_json_round_trip(self):
+        """Test that a state survives serialization"""
+        state = self.log.replay(checkpoint=False)
+        self.assertEqual(GameState.from_json(state.to_json()), state)
+
+
+class LeaderboardAsOfTests(TestCase):
+    """Test historical leaderboards"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'player{i}', email=f'p{i}@test.com', password='pass123', is_approved=True
+            )
+            for i in range(4)
+        ]
+        self.settings = GameSettings.get_settings()
+        self.settings.current_tag_holder = self.users[0]
+        self.settings.save()
+
+        self.start = timezone.localtime().replace(hour=12, minute=0) - timedelta(days=8)
+        self.tags = [
+            Tag.objects.create(
+                game=self.settings,
+                tagger=self.users[i % 4], tagged=self.users[(i + 1) % 4],
+                tagged_at=self.start + timedelta(hours=20 * i),
+                points_awarded=10 * (i + 1), time_penalty=i
+            )
+            for i in range(8)
+        ]
+
+    def test_matches_past_state(self):
+        """Test that the leaderboard at a past time equals one built from the tags up to then"""
+        GameLog(self.settings).replay()
+        as_of = self.start + timedelta(hours=50)
+        past = GameEngine.calculate_leaderboard_as_of(as_of)
+
+        holders = [entry['user'] for entry in past if entry['is_current_holder']]
+        self.assertEqual(holders, [self.users[3]])
+
+        Tag.objects.filter(tagged_at__gt=as_of).delete()
+        GameEngine.rebuild_scores(self.settings)
+        key = lambda entry: (entry['rank'], entry['user'], entry['points'], entry['tags_received'])
+        self.assertEqual(
+            [key(entry) for entry in past],
+            [key(entry) for entry in GameEngine.calculate_leaderboard()]
+        )
+
+    def test_as_of_parameter(self):
+        """Test the as_of query parameter"""
+        client = APIClient()
+        day = (self.start + timedelta(days=1)).date().isoformat()
+        response = client.get('/api/game/leaderboard/', {'as_of': day})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sum(entry['tags_given'] for entry in response.data), 2)
+
+        response = client.get('/api/game/leaderboard/', {'as_of': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DailyStatsTests(TestCase):
+    """Test the daily PlayerStats history"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'player{i}', email=f'p{i}@test.com', password='pass123', is_approved=True
+            )
+            for i in range(3)
+        ]
+        self.today = timezone.localdate()
+        self.settings = GameSettings.get_settings()
+        self.settings.game_start_date = self.at(-5, 0)
+        self.settings.current_tag_holder = self.users[0]
+        self.settings.save()
+
+        # player1 holds the tag over midnight between day -3 and day -2
+        for tagger, tagged, when in [(0, 1, self.at(-4, 12)), (1, 2, self.at(-4, 14)),
+                                     (2, 1, self.at(-3, 22)), (1, 0, self.at(-2, 2))]:
+            Tag.objects.create(
+                game=self.settings,
+                tagger=self.users[tagger], tagged=self.users[tagged], tagged_at=when,
+                points_awarded=20, time_penalty=5
+            )
+
+    def at(self, days, hour):
+        day = self.today + timedelta(days=days)
+        return timezone.make_aware(datetime.combine(day, datetime.min.time()).replace(hour=hour))
+
+    def stats(self, user, days):
+        return PlayerStats.objects.get(user=user, date=self.today + timedelta(days=days))
+
+    def test_time_held_split_at_midnight(self):
+        """Test that a hold over midnight counts for both days"""
+        call_command('backfill_player_stats', stdout=StringIO())
+        self.assertEqual(self.stats(self.users[1], -3).time_held_today, timedelta(hours=2))
+        self.assertEqual(self.stats(self.users[1], -2).time_held_today, timedelta(hours=2))
+        self.assertTrue(self.stats(self.users[1], -3).was_tagged)
+        self.assertFalse(self.stats(self.users[1], -2).was_tagged)
+
+    def test_cumulative_matches_leaderboard(self):
+        """Test that the rows of a day agree with the leaderboard at its end"""
+        call_command('backfill_player_stats', stdout=StringIO())
+        leaderboard = GameEngine.calculate_leaderboard_as_of(DailyStats.day_end(self.today - timedelta(days=2)))
+        for entry in leaderboard:
+            stats = self.stats(entry['user'], -2)
+            self.assertEqual(stats.cumulative_points, entry['points'])
+            self.assertEqual(stats.rank, entry['rank'])
+
+        days = PlayerStats.objects.filter(user=self.users[0]).order_by('date')
+        self.assertEqual(days.count(), 5)
+        self.assertEqual(
+            sum(day.points_earned_today for day in days), days.last().cumulative_points
+        )
+
+    def test_backfill_only_missing_days(self):
+        """Test that a second backfill finds nothing to do"""
+        snapshot_player_stats.delay()
+        self.assertEqual(PlayerStats.objects.count(), 3)
+
+        batches = list(DailyStats().backfill())
+        self.assertEqual([(first, last) for first, last, _ in batches], [
+            (self.today - timedelta(days=5), self.today - timedelta(days=2))
+        ])
+        self.assertEqual(list(DailyStats().backfill()), [])
+
+    def test_timeseries(self):
+        """Test the downsampled chart series"""
+        call_command('backfill_player_stats', stdout=StringIO())
+        client = APIClient()
+        client.force_authenticate(user=self.users[0])
+        url = '/api/game/stats/timeseries/'
+
+        response = client.get(url, {'users': f'{self.users[0].id},{self.users[1].id}'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['dates']), 5)
+        series = response.data['players'][str(self.users[1].id)]
+        self.assertEqual(series['points'][-1], self.stats(self.users[1], -1).cumulative_points)
+        self.assertEqual(series['rank'][-1], self.stats(self.users[1], -1).rank)
+
+        response = client.get(url, {'every': 2})
+        self.assertEqual(len(response.data['dates']), 3)
+        self.assertEqual(response.data['dates'][-1], (self.today - timedelta(days=1)).isoformat())
+        self.assertEqual(list(response.data['players']), [str(self.users[0].id)])
+
+        response = client.get(url, {'resolution': 'week'})
+        self.assertLessEqual(len(response.data['dates']), 2)
+        self.assertEqual(client.get(url, {'resolution': 'month'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_timeseries_cache(self):
+        """Test that series are served from Redis until the stats version changes"""
+        call_command('backfill_player_stats', stdout=StringIO())
+        client = mock.Mock()
+        client.get.return_value = None
+        series = StatsSeries(self.settings, client)
+
+        with mock.patch('game.stats.connection', in_atomic_block=False):
+            built = series.get([self.users[0].id])
+            key = client.set.call_args[0][0]
+            client.get.side_effect = lambda name: json.dumps(built) if name == key else None
+            with self.assertNumQueries(0):
+                self.assertEqual(series.get([self.users[0].id]), built)
+
+            client.get.side_effect = lambda name: b'1' if name == series.version_key else None
+            series.get([self.users[0].id])
+            self.assertNotEqual(client.set.call_args[0][0], key)
+
+
+class TagImportTests(TestCase):
+    """Test bulk import of past tags"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'player{i}', email=f'p{i}@test.com', password='pass123', is_approved=True
+            )
+            for i in range(4)
+        ]
+        start = timezone.now() - timedelta(days=4)
+        self.settings = GameSettings.get_settings()
+        self.settings.game_start_date = start - timedelta(days=1)
+        self.settings.save()
+        order = [0, 1, 2, 1, 3, 0, 2, 3, 1, 0]
+        self.rows = [
+            {
+                'tagger': self.users[tagger].username,
+                'tagged': self.users[tagged].username,
+                'tagged_at': (start + timedelta(hours=7 * i + i * i)).isoformat(),
+            }
+            for i, (tagger, tagged) in enumerate(zip(order, order[1:]))
+        ]
+
+    def write_csv(self, rows):
+        file = tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', delete=False)
+        self.addCleanup(os.remove, file.name)
+        writer = csv.DictWriter(file, fieldnames=['tagger', 'tagged', 'tagged_at'])
+        writer.writeheader()
+        writer.writerows(rows)
+        file.close()
+        return file.name
+
+    def test_import_scores_like_live_tags(self):
+        """Test that imported tags get the points live tags would have got"""
+        self.settings.current_tag_holder = self.users[0]
+        self.settings.save()
+        for row in self.rows:
+            tagger = User.objects.get(username=row['tagger'])
+            tagged = User.objects.get(username=row['tagged'])
+            with mock.patch('django.utils.timezone.now', return_value=datetime.fromisoformat(row['tagged_at'])):
+                GameEngine.process_new_tag(tagger, tagged)
+
+        fields = ('points_awarded', 'time_penalty', 'time_held')
+        live_tags = list(Tag.objects.order_by('tagged_at').values_list(*fields))
+        live_totals = list(User.objects.order_by('id').values_list('total_points', 'total_time_held'))
+        live_board = [(entry['user'], entry['points']) for entry in GameEngine.calculate_leaderboard()]
+
+        Tag.objects.all().delete()
+        HolderState.objects.all().delete()
+        User.objects.update(total_points=0, total_tags_given=0, total_tags_received=0, total_time_held=timedelta())
+        GameEngine.rebuild_scores(self.settings)
+
+        call_command('import_tags', self.write_csv(self.rows), stdout=StringIO())
+        self.assertEqual(list(Tag.objects.order_by('tagged_at').values_list(*fields)), live_tags)
+        self.assertEqual(
+            list(User.objects.order_by('id').values_list('total_points', 'total_time_held')), live_totals
+        )
+        self.assertEqual(
+            [(entry['user'], entry['points']) for entry in GameEngine.calculate_leaderboard()], live_board
+        )
+        self.assertEqual(GameEngine.get_current_tag_holder(), self.users[0])
+
+    def test_invalid_stream_is_rejected(self):
+        """Test that a broken handoff chain imports nothing"""
+        rows = self.rows[:3] + self.rows[4:]
+        with self.assertRaisesMessage(CommandError, 'Row 4'):
+            call_command('import_tags', self.write_csv(rows), stdout=StringIO())
+        self.assertFalse(Tag.objects.exists())
+
+    def test_dry_run(self):
+        """Test that a dry run validates without writing"""
+        out = StringIO()
+        call_command('import_tags', self.write_csv(self.rows), '--dry-run', stdout=out)
+        self.assertIn('9 tags are valid', out.getvalue())
+        self.assertFalse(Tag.objects.exists())
+
+
+class RescoreTests(TestCase):
+    """Test rescoring the game after the rules change"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'player{i}', email=f'p{i}@test.com', password='pass123', is_approved=True
+            )
+            for i in range(4)
+        ]
+        start = timezone.now() - timedelta(days=3)
+        self.settings = GameSettings.get_settings()
+        self.settings.game_start_date = start - timedelta(days=1)
+        self.settings.current_tag_holder = self.users[0]
+        self.settings.save()
+
+        order = [0, 1, 2, 3, 1, 0, 2, 1]
+        for i, (tagger, tagged) in enumerate(zip(order, order[1:])):
+            with mock.patch('django.utils.timezone.now', return_value=start + timedelta(hours=9 * i + 1)):
+                GameEngine.process_new_tag(self.users[tagger], self.users[tagged])
+
+    def test_rescore_applies_new_rules(self):
+        """Test that all tags and totals follow the new rules"""
+        self.settings.tag_points_rank_1 += 7
+        self.settings.tag_points_rank_other += 3
+        self.settings.time_penalty_per_hour += 1
+        self.settings.save()
+
+        progress = mock.Mock()
+        changed = GameEngine.rescore_game(self.settings, progress=progress, chunk_size=3)
+        self.assertGreater(changed, 0)
+        progress.assert_called_with(7, 7)
+
+        for tag in Tag.objects.all():
+            hours = int(tag.time_held.total_seconds() / 3600)
+            self.assertEqual(tag.time_penalty, hours * self.settings.time_penalty_per_hour)
+        for user in User.objects.all():
+            given = Tag.objects.filter(tagger=user)
+            received = Tag.objects.filter(tagged=user)
+            self.assertEqual(
+                user.total_points,
+                sum(tag.points_awarded for tag in given) - sum(tag.time_penalty for tag in received)
+            )
+        self.assertEqual(GameEngine.rescore_game(self.settings), 0)
+
+    def test_rescore_endpoint(self):
+        """Test that admins can start a rescore"""
+        admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='admin123')
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        with mock.patch.object(rescore_game, 'delay', return_value=mock.Mock(id='abc-1')) as delay:
+            response = client.post('/api/game/settings/rescore/')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['task_id'], 'abc-1')
+        delay.assert_called_once()
+
+        result = mock.Mock(state='PROGRESS', info={'done': 3, 'total': 7})
+        with mock.patch('game.views.AsyncResult', return_value=result):
+            response = client.get('/api/game/settings/rescore/abc-1/')
+        self.assertEqual(response.data, {'task_id': 'abc-1', 'state': 'PROGRESS', 'done': 3, 'total': 7})
+
+    def test_rescore_task(self):
+        """Test that the task reports progress and the number of changed tags"""
+        self.settings.time_penalty_per_hour += 2
+        self.settings.save()
+        with mock.patch.object(rescore_game, 'update_state') as update_state:
+            result = rescore_game.apply()
+        penalized = Tag.objects.filter(time_held__gte=timedelta(hours=1)).count()
+        self.assertEqual(result.get(), {'changed': penalized})
+        update_state.assert_called_with(state='PROGRESS', meta={'done': 7, 'total': 7})
+
+
+class TagCorrectionTests(TestCase):
+    """Test recomputing the game after a past tag is deleted or disputed"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'player{i}', email=f'p{i}@test.com', password='pass123', is_approved=True
+            )
+            for i in range(4)
+        ]
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='admin123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+        start = timezone.now() - timedelta(days=3)
+        self.settings = GameSettings.get_settings()
+        self.settings.game_start_date = start - timedelta(days=1)
+        self.settings.current_tag_holder = self.users[0]
+        self.settings.save()
+
+        order = [0, 1, 2, 3, 1, 2, 0, 1]
+        self.tags = []
+        for i, (tagger, tagged) in enumerate(zip(order, order[1:])):
+            with mock.patch('django.utils.timezone.now', return_value=start + timedelta(hours=9 * i + 1)):
+                self.tags.append(GameEngine.process_new_tag(self.users[tagger], self.users[tagged]))
+
+    def test_delete_replays_only_the_suffix(self):
+        """Test that deleting a tag rescores the tags after it and nothing before"""
+        original_score = ScoringReplay.score
+        with mock.patch.object(ScoringReplay, 'score', autospec=True, side_effect=original_score) as score:
+            response = self.client.delete(f'/api/game/tags/{self.tags[2].id}/delete_tag/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(score.call_count, 4)
+
+        # player1 is now caught by tags 0 and 3 only, the gap between them is held time
+        tag = Tag.objects.get(id=self.tags[3].id)
+        self.assertEqual(tag.time_held, self.tags[3].tagged_at - self.tags[0].tagged_at)
+
+        # The suffix result matches a full replay
+        self.assertEqual(GameEngine.rescore_game(self.settings), 0)
+        self.assertEqual(
+            User.objects.get(id=self.users[1].id).total_tags_received,
+            Tag.objects.filter(tagged=self.users[1]).count()
+        )
+
+    def test_delete_latest_tag_returns_the_tag(self):
+        """Test that removing the last handoff gives the tag back"""
+        self.client.delete(f'/api/game/tags/{self.tags[-1].id}/delete_tag/')
+        self.assertEqual(GameEngine.get_current_tag_holder(), self.users[0])
+
+    def test_delete_every_tag_returns_to_configured_holder(self):
+        """Test that an empty tag log gives the tag back to the configured holder"""
+        version = GameEngine.get_holder_state(self.settings).version
+        for tag in reversed(self.tags):
+            self.client.delete(f'/api/game/tags/{tag.id}/delete_tag/')
+        state = GameEngine.get_holder_state(self.settings)
+        self.assertEqual(state.holder, self.users[0])
+        self.assertGreater(state.version, version)
+
+    def test_delete_down_to_one_tag_drops_catch_records(self):
+        """Test that catch records go away with the last gap between tags"""
+        GameEngine.calculate_achievements(self.settings)
+        for tag in reversed(self.tags[1:]):
+            self.client.delete(f'/api/game/tags/{tag.id}/delete_tag/')
+        self.assertFalse(
+            Achievement.objects.filter(achievement_type__in=['fastest_catch', 'slowest_catch']).exists()
+        )
+
+    def test_dispute_and_verify(self):
+        """Test that unverified tags drop out of the scores and come back"""
+        before = {entry['user']: entry['points'] for entry in GameEngine.calculate_leaderboard()}
+        url = f'/api/game/tags/{self.tags[4].id}/verify/'
+
+        self.client.post(url, {'verified': False}, format='json')
+        self.assertEqual(PlayerScore.objects.get(user=self.users[1]).tags_given, 1)
+
+        self.client.post(url)
+        after = {entry['user']: entry['points'] for entry in GameEngine.calculate_leaderboard()}
+        self.assertEqual(after, before)
+
+    def test_correction_is_incremental(self):
+        """Test that corrections move totals and catch records without recomputing every player"""
+        GameEngine.calculate_achievements(self.settings)
+        audit = TotalsAudit(client=mock.Mock(**{'get.return_value': None}))
+
+        def records():
+            return {
+                achievement.achievement_type: (achievement.user_id, achievement.metric)
+                for achievement in Achievement.objects.filter(
+                    achievement_type__in=['fastest_catch', 'slowest_catch']
+                )
+            }
+
+        # The last one splits the slowest catch, another one takes the record
+        for method, url, data in [
+            ('post', f'/api/game/tags/{self.tags[2].id}/verify/', {'verified': False}),
+            ('post', f'/api/game/tags/{self.tags[4].id}/verify/', {'verified': False}),
+            ('post', f'/api/game/tags/{self.tags[2].id}/verify/', None),
+            ('delete', f'/api/game/tags/{self.tags[1].id}/delete_tag/', None),
+        ]:
+            with mock.patch.object(TotalsAudit, 'fix') as fix, \
+                    mock.patch.object(GameEngine, 'calculate_achievements') as calculate:
+                getattr(self.client, method)(url, data, format='json')
+            fix.assert_not_called()
+            calculate.assert_not_called()
+
+            self.assertEqual(audit.run(restart=True)['drifted'], 0)
+            fastest, slowest = CatchIntervals.catch_records(self.settings)
+            self.assertEqual(records(), {
+                'fastest_catch': (Tag.objects.get(id=fastest[0]).tagger_id, fastest[1].total_seconds()),
+                'slowest_catch': (Tag.objects.get(id=slowest[0]).tagged_id, slowest[1].total_seconds()),
+            })
+
+
+class ScoringSimulatorTests(TestCase):
+    """Test what-if standings under candidate scoring rules"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'player{i}', email=f'p{i}@test.com', password='pass123', is_approved=True
+            )
+            for i in range(4)
+        ]
+        start = timezone.now() - timedelta(days=3)
+        self.settings = GameSettings.get_settings()
+        self.settings.game_start_date = start - timedelta(days=1)
+        self.settings.current_tag_holder = self.users[0]
+        self.settings.save()
+
+        order = [0, 1, 2, 3, 1, 0, 2, 1]
+        for i, (tagger, tagged) in enumerate(zip(order, order[1:])):
+            with mock.patch('django.utils.timezone.now', return_value=start + timedelta(hours=9 * i + 1)):
+                GameEngine.process_new_tag(self.users[tagger], self.users[tagged])
+
+    def test_current_settings_match_scores(self):
+        """Test that replaying with unchanged settings gives the stored standings"""
+        GameEngine.rebuild_scores(self.settings)
+        [result] = ScoringSimulator.from_log(self.settings).standings(self.settings, [{}])
+        expected = [(entry['user'].id, entry['points']) for entry in GameEngine.calculate_leaderboard()]
+        self.assertEqual([(entry['user_id'], entry['points']) for entry in result['standings']], expected)
+
+    def test_candidates_are_independent(self):
+        """Test that each candidate is scored on its own and nothing is saved"""
+        points = list(Tag.objects.order_by('id').values_list('points_awarded', 'time_penalty'))
+        totals = list(User.objects.order_by('id').values_list('total_points', flat=True))
+
+        simulator = ScoringSimulator.from_log(self.settings)
+        base, harsh = simulator.standings(self.settings, [{}, {'time_penalty_per_hour': 100}])
+        self.assertEqual(harsh['settings']['time_penalty_per_hour'], 100)
+        self.assertEqual(harsh['settings']['tag_points_rank_1'], self.settings.tag_points_rank_1)
+        self.assertLess(
+            sum(entry['points'] for entry in harsh['standings']),
+            sum(entry['points'] for entry in base['standings'])
+        )
+        # Running a candidate alone gives the same standings
+        self.assertEqual(
+            simulator.standings(self.settings, [{'time_penalty_per_hour': 100}])[0], harsh
+        )
+
+        self.assertEqual(list(Tag.objects.order_by('id').values_list('points_awarded', 'time_penalty')), points)
+        self.assertEqual(list(User.objects.order_by('id').values_list('total_points', flat=True)), totals)
+
+    def test_invalid_candidates(self):
+        """Test that unknown fields and non-integer values are rejected"""
+        simulator = ScoringSimulator.from_log(self.settings)
+        for candidates in ([], {'time_penalty_per_hour': 1}, [{'name': 'x'}], [{'bonus_untagged_day': '5'}], [3]):
+            with self.assertRaises(ValueError):
+                simulator.standings(self.settings, candidates)
+
+    def test_simulate_endpoint(self):
+        """Test that admins can compare candidates over the API"""
+        admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='admin123')
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        response = client.post(
+            '/api/game/settings/simulate/',
+            {'candidates': [{}, {'tag_points_rank_1': 50}]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['candidates']), 2)
+        self.assertEqual(len(response.data['candidates'][0]['standings']), 4)
+
+        response = client.post('/api/game/settings/simulate/', {'candidates': [{'points': 1}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_simulate_command(self):
+        """Test that the command prints standings per candidate"""
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as file:
+            json.dump([{}, {'time_penalty_per_hour': 0}], file)
+        self.addCleanup(os.remove, file.name)
+
+        out = StringIO()
+        call_command('simulate_scoring', file.name, '--top', '2', stdout=out)
+        self.assertIn('Candidate 2: time_penalty_per_hour=0', out.getvalue())
+        self.assertEqual(out.getvalue().count('player'), 4)
+
+        inline = StringIO()
+        call_command('simulate_scoring', '[{}, {"time_penalty_per_hour": 0}]', '--top', '2', stdout=inline)
+        self.assertEqual(inline.getvalue(), out.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('simulate_scoring', 'missing.json', stdout=StringIO())
+
+
+class TotalsAuditTests(TestCase):
+    """Test the consistency audit of the denormalized User totals"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'player{i}', email=f'p{i}@test.com', password='pass123', is_approved=True
+            )
+            for i in range(4)
+        ]
+        start = timezone.now() - timedelta(days=2)
+        self.settings = GameSettings.get_settings()
+        self.settings.game_start_date = start - timedelta(days=1)
+        self.settings.current_tag_holder = self.users[0]
+        self.settings.save()
+
+        order = [0, 1, 2, 3, 1, 0]
+        for i, (tagger, tagged) in enumerate(zip(order, order[1:])):
+            with mock.patch('django.utils.timezone.now', return_value=start + timedelta(hours=5 * i + 1)):
+                GameEngine.process_new_tag(self.users[tagger], self.users[tagged])
+
+        # Dict-backed stand-in for Redis
+        self.store = {}
+        self.client = mock.Mock()
+        self.client.get.side_effect = self.store.get
+        self.client.set.side_effect = self.store.__setitem__
+
+    def test_live_tags_have_no_drift(self):
+        """Test that totals maintained by process_new_tag pass the audit"""
+        report = TotalsAudit(client=self.client).run()
+        self.assertTrue(report['complete'])
+        self.assertEqual(report['checked'], 4)
+        self.assertEqual(report['drifted'], 0)
+
+    def test_drift_is_reported_and_repaired(self):
+        """Test that corrupted totals are reported and fixed on repair"""
+        user = self.users[1]
+        User.objects.filter(id=user.id).update(
+            total_points=F('total_points') + 7,
+            total_time_held=F('total_time_held') - timedelta(hours=1),
+        )
+
+        report = TotalsAudit(client=self.client).run()
+        self.assertEqual(report['drifted'], 1)
+        self.assertEqual(report['repaired'], 0)
+        self.assertEqual(report['players'], [{'user_id': user.id, 'total_points': -7, 'total_time_held': 3600.0}])
+        self.assertEqual(report['drift']['total_points'], 7)
+
+        report = TotalsAudit(client=self.client).run(repair=True)
+        self.assertEqual(report['repaired'], 1)
+        self.assertEqual(TotalsAudit(client=self.client).run()['drifted'], 0)
+
+        user.refresh_from_db()
+        received = Tag.objects.filter(tagged=user)
+        self.assertEqual(
+            user.total_points,
+            sum(tag.points_awarded for tag in Tag.objects.filter(tagger=user))
+            - sum(tag.time_penalty for tag in received)
+        )
+        self.assertEqual(user.total_time_held, sum((tag.time_held for tag in received), timedelta()))
+
+    def test_time_budget_resumes_pass(self):
+        """Test that a run stops at the budget and the next one continues"""
+        User.objects.filter(id=self.users[3].id).update(total_tags_given=9)
+        audit = TotalsAudit(chunk_size=1, time_budget=0, client=self.client)
+
+        runs = []
+        while not runs or not runs[-1]['complete']:
+            runs.append(audit.run(repair=True))
+        self.assertEqual([run['checked'] for run in runs], [1, 2, 3, 4, 4])
+        self.assertEqual(runs[-1]['repaired'], 1)
+        self.assertEqual(json.loads(self.store[TotalsAudit.REPORT_KEY]), runs[-1])
+
+        # A finished pass starts over
+        self.assertEqual(audit.run()['checked'], 1)
+
+    def test_audit_command_and_report(self):
+        """Test the management command and the admin report"""
+        User.objects.filter(id=self.users[2].id).update(total_tags_received=0)
+        out = StringIO()
+        with mock.patch('game.audit.get_redis', return_value=self.client):
+            call_command('audit_totals', '--repair', stdout=out)
+
+            admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='admin123')
+            client = APIClient()
+            client.force_authenticate(user=admin)
+            response = client.get('/api/game/settings/audit/')
+        self.assertIn(f'User {self.users[2].id}: total_tags_received=+', out.getvalue())
+        self.assertIn('1 drifted, 1 repaired', out.getvalue())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['repaired'], 1)
+
+
+class MultiGameTests(TestCase):
+    """Test games played side by side"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'player{i}', email=f'p{i}@test.com', password='pass123', is_approved=True
+            )
+            for i in range(4)
+        ]
+        self.game = GameSettings.get_settings()
+        self.game.game_start_date = timezone.now() - timedelta(days=1)
+        self.game.current_tag_holder = self.users[0]
+        self.game.save()
+        self.other = GameSettings.objects.create(
+            name='Office league',
+            game_start_date=timezone.now() - timedelta(days=1),
+            game_end_date=timezone.now() + timedelta(days=10),
+            current_tag_holder=self.users[3],
+        )
+
+        GameEngine.process_new_tag(self.users[0], self.users[1])
+        GameEngine.process_new_tag(self.users[1], self.users[2])
+        GameEngine.process_new_tag(self.users[3], self.users[0], settings=self.other)
+
+    def test_games_are_independent(self):
+        """Test that tags, holders, scores and achievements stay within their game"""
+        self.assertEqual(Tag.objects.filter(game=self.game).count(), 2)
+        self.assertEqual(Tag.objects.filter(game=self.other).count(), 1)
+        self.assertEqual(GameEngine.get_current_tag_holder(self.game), self.users[2])
+        self.assertEqual(GameEngine.get_current_tag_holder(self.other), self.users[0])
+
+        given = {entry['user']: entry['tags_given'] for entry in GameEngine.calculate_leaderboard(self.other)}
+        self.assertEqual(given, {self.users[0]: 0, self.users[1]: 0, self.users[2]: 0, self.users[3]: 1})
+
+        GameEngine.calculate_achievements(self.game)
+        GameEngine.calculate_achievements(self.other)
+        self.assertEqual(
+            Achievement.objects.get(game=self.other, achievement_type='most_tags_given').user, self.users[3]
+        )
+        self.assertEqual(
+            Achievement.objects.filter(game=self.game, achievement_type='most_tags_given').count(), 1
+        )
+
+        # User totals span both games
+        self.users[0].refresh_from_db()
+        self.assertEqual(self.users[0].total_tags_given, 1)
+        self.assertEqual(self.users[0].total_tags_received, 1)
+
+    def test_rescore_keeps_other_games(self):
+        """Test that rescoring a game leaves the tags and totals of the other one"""
+        self.other.tag_points_rank_1 = 7
+        self.other.save()
+
+        before = list(Tag.objects.filter(game=self.game).values_list('points_awarded', flat=True))
+        GameEngine.rescore_game(self.other)
+
+        self.assertEqual(Tag.objects.get(game=self.other).points_awarded, 7)
+        self.assertEqual(list(Tag.objects.filter(game=self.game).values_list('points_awarded', flat=True)), before)
+        self.assertEqual(TotalsAudit(client=mock.Mock(**{'get.return_value': None})).run()['drifted'], 0)
+
+    def test_api_is_scoped_by_game(self):
+        """Test that ?game= selects the game and the current one is the default"""
+        client = APIClient()
+        client.force_authenticate(user=self.users[0])
+
+        response = client.get('/api/game/tags/', {'game': self.other.pk})
+        self.assertEqual([tag['game'] for tag in response.data['results']], [self.other.pk])
+        response = client.get('/api/game/tags/')
+        self.assertEqual({tag['game'] for tag in response.data['results']}, {self.game.pk})
+        self.assertEqual(client.get('/api/game/tags/', {'game': 999}).status_code, status.HTTP_404_NOT_FOUND)
+
+        # player0 holds the tag only in the other game
+        with mock.patch('game.views.send_tag_notification'), mock.patch('game.views.schedule_derived_update'):
+            response = client.post(
+                f'/api/game/tags/create_tag/?game={self.other.pk}', {'tagged_user_id': self.users[1].id},
+                format='json'
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            response = client.post('/api/game/tags/create_tag/', {'tagged_user_id': self.users[1].id}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_current_game(self):
+        """Test that only one game is current"""
+        self.other.is_current = True
+        self.other.save()
+        self.assertEqual(GameSettings.get_settings().pk, self.other.pk)
+        self.assertFalse(GameSettings.objects.get(pk=self.game.pk).is_current)
+
+    def test_websocket_group_per_game(self):
+        """Test that sockets only receive the events of their game"""
+        async def receive(path, game):
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await get_channel_layer().group_send(
+                game.group_name, encode_frame({'type': 'game_update', 'data': game.pk})
+            )
+            message = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return message
+
+        self.assertEqual(async_to_sync(receive)(f'/ws/game/{self.other.pk}/', self.other)['data'], self.other.pk)
+        self.assertEqual(async_to_sync(receive)('/ws/game/', self.game)['data'], self.game.pk)
+
+
+class LeaderboardFeedTests(TestCase):
+    """Test versioned leaderboard patches pushed over the WebSocket"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'player{i}', email=f'p{i}@test.com', password='pass123', is_approved=True
+            )
+            for i in range(3)
+        ]
+        self.settings = GameSettings.get_settings()
+        self.settings.current_tag_holder = self.users[0]
+        self.settings.save()
+
+        # Dict-backed Redis client
+        self.store = {}
+        self.lists = {}
+        self.client = mock.MagicMock()
+        self.client.pipeline.return_value = self.client
+        self.client.get.side_effect = self.store.get
+        self.client.set.side_effect = lambda key, value, **kwargs: self.store.__setitem__(key, value)
+        self.client.lpush.side_effect = lambda key, value: self.lists.setdefault(key, []).insert(0, value)
+        self.client.ltrim.side_effect = lambda key, start, stop: self.lists.__setitem__(
+            key, self.lists.get(key, [])[start:stop + 1]
+        )
+        self.client.lrange.side_effect = lambda key, start, stop: self.lists.get(key, [])[start:stop + 1]
+        self.client.delete.side_effect = lambda key: self.lists.pop(key, None)
+        self.feed = LeaderboardFeed(self.settings, client=self.client)
+
+    def leaderboard(self):
+        return json.loads(json.dumps(
+            LeaderboardSerializer(GameEngine.calculate_leaderboard(self.settings), many=True).data
+        ))
+
+    def test_publish_sends_changed_entries(self):
+        """Test that the first publish is the full leaderboard and later ones are patches"""
+        first = self.feed.publish(self.leaderboard())
+        self.assertEqual(first['type'], 'leaderboard_update')
+        self.assertEqual(first['version'], 1)
+        self.assertIsNone(self.feed.publish(self.leaderboard()))
+
+        GameEngine.process_new_tag(self.users[0], self.users[1])
+        patch = self.feed.publish(self.leaderboard())
+        self.assertEqual((patch['type'], patch['version'], patch['base']), ('leaderboard_patch', 2, 1))
+        changed = {entry['user_id']: entry for entry in patch['changed']}
+        # Only the untagged-day bonus of player2 changed
+        self.assertEqual(set(changed[self.users[2].id]), {'user_id', 'rank', 'points'})
+        self.assertEqual(
+            set(changed[self.users[0].id]['user']), {'total_tags_given', 'total_points'}
+        )
+
+        # Applying the patch gives the published leaderboard
+        entries = {entry['user']['id']: entry for entry in first['data']}
+        for entry in patch['changed']:
+            entry = dict(entry)
+            current = entries[entry.pop('user_id')]
+            current['user'] = {**current['user'], **entry.pop('user', {})}
+            current.update(entry)
+        self.assertEqual(
+            sorted(entries.values(), key=lambda entry: entry['rank']), self.feed.snapshot()['data']
+        )
+
+    def test_diff_new_and_removed_players(self):
+        """Test that new players get their whole entry and dropped ones are removed"""
+        old = self.leaderboard()
+        self.users[2].is_participating = False
+        self.users[2].save()
+        newcomer = User.objects.create_user(
+            username='newcomer', email='new@test.com', password='pass123', is_approved=True
+        )
+
+        changed, removed = LeaderboardFeed.diff(old, self.leaderboard())
+        self.assertEqual(removed, [self.users[2].id])
+        entry = next(entry for entry in changed if entry['user_id'] == newcomer.id)
+        self.assertEqual(entry['user']['username'], 'newcomer')
+
+    def test_since(self):
+        """Test that clients catch up from patches, or get the full leaderboard when too far behind"""
+        self.assertIsNone(self.feed.since(None))
+        self.feed.publish(self.leaderboard())
+        for tagger, tagged in [(0, 1), (1, 2), (2, 0)]:
+            GameEngine.process_new_tag(self.users[tagger], self.users[tagged])
+            self.feed.publish(self.leaderboard())
+
+        self.assertEqual(self.feed.since(4), [])
+        self.assertEqual([message['version'] for message in self.feed.since(2)], [3, 4])
+        self.assertEqual([message['type'] for message in self.feed.since(None)], ['leaderboard_update'])
+        with mock.patch.object(LeaderboardFeed, 'HISTORY', 1):
+            self.assertEqual([message['type'] for message in self.feed.since(2)], ['leaderboard_update'])
+
+    def test_task_broadcasts_patch(self):
+        """Test that the derived state update sends a patch to the game's group"""
+        self.feed.publish(self.leaderboard())
+        tag = GameEngine.process_new_tag(self.users[0], self.users[1])
+
+        async def broadcast():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/game/')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await database_sync_to_async(update_derived_state)(self.settings.pk, [tag.id])
+            patch = await communicator.receive_json_from()
+
+            await communicator.send_json_to({'type': 'leaderboard_sync', 'version': None})
+            snapshot = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return patch, snapshot
+
+        with mock.patch('game.feed.get_redis', return_value=self.client):
+            patch, snapshot = async_to_sync(broadcast)()
+        self.assertEqual((patch['type'], patch['base']), ('leaderboard_patch', 1))
+        self.assertEqual((snapshot['type'], snapshot['version']), ('leaderboard_update', 2))
+
+
+class BroadcastTests(TestCase):
+    """Test that broadcast frames are encoded once for every socket"""
+
+    SOCKETS = 20
+
+    def test_frame_encoded_once(self):
+        """Test that every socket gets the publisher's text without encoding it again"""
+        game = GameSettings.get_settings()
+        message = {'type': 'new_tag', 'data': {'tag_id': 1, 'message': 'Chytený!'}}
+
+        async def receive_all():
+            communicators = [
+                WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/game/')
+                for _ in range(self.SOCKETS)
+            ]
+            for communicator in communicators:
+                connected, _ = await communicator.connect()
+                self.assertTrue(connected)
+            await sync_to_async(broadcast)(game.group_name, message)
+            frames = [await communicator.receive_from() for communicator in communicators]
+            for communicator in communicators:
+                await communicator.disconnect()
+            return frames
+
+        expected = json.dumps(message)
+        with mock.patch('json.dumps', wraps=json.dumps) as dumps:
+            frames = async_to_sync(receive_all)()
+        self.assertEqual(dumps.call_count, 1)
+        self.assertEqual(frames, [expected] * self.SOCKETS)
+
+    def test_fanout_at_scale(self):
+        """Test that a burst reaches many sockets in order, and how fast"""
+        sockets, burst = 200, 20
+        game = GameSettings.get_settings()
+
+        async def receive_all():
+            communicators = [
+                WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/game/')
+                for _ in range(sockets)
+            ]
+            await asyncio.gather(*(communicator.connect(timeout=60) for communicator in communicators))
+            began = time.perf_counter()
+            for seq in range(1, burst + 1):
+                await sync_to_async(broadcast)(game.group_name, {'type': 'new_tag', 'seq': seq})
+
+            async def receive(communicator):
+                return [json.loads(await communicator.receive_from(timeout=30))['seq'] for _ in range(burst)]
+
+            received = await asyncio.gather(*(receive(communicator) for communicator in communicators))
+            elapsed = time.perf_counter() - began
+            await asyncio.gather(*(communicator.disconnect() for communicator in communicators))
+            return received, elapsed
+
+        with mock.patch('json.dumps', wraps=json.dumps) as dumps:
+            received, elapsed = async_to_sync(receive_all)()
+        self.assertEqual(dumps.call_count, burst)
+        self.assertEqual(received, [list(range(1, burst + 1))] * sockets)
+        rate = sockets * burst / elapsed
+        self.assertLess(elapsed, 15, f'{elapsed:.2f}s for {sockets * burst} frames, {rate:.0f} frames/s')
+
+
+class PlayerSocketTests(TestCase):
+    """Test JWT-authenticated sockets and the events sent to one player"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'player{i}', email=f'p{i}@test.com', password='pass123', is_approved=True
+            )
+            for i in range(3)
+        ]
+        self.settings = GameSettings.get_settings()
+        self.settings.current_tag_holder = self.users[0]
+        self.settings.save()
+        self.application = JWTAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+
+    def connect(self, user=None, token=None):
+        if user is not None:
+            token = str(RefreshToken.for_user(user).access_token)
+        path = f'/ws/game/?token={token}' if token else '/ws/game/'
+        return WebsocketCommunicator(self.application, path)
+
+    def test_token_joins_player_group(self):
+        """Test that a valid token gets the unread count and the player's events"""
+        Notification.objects.create(user=self.users[1], notification_type='custom', title='Hi', message='Hi')
+
+        async def events():
+            communicator = self.connect(self.users[1])
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            unread = await communicator.receive_json_from()
+            await sync_to_async(broadcast)(self.users[1].group_name, {'type': 'profile', 'data': {}})
+            profile = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return unread, profile
+
+        unread, profile = async_to_sync(events)()
+        self.assertEqual(unread, {'type': 'unread_count', 'data': {'count': 1}})
+        self.assertEqual(profile['type'], 'profile')
+
+    def test_invalid_token_is_anonymous(self):
+        """Test that sockets without a valid token only get game broadcasts"""
+        async def events():
+            communicator = self.connect(token='not-a-token')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await sync_to_async(broadcast)(self.users[1].group_name, {'type': 'profile', 'data': {}})
+            await sync_to_async(broadcast)(self.settings.group_name, {'type': 'game_update', 'data': None})
+            message = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return message
+
+        self.assertEqual(async_to_sync(events)()['type'], 'game_update')
+
+    def test_session_only_without_token(self):
+        """Test that the session is only looked up for sockets without a token"""
+        async def connect(communicator):
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.disconnect()
+
+        with mock.patch('channels.auth.get_user', return_value=AnonymousUser()) as session_user:
+            async_to_sync(connect)(self.connect(self.users[1]))
+            async_to_sync(connect)(self.connect(token='not-a-token'))
+            session_user.assert_not_called()
+            async_to_sync(connect)(self.connect())
+        session_user.assert_called_once()
+
+    def test_tag_events(self):
+        """Test that a tag reaches the tagged player and the notified players"""
+        tag = GameEngine.process_new_tag(self.users[0], self.users[1])
+
+        async def events():
+            tagged = self.connect(self.users[1])
+            watcher = self.connect(self.users[2])
+            for communicator in (tagged, watcher):
+                connected, _ = await communicator.connect()
+                self.assertTrue(connected)
+                await communicator.receive_json_from()
+            await database_sync_to_async(send_tag_notification)(tag.id)
+
+            received = []
+            for communicator in (tagged, watcher):
+                types = []
+                while not await communicator.receive_nothing():
+                    types.append((await communicator.receive_json_from())['type'])
+                received.append(types)
+                await communicator.disconnect()
+            return received
+
+        tagged, watcher = async_to_sync(events)()
+        self.assertEqual(tagged, ['new_tag', 'tagged', 'profile', 'notification', 'unread_count'])
+        self.assertEqual(watcher, ['new_tag', 'notification', 'unread_count'])
+
+    def test_new_tag_carries_holder(self):
+        """Test that new_tag frames carry the new holder and the tag, even without notifications"""
+        self.settings.enable_notifications = False
+        self.settings.save()
+        tag = GameEngine.process_new_tag(self.users[0], self.users[1])
+
+        with mock.patch('game.broadcast.async_to_sync') as send:
+            send_tag_notification(tag.id)
+        frame = json.loads(send.return_value.call_args.args[1]['text'])
+        self.assertEqual(frame['type'], 'new_tag')
+        self.assertEqual(frame['holder']['user']['id'], self.users[1].id)
+        self.assertEqual(frame['data']['tag']['id'], tag.id)
+        self.assertEqual(frame['data']['tag']['tagged_name'], self.users[1].full_name)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_mark_all_read_pushes_count(self):
+        """Test that reading notifications pushes the new unread count"""
+        Notification.objects.create(user=self.users[1], notification_type='custom', title='Hi', message='Hi')
+        client = APIClient()
+        client.force_authenticate(user=self.users[1])
+
+        with mock.patch('notifications.live.broadcast') as push:
+            client.post('/api/notifications/mark_all_read/')
+        push.assert_called_once_with(self.users[1].group_name, {'type': 'unread_count', 'data': {'count': 0}})
+
+    def test_new_achievement_holder_is_told(self):
+        """Test that achievements going to a new holder are pushed to them"""
+        tag = GameEngine.process_new_tag(self.users[0], self.users[1])
+        def pushed():
+            with mock.patch('game.game_engine.broadcast') as push, \
+                    self.captureOnCommitCallbacks(execute=True):
+                GameEngine.update_derived_state([tag.id], self.settings)
+            return {(group, message['data']['achievement_type']) for (group, message), _ in push.call_args_list}
+
+        first = pushed()
+        self.assertIn((self.users[0].group_name, 'most_tags_given'), first)
+        self.assertIn((self.users[1].group_name, 'most_tags_received'), first)
+
+        # Holders that keep their achievements are not told again
+        self.assertNotIn((self.users[0].group_name, 'most_tags_given'), pushed())
+
+
+class GameStreamTests(TestCase):
+    """Test sequenced game frames and the replay of missed ones"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'player{i}', email=f'p{i}@test.com', password='pass123', is_approved=True
+            )
+            for i in range(2)
+        ]
+        self.settings = GameSettings.get_settings()
+        self.settings.current_tag_holder = self.users[0]
+        self.settings.save()
+
+        # Redis client keeping the stream in a list
+        self.seq = 0
+        self.entries = []
+        self.client = mock.MagicMock()
+        self.client.incr.side_effect = self.incr
+        self.client.get.side_effect = lambda key: str(self.seq).encode() if key.endswith(':seq') else None
+        self.client.xadd.side_effect = self.xadd
+        self.client.xrange.side_effect = lambda key, min: [
+            entry for entry in self.entries if int(entry[0].split(b'-')[0]) >= int(min.split('-')[0])
+        ]
+        self.stream = GameStream(self.settings, client=self.client)
+
+    def incr(self, key):
+        self.seq += 1
+        return self.seq
+
+    def xadd(self, key, fields, id, maxlen, approximate):
+        self.entries.append((id.encode(), {name.encode(): value.encode() for name, value in fields.items()}))
+        self.entries = self.entries[-maxlen:]
+
+    def publish(self, count):
+        for i in range(count):
+            self.stream.publish({'type': 'game_update', 'data': i})
+
+    def test_replay_missed_frames(self):
+        """Test that frames carry increasing seqs and the missed ones are replayed"""
+        self.publish(5)
+        self.assertEqual(self.stream.since(5), [])
+        self.assertEqual([json.loads(frame)['seq'] for frame in self.stream.since(2)], [3, 4, 5])
+        self.assertEqual(json.loads(self.stream.since(4)[0]), {'type': 'game_update', 'data': 4, 'seq': 5})
+        self.assertIsNone(self.stream.since(7))
+
+    def test_gap_too_large(self):
+        """Test that frames trimmed from the stream cannot be replayed"""
+        with mock.patch.object(GameStream, 'LENGTH', 3):
+            self.publish(6)
+            self.assertIsNone(self.stream.since(1))
+            self.assertEqual(len(self.stream.since(3)), 3)
+
+    def test_send_under_lock(self):
+        """Test that frames reach the group before the lock is released, in seq order"""
+        calls = []
+        self.client.lock.return_value.__exit__.side_effect = lambda *args: calls.append('release')
+        layer = mock.MagicMock()
+        layer.group_send = mock.AsyncMock(side_effect=lambda group, event: calls.append(event['seq']))
+        with mock.patch('game.broadcast.get_channel_layer', return_value=layer):
+            self.publish(2)
+        self.assertEqual(calls, [1, 'release', 2, 'release'])
+
+    def test_reconnect_with_last_seq(self):
+        """Test that sockets resume from last_seq or get a snapshot"""
+        GameEngine.process_new_tag(self.users[0], self.users[1])
+        with mock.patch('game.broadcast.get_redis', return_value=self.client):
+            self.publish(3)
+
+        async def receive(path):
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            messages = []
+            while not await communicator.receive_nothing():
+                messages.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return messages
+
+        with mock.patch('game.broadcast.get_redis', return_value=self.client), \
+                mock.patch('game.feed.get_redis', side_effect=RedisError):
+            replayed = async_to_sync(receive)('/ws/game/?last_seq=1')
+            snapshot, = async_to_sync(receive)('/ws/game/?last_seq=99')
+
+        self.assertEqual([message['seq'] for message in replayed], [2, 3])
+        self.assertEqual((snapshot['type'], snapshot['seq']), ('snapshot', 3))
+        self.assertEqual(snapshot['data']['holder']['user']['id'], self.users[1].id)
+        self.assertEqual([tag['tagged'] for tag in snapshot['data']['recent_tags']], [self.users[1].full_name])
+        self.assertEqual(len(snapshot['data']['leaderboard']['data']), 2)
+
+
+class OutboxTests(TestCase):
+    """Test bounded socket queues, frame coalescing and slow socket closing"""
+
+    def setUp(self):
+        self.metrics = SocketMetrics()
+        self.outbox = Outbox(metrics=self.metrics)
+
+    def texts(self):
+        return [frame['text_data'] for _, _, frame in self.outbox.frames]
+
+    def test_leaderboard_update_supersedes_queued_frames(self):
+        """Test that a full leaderboard replaces queued leaderboard frames only"""
+        self.outbox.put('patch 1', 'leaderboard_patch', 1)
+        self.outbox.put('tag 2', 'new_tag', 2)
+        self.outbox.put('patch 3', 'leaderboard_patch', 3)
+        self.outbox.put('update 4', 'leaderboard_update', 4)
+
+        coalesced, *rest = self.texts()
+        self.assertEqual(json.loads(coalesced), {'type': 'coalesced', 'seqs': [1, 3]})
+        self.assertEqual(rest, ['tag 2', 'update 4'])
+        self.assertEqual((self.metrics.coalesced, self.metrics.queued), (2, 3))
+
+    def test_full_queue_drops_and_becomes_overdue(self):
+        """Test that a full queue drops frames and is overdue after the grace period"""
+        with mock.patch.object(Outbox, 'MAX_FRAMES', 2):
+            self.assertTrue(self.outbox.put('tag 1', 'new_tag', 1))
+            self.assertTrue(self.outbox.put('tag 2', 'new_tag', 2))
+            with mock.patch('game.outbox.time.monotonic', return_value=100):
+                self.assertFalse(self.outbox.put('tag 3', 'new_tag', 3))
+            self.assertEqual((self.metrics.dropped, self.metrics.max_queue_depth), (1, 2))
+
+            with mock.patch('game.outbox.time.monotonic', return_value=100 + Outbox.GRACE + 1):
+                self.assertTrue(self.outbox.overdue())
+
+            async_to_sync(self.outbox.get)()
+            self.assertTrue(self.outbox.put('tag 4', 'new_tag', 4))
+            self.assertFalse(self.outbox.overdue())
+
+    def test_lagging_client_becomes_overdue(self):
+        """Test that a client acknowledging too few frames is overdue although the queue drains"""
+        with mock.patch.object(Outbox, 'MAX_FRAMES', 2):
+            for seq in range(1, 4):
+                self.outbox.put(f'tag {seq}', 'new_tag', seq)
+                async_to_sync(self.outbox.get)()
+            # Clients that never acknowledge are not judged by their lag
+            self.assertEqual(self.outbox.lag(), 0)
+
+            self.outbox.ack(1)
+            self.outbox.put('tag 4', 'new_tag', 4)
+            with mock.patch('game.outbox.time.monotonic', return_value=100):
+                async_to_sync(self.outbox.get)()
+            self.assertEqual(self.outbox.lag(), 3)
+            with mock.patch('game.outbox.time.monotonic', return_value=100 + Outbox.GRACE + 1):
+                self.assertTrue(self.outbox.overdue())
+
+            self.outbox.ack(3)
+            self.assertFalse(self.outbox.overdue())
+
+    def test_slow_socket_is_closed(self):
+        """Test that a socket that stops reading is closed without holding up the others"""
+        stalled = asyncio.Event()
+        original_write = GameConsumer.write
+
+        async def write(consumer):
+            if consumer.scope['query_string'] == b'slow=1':
+                await stalled.wait()
+            await original_write(consumer)
+
+        group = GameSettings.get_settings().group_name
+
+        async def run():
+            slow = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/game/?slow=1')
+            fast = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/game/')
+            for communicator in (slow, fast):
+                connected, _ = await communicator.connect()
+                self.assertTrue(connected)
+            for i in range(4):
+                await get_channel_layer().group_send(group, encode_frame({'type': 'new_tag', 'data': i}))
+            received = [(await fast.receive_json_from())['data'] for _ in range(4)]
+            closed = await slow.receive_output()
+            await fast.disconnect()
+            await slow.wait()
+            return received, closed
+
+        before = socket_metrics.slow_disconnects
+        with mock.patch.object(GameConsumer, 'write', write), \
+                mock.patch.object(Outbox, 'MAX_FRAMES', 2), mock.patch.object(Outbox, 'GRACE', -1):
+            received, closed = async_to_sync(run)()
+        self.assertEqual(received, [0, 1, 2, 3])
+        self.assertEqual(closed, {'type': 'websocket.close', 'code': GameConsumer.SLOW_CLOSE_CODE})
+        self.assertEqual(socket_metrics.slow_disconnects, before + 1)
+
+    def test_unacknowledging_socket_is_closed(self):
+        """Test that a socket whose client stops acknowledging is closed while sends still succeed"""
+        group = GameSettings.get_settings().group_name
+
+        async def run():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/game/')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.send_json_to({'type': 'ack', 'seq': 0})
+            await communicator.send_json_to({'type': 'ping'})
+            await communicator.receive_json_from()
+
+            seqs = []
+            for seq in range(1, 5):
+                await get_channel_layer().group_send(group, encode_frame({'type': 'new_tag', 'seq': seq}))
+                output = await communicator.receive_output()
+                if output['type'] == 'websocket.close':
+                    break
+                seqs.append(json.loads(output['text'])['seq'])
+            await communicator.wait()
+            return seqs, output
+
+        with mock.patch.object(Outbox, 'MAX_FRAMES', 2), mock.patch.object(Outbox, 'GRACE', -1):
+            seqs, closed = async_to_sync(run)()
+        self.assertEqual(seqs, [1, 2, 3])
+        self.assertEqual(closed, {'type': 'websocket.close', 'code': GameConsumer.SLOW_CLOSE_CODE})
+
+
+@skipUnless(connection.features.has_select_for_update, 'Row locks are not supported')
+class ConcurrentTagTests(TransactionTestCase):
+    """Test tag handoffs under concurrent submitters"""
+
+    SUBMITTERS = 8
+    ROUNDS = 10
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'player{i}', email=f'p{i}@test.com', password='pass123', is_approved=True
+            )
+            for i in range(self.SUBMITTERS + 1)
+        ]
+        self.settings = GameSettings.get_settings()
+        self.settings.current_tag_holder = self.users[0]
+        self.settings.save()
+        GameEngine.rebuild_scores(self.settings)
+        try:
+            HolderCache(self.settings).clear()
+        except RedisError:
+            pass
+
+    def attempt(self, tagger, tagged, version):
+        start = time.perf_counter()
+        try:
+            GameEngine.process_new_tag(tagger, tagged, expected_version=version)
+            won = True
+        except HolderConflict:
+            won = False
+        finally:
+            connection.close()
+        return won, time.perf_counter() - start
+
+    def test_one_winner_per_handoff(self):
+        """Test that exactly one of many simultaneous tags wins, and how fast losers fail"""
+        latencies = []
+        began = time.perf_counter()
+        with ThreadPoolExecutor(self.SUBMITTERS) as pool:
+            for _ in range(self.ROUNDS):
+                state = GameEngine.get_holder_state(self.settings)
+                targets = [user for user in self.users if user.id != state.holder_id]
+                results = list(pool.map(
+                    lambda tagged: self.attempt(state.holder, tagged, state.version), targets
+                ))
+                self.assertEqual(sum(won for won, _ in results), 1)
+                latencies.extend(latency for _, latency in results)
+        elapsed = time.perf_counter() - began
+
+        self.assertEqual(Tag.objects.count(), self.ROUNDS)
+        self.assertEqual(GameEngine.get_holder_state(self.settings).version, self.ROUNDS)
+
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        throughput = len(latencies) / elapsed
+        self.assertLess(p99, 2, f'p99 {p99:.3f}s at {throughput:.0f} attempts/s')
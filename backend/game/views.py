@@ -1,20 +1,43 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
+from celery.result import AsyncResult
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time, timedelta
 from .models import GameSettings, Tag, Achievement, PlayerStats
 from .serializers import (
     GameSettingsSerializer, TagSerializer, CreateTagSerializer,
     AchievementSerializer, PlayerStatsSerializer, LeaderboardSerializer
 )
-from .game_engine import GameEngine
+from .game_engine import GameEngine, HolderConflict
+from .tasks import schedule_derived_update, rescore_game
+from .stats import StatsSeries
+from .simulator import ScoringSimulator
+from .audit import TotalsAudit
+from .outbox import socket_metrics
 from notifications.tasks import send_tag_notification
 
 User = get_user_model()
 
 
-class GameSettingsViewSet(viewsets.ModelViewSet):
+class GameScopedMixin:
+    """Game of the request, ``?game=<id>`` or the current game"""
+    
+    def get_game(self):
+        if not hasattr(self, '_game'):
+            game_id = self.request.query_params.get('game')
+            try:
+                self._game = GameSettings.get_game(game_id) if game_id else GameSettings.get_settings()
+            except (GameSettings.DoesNotExist, ValueError):
+                raise NotFound('Game not found')
+        return self._game
+
+
+class GameSettingsViewSet(GameScopedMixin, viewsets.ModelViewSet):
     queryset = GameSettings.objects.all()
     serializer_class = GameSettingsSerializer
     
@@ -33,7 +56,7 @@ class GameSettingsViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
     def rules(self, request):
         """Get game rules and scoring as public info"""
-        settings = GameSettings.get_settings()
+        settings = self.get_game()
         return Response({
             'rules': 'Tagging Game - Tag the player who is currently holding the tag to earn points!',
             'game_period': {
@@ -56,16 +79,75 @@ class GameSettingsViewSet(viewsets.ModelViewSet):
             }
         })
     
+    @action(detail=False, methods=['post'])
+    def rescore(self, request):
+        """Start rescoring all tags of the game under its current rules"""
+        result = rescore_game.delay(self.get_game().pk)
+        return Response({'task_id': result.id}, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=False, methods=['get'], url_path=r'rescore/(?P<task_id>[\w-]+)')
+    def rescore_status(self, request, task_id=None):
+        """Progress of a rescore started with the rescore action"""
+        result = AsyncResult(task_id)
+        data = {'task_id': task_id, 'state': result.state}
+        if result.state == 'PROGRESS':
+            data.update(result.info)
+        elif result.successful():
+            data.update(result.result)
+        elif result.failed():
+            data['error'] = str(result.result)
+        return Response(data)
+    
+    @action(detail=False, methods=['post'])
+    def simulate(self, request):
+        """Final standings of this game under candidate settings, nothing is saved"""
+        try:
+            game = self.get_game()
+            results = ScoringSimulator.from_log(game).standings(game, request.data.get('candidates'))
+        except ValueError as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({'candidates': results})
+    
+    @action(detail=False, methods=['get'])
+    def audit(self, request):
+        """Report of the latest consistency audit of the player totals"""
+        return Response(TotalsAudit().report() or {})
+    
+    @action(detail=False, methods=['get'])
+    def sockets(self, request):
+        """Queue depth and drop counters of the WebSockets served by this process"""
+        return Response(socket_metrics.as_dict())
+    
     def perform_update(self, serializer):
-        serializer.save(updated_by=self.request.user)
+        # Tags move the holder state, not the configured holder
+        holder_changed = (
+            'current_tag_holder' in serializer.validated_data
+            and getattr(serializer.validated_data['current_tag_holder'], 'id', None)
+            != GameEngine.get_holder_state(serializer.instance).holder_id
+        )
+        extra = {'tag_holder_since': timezone.now()} if holder_changed else {}
+        settings = serializer.save(updated_by=self.request.user, **extra)
+        if holder_changed:
+            # Admin override of the holder
+            GameEngine.set_holder(settings, settings.current_tag_holder, settings.tag_holder_since)
+        # Bonus rules may have changed
+        GameEngine.rebuild_scores(settings)
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(GameScopedMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.filter(verified=True)
     serializer_class = TagSerializer
     
     def get_queryset(self):
         queryset = super().get_queryset()
+        if self.action in ['verify', 'delete_tag']:
+            # Admins also act on unverified tags
+            queryset = Tag.objects.all()
+        if not self.detail:
+            queryset = queryset.filter(game=self.get_game())
         
         # Filter by user
         user_id = self.request.query_params.get('user', None)
@@ -76,22 +158,32 @@ class TagViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    def perform_create(self, serializer):
+        serializer.save(game=self.get_game())
+    
     @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def create_tag(self, request):
         """Create a new tag event - only tag holder can tag"""
-        # Check if user is the current tag holder
-        current_holder = GameEngine.get_current_tag_holder()
-        if current_holder != request.user:
-            return Response(
-                {'error': 'Only the current tag holder can tag someone else'},
-                status=status.HTTP_403_FORBIDDEN
-            )
-        
         serializer = CreateTagSerializer(
             data=request.data,
             context={'request': request}
         )
         serializer.is_valid(raise_exception=True)
+        expected_version = serializer.validated_data.get('holder_version')
+        
+        # Check if user is the current tag holder
+        game = self.get_game()
+        holder = GameEngine.get_holder_info_for(game, request.user, expected_version)
+        if expected_version is not None and expected_version != holder['version']:
+            return self.holder_conflict(holder, 'The tag has changed hands, reload and try again')
+        if holder['user_id'] != request.user.id:
+            if GameEngine.previous_holder_id(game, holder) == request.user.id:
+                # Held the tag until another of their tags won the race
+                return self.holder_conflict(holder, 'The tag has changed hands, reload and try again')
+            return Response(
+                {'error': 'Only the current tag holder can tag someone else', 'holder': holder['user']},
+                status=status.HTTP_403_FORBIDDEN
+            )
         
         try:
             tagged_user = User.objects.get(id=serializer.validated_data['tagged_user_id'])
@@ -101,17 +193,23 @@ class TagViewSet(viewsets.ModelViewSet):
                 tagged=tagged_user,
                 location=serializer.validated_data.get('location'),
                 notes=serializer.validated_data.get('notes'),
-                photo=serializer.validated_data.get('photo')
+                photo=serializer.validated_data.get('photo'),
+                expected_version=expected_version,
+                settings=game
             )
             
-            # Send notification asynchronously
+            # Send notification and recompute derived state asynchronously
             send_tag_notification.delay(tag.id)
+            schedule_derived_update(tag.id, game.pk)
             
             return Response({
                 'message': 'Tag created successfully',
                 'tag': TagSerializer(tag).data
             }, status=status.HTTP_201_CREATED)
             
+        except HolderConflict as e:
+            # Lost the race to another tag
+            return self.holder_conflict(e.holder, str(e))
         except ValueError as e:
             return Response(
                 {'error': str(e)},
@@ -123,25 +221,23 @@ class TagViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
     
+    def holder_conflict(self, holder, message):
+        """409 response carrying the new holder"""
+        return Response(
+            {'error': message, 'holder': holder['user'], 'holder_version': holder['version']},
+            status=status.HTTP_409_CONFLICT
+        )
+    
     @action(detail=False, methods=['get'])
     def current_holder(self, request):
         """Get the player currently holding the tag"""
+        game = self.get_game()
         try:
-            holder = GameEngine.get_current_tag_holder()
-            if not holder:
-                return Response({'user': None, 'since': None})
-
-            from users.serializers import UserSerializer
-            last_tag = Tag.objects.filter(tagged=holder).order_by('-tagged_at').first()
-            settings = GameSettings.get_settings()
-            since = None
-            if last_tag:
-                since = last_tag.tagged_at
-            elif settings and settings.tag_holder_since:
-                since = settings.tag_holder_since
+            holder = GameEngine.get_current_holder_info(game)
             return Response({
-                'user': UserSerializer(holder).data,
-                'since': since
+                'user': holder['user'],
+                'since': parse_datetime(holder['since']) if holder['since'] else None,
+                'version': holder['version']
             })
         except Exception as exc:
             # If settings are not yet configured or DB is empty, return a safe empty state
@@ -161,44 +257,95 @@ class TagViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAdminUser])
     def verify(self, request, pk=None):
-        """Admin verifies a tag"""
+        """Admin verifies a tag, or sets ``verified`` false for a disputed one"""
         tag = self.get_object()
-        tag.verified = True
-        tag.save()
-        return Response({'message': 'Tag verified'})
+        verified = str(request.data.get('verified', True)).lower() not in ('false', '0')
+        GameEngine.change_tag(tag, verified=verified)
+        return Response({'message': 'Tag verified' if verified else 'Tag unverified'})
     
     @action(detail=True, methods=['delete'], permission_classes=[permissions.IsAdminUser])
     def delete_tag(self, request, pk=None):
         """Admin deletes a disputed tag"""
         tag = self.get_object()
-        tag.delete()
+        GameEngine.change_tag(tag, delete=True)
         return Response({'message': 'Tag deleted'}, status=status.HTTP_204_NO_CONTENT)
 
 
-class LeaderboardViewSet(viewsets.ViewSet):
+class LeaderboardViewSet(GameScopedMixin, viewsets.ViewSet):
     """ViewSet for leaderboard data"""
     
     permission_classes = [permissions.AllowAny]
     
     def list(self, request):
-        """Get current leaderboard"""
-        leaderboard = GameEngine.calculate_leaderboard()
+        """Get current leaderboard, or the one at ``?as_of=<timestamp or date>``"""
+        as_of = request.query_params.get('as_of', None)
+        if as_of:
+            as_of = self.parse_as_of(as_of)
+            if as_of is None:
+                return Response(
+                    {'error': 'as_of must be an ISO 8601 timestamp or date'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        if as_of and as_of < timezone.now():
+            leaderboard = GameEngine.calculate_leaderboard_as_of(as_of, self.get_game())
+        else:
+            leaderboard = GameEngine.calculate_leaderboard(self.get_game())
         serializer = LeaderboardSerializer(leaderboard, many=True)
         return Response(serializer.data)
     
+    @staticmethod
+    def parse_as_of(value):
+        """Timestamp for an ``as_of`` value, a date means the end of that day"""
+        try:
+            day = parse_date(value)
+            if day is not None:
+                as_of = datetime.combine(day + timedelta(days=1), time.min) - timedelta(microseconds=1)
+            else:
+                as_of = parse_datetime(value)
+        except ValueError:
+            return None
+        if as_of is None:
+            return None
+        if timezone.is_naive(as_of):
+            as_of = timezone.make_aware(as_of)
+        return as_of
+    
     @action(detail=False, methods=['get'])
     def live(self, request):
         """Get live leaderboard with real-time updates"""
         return self.list(request)
+    
+    @action(detail=False, methods=['get'])
+    def around(self, request):
+        """Get leaderboard entries around a player"""
+        user_id = request.query_params.get('user', None)
+        if not user_id and request.user.is_authenticated:
+            user_id = request.user.id
+        
+        try:
+            user = User.objects.get(id=user_id)
+            radius = min(int(request.query_params.get('radius', 2)), 10)
+        except (User.DoesNotExist, ValueError, TypeError):
+            return Response(
+                {'error': 'User not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        leaderboard = GameEngine.leaderboard_around(user, radius, self.get_game())
+        serializer = LeaderboardSerializer(leaderboard, many=True)
+        return Response(serializer.data)
 
 
-class AchievementViewSet(viewsets.ReadOnlyModelViewSet):
+class AchievementViewSet(GameScopedMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Achievement.objects.all()
     serializer_class = AchievementSerializer
     permission_classes = [permissions.AllowAny]
     
     def get_queryset(self):
         queryset = super().get_queryset()
+        if not self.detail:
+            queryset = queryset.filter(game=self.get_game())
         user_id = self.request.query_params.get('user', None)
         if user_id:
             queryset = queryset.filter(user_id=user_id)
@@ -207,7 +354,7 @@ class AchievementViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
     def recalculate(self, request):
         """Admin triggers achievement recalculation"""
-        GameEngine.calculate_achievements()
+        GameEngine.calculate_achievements(self.get_game())
         return Response({'message': 'Achievements recalculated'})
     
     @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
@@ -215,17 +362,19 @@ class AchievementViewSet(viewsets.ReadOnlyModelViewSet):
         """Admin creates a custom achievement"""
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        serializer.save(game=self.get_game())
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class PlayerStatsViewSet(viewsets.ReadOnlyModelViewSet):
+class PlayerStatsViewSet(GameScopedMixin, viewsets.ReadOnlyModelViewSet):
     queryset = PlayerStats.objects.all()
     serializer_class = PlayerStatsSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
         queryset = super().get_queryset()
+        if not self.detail:
+            queryset = queryset.filter(game=self.get_game())
         user_id = self.request.query_params.get('user', None)
         if user_id:
             queryset = queryset.filter(user_id=user_id)
@@ -239,3 +388,27 @@ class PlayerStatsViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(date__lte=date_to)
         
         return queryset
+    
+    @action(detail=False, methods=['get'])
+    def timeseries(self, request):
+        """Columnar points/rank history for charts
+
+        ``?users=1,2`` (yourself by default), ``?resolution=day|week`` and
+        ``?every=N`` to keep every N-th sample.
+        """
+        resolution = request.query_params.get('resolution', 'day')
+        try:
+            users = request.query_params.get('users') or str(request.user.id)
+            user_ids = [int(user_id) for user_id in users.split(',') if user_id]
+            every = int(request.query_params.get('every', 1))
+        except ValueError:
+            user_ids, every = [], 0
+        
+        if (resolution not in StatsSeries.RESOLUTIONS or every < 1
+                or not user_ids or len(user_ids) > StatsSeries.MAX_PLAYERS):
+            return Response(
+                {'error': f'Pass up to {StatsSeries.MAX_PLAYERS} users, resolution day or week and every >= 1'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(StatsSeries(self.get_game()).get(user_ids, resolution, every))
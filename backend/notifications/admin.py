@@ -5,7 +5,7 @@ from .models import Notification
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
     list_display = ['user', 'notification_type', 'title', 'sent_at', 'push_sent', 'read_at']
-    list_filter = ['notification_type', 'push_sent', 'sent_at']
+    list_filter = ['game', 'notification_type', 'push_sent', 'sent_at']
     search_fields = ['user__username', 'title', 'message']
     readonly_fields = ['sent_at', 'push_sent_at', 'read_at']
     
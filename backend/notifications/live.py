@@ -0,0 +1,53 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+from game.broadcast import broadcast
+from game.serializers import TagSerializer
+from .models import Notification
+from .serializers import NotificationSerializer
+
+User = get_user_model()
+
+
+def new_tag_data(tag):
+    """Payload of the ``new_tag`` event of a tag
+
+    ``tag`` is the tag as the REST API serializes it, so clients can add it
+    to the tag lists they fetched.
+    """
+    return {
+        'tag_id': tag.id,
+        'tagger': tag.tagger.full_name,
+        'tagged': tag.tagged.full_name,
+        'message': tag.game.notification_message_template.format(
+            tagger=tag.tagger.full_name,
+            tagged=tag.tagged.full_name
+        ),
+        'timestamp': tag.tagged_at.isoformat(),
+        'tag': TagSerializer(tag).data
+    }
+
+
+def unread_counts(user_ids):
+    """Dict of user id -> number of unread notifications"""
+    counts = dict(
+        Notification.objects.filter(user_id__in=user_ids, read_at__isnull=True)
+        .values('user_id').annotate(count=Count('id')).values_list('user_id', 'count')
+    )
+    return {user_id: counts.get(user_id, 0) for user_id in user_ids}
+
+
+def push_unread_counts(user_ids):
+    """Send the unread notification count to the sockets of each player"""
+    for user_id, count in unread_counts({user_id for user_id in user_ids if user_id}).items():
+        broadcast(User(pk=user_id).group_name, {'type': 'unread_count', 'data': {'count': count}})
+
+
+def push_notifications(notifications):
+    """Send new notifications to the sockets of their players, with the unread counts"""
+    notifications = [notification for notification in notifications if notification.user_id]
+    for notification in notifications:
+        broadcast(
+            notification.user.group_name,
+            {'type': 'notification', 'data': NotificationSerializer(notification).data}
+        )
+    push_unread_counts(notification.user_id for notification in notifications)
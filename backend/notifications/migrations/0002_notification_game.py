@@ -0,0 +1,26 @@
+# Generated by Django 5.0.1 on 2026-10-18 20:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0008_game_indexes'),
+        ('notifications', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='game',
+            field=models.ForeignKey(blank=True, help_text='Game the notification is about, if any', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='game.gamesettings'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['game', '-sent_at'], name='notificatio_game_id_ffd1a4_idx'),
+        ),
+    ]
@@ -25,6 +25,15 @@ class Notification(models.Model):
         help_text='If null, sent to all users'
     )
     
+    game = models.ForeignKey(
+        'game.GameSettings',
+        on_delete=models.CASCADE,
+        related_name='notifications',
+        null=True,
+        blank=True,
+        help_text='Game the notification is about, if any'
+    )
+    
     notification_type = models.CharField(max_length=20, choices=NOTIFICATION_TYPES)
     title = models.CharField(max_length=200)
     message = models.TextField()
@@ -42,6 +51,7 @@ class Notification(models.Model):
         ordering = ['-sent_at']
         indexes = [
             models.Index(fields=['user', '-sent_at']),
+            models.Index(fields=['game', '-sent_at']),
             models.Index(fields=['notification_type']),
         ]
     
@@ -9,7 +9,7 @@ class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
         fields = [
-            'id', 'user', 'user_name', 'notification_type',
+            'id', 'user', 'user_name', 'game', 'notification_type',
             'title', 'message', 'data', 'sent_at', 'read_at',
             'is_read', 'push_sent', 'push_sent_at'
         ]
@@ -11,49 +11,57 @@ User = get_user_model()
 @shared_task
 def send_tag_notification(tag_id):
     """Send push notification when a new tag occurs"""
-    from game.models import Tag, GameSettings
+    from game.models import Tag
+    from game.broadcast import GameStream, broadcast
+    from game.game_engine import GameEngine
+    from users.serializers import UserSerializer
     from .models import Notification
-    from channels.layers import get_channel_layer
-    from asgiref.sync import async_to_sync
+    from .live import new_tag_data, push_notifications
     
     try:
-        tag = Tag.objects.get(id=tag_id)
-        game_settings = GameSettings.get_settings()
+        tag = Tag.objects.select_related('game').get(id=tag_id)
+        game_settings = tag.game
+        data = new_tag_data(tag)
+        
+        # Live game state, sent whether or not players get notified
+        holder = GameEngine.get_current_holder_info(game_settings)
+        GameStream(game_settings).publish({
+            'type': 'new_tag',
+            'data': data,
+            'holder': {'user': holder['user'], 'since': holder['since'], 'version': holder['version']}
+        })
         
         if not game_settings.enable_notifications:
             return
         
-        # Format notification message
-        message = game_settings.notification_message_template.format(
-            tagger=tag.tagger.full_name,
-            tagged=tag.tagged.full_name
-        )
-        
+        message = data['message']
         title = game_settings.notification_title
         
         # Get all approved users except the tagger
         users = User.objects.filter(is_approved=True).exclude(id=tag.tagger.id)
         
-        # Send to each user via WebSocket
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            'game_updates',
+        # The two players get their own events
+        broadcast(
+            tag.tagged.group_name,
             {
-                'type': 'new_tag',
+                'type': 'tagged',
                 'data': {
                     'tag_id': tag.id,
+                    'game': game_settings.pk,
                     'tagger': tag.tagger.full_name,
-                    'tagged': tag.tagged.full_name,
-                    'message': message,
                     'timestamp': tag.tagged_at.isoformat()
                 }
             }
         )
+        for player in (tag.tagger, tag.tagged):
+            broadcast(player.group_name, {'type': 'profile', 'data': UserSerializer(player).data})
         
         # Send push notifications
+        notifications = []
         for user in users:
             notification = Notification.objects.create(
                 user=user,
+                game=game_settings,
                 notification_type='tag',
                 title=title,
                 message=message,
@@ -64,10 +72,14 @@ def send_tag_notification(tag_id):
                 }
             )
             
+            notifications.append(notification)
+            
             # Send web push if user has subscription
             if user.push_subscription:
                 send_web_push.delay(notification.id)
         
+        push_notifications(notifications)
+        
     except Tag.DoesNotExist:
         pass
 
@@ -126,12 +138,14 @@ def send_web_push(notification_id):
 def send_bulk_notification(title, message, notification_type='custom', user_ids=None):
     """Send notification to multiple users or all users"""
     from .models import Notification
+    from .live import push_notifications
     
     if user_ids:
         users = User.objects.filter(id__in=user_ids, is_approved=True)
     else:
         users = User.objects.filter(is_approved=True)
     
+    notifications = []
     for user in users:
         notification = Notification.objects.create(
             user=user,
@@ -139,9 +153,12 @@ def send_bulk_notification(title, message, notification_type='custom', user_ids=
             title=title,
             message=message
         )
+        notifications.append(notification)
         
         if user.push_subscription:
             send_web_push.delay(notification.id)
+    
+    push_notifications(notifications)
 
 
 @shared_task
@@ -5,6 +5,7 @@ from django.utils import timezone
 from .models import Notification
 from .serializers import NotificationSerializer, SendNotificationSerializer
 from .tasks import send_bulk_notification
+from .live import push_unread_counts
 
 
 class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
@@ -12,11 +13,17 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        """Get notifications for current user"""
+        """Get notifications for current user, ``?game=<id>`` for one game"""
         if self.request.user.is_staff:
             # Admins can see all notifications
-            return Notification.objects.all()
-        return Notification.objects.filter(user=self.request.user)
+            queryset = Notification.objects.all()
+        else:
+            queryset = Notification.objects.filter(user=self.request.user)
+        
+        game_id = self.request.query_params.get('game')
+        if game_id and game_id.isdigit():
+            queryset = queryset.filter(game_id=game_id)
+        return queryset
     
     @action(detail=False, methods=['get'])
     def unread(self, request):
@@ -44,15 +51,17 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
         
         notification.read_at = timezone.now()
         notification.save()
+        push_unread_counts([notification.user_id])
         
         return Response({'message': 'Notification marked as read'})
     
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
         """Mark all notifications as read"""
-        self.get_queryset().filter(read_at__isnull=True).update(
-            read_at=timezone.now()
-        )
+        unread = self.get_queryset().filter(read_at__isnull=True)
+        user_ids = set(unread.exclude(user=None).values_list('user_id', flat=True))
+        unread.update(read_at=timezone.now())
+        push_unread_counts(user_ids)
         return Response({'message': 'All notifications marked as read'})
     
     @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
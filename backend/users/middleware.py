@@ -0,0 +1,40 @@
+from urllib.parse import parse_qs
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """Authenticates WebSocket connections with a SimpleJWT access token
+
+    Browsers cannot set headers on a WebSocket, so the token is passed as
+    ``?token=<access token>``. Only a socket without a token goes through
+    Django's session authentication; an invalid token makes it anonymous.
+    """
+    
+    def __init__(self, inner):
+        super().__init__(inner)
+        self.session_inner = AuthMiddlewareStack(inner)
+    
+    async def __call__(self, scope, receive, send):
+        token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+        if not token:
+            return await self.session_inner(scope, receive, send)
+        scope = dict(scope, user=await self.get_user(token[0]))
+        return await super().__call__(scope, receive, send)
+    
+    @database_sync_to_async
+    def get_user(self, raw_token):
+        authentication = JWTAuthentication()
+        try:
+            return authentication.get_user(authentication.get_validated_token(raw_token))
+        except (InvalidToken, AuthenticationFailed):
+            return AnonymousUser()
+
+
+def JWTAuthMiddlewareStack(inner):
+    """JWT authentication, falling back to Django's session authentication"""
+    return JWTAuthMiddleware(inner)
@@ -44,3 +44,8 @@ class User(AbstractUser):
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}".strip() or self.username
+    
+    @property
+    def group_name(self):
+        """Channel layer group of the player's sockets"""
+        return f'user_{self.pk}'
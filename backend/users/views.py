@@ -9,6 +9,7 @@ from .serializers import (
     CustomTokenObtainPairSerializer, PushSubscriptionSerializer,
     ChangePasswordSerializer
 )
+from game.game_engine import GameEngine
 
 User = get_user_model()
 
@@ -50,7 +51,8 @@ class UserViewSet(viewsets.ModelViewSet):
             request.user, data=request.data, partial=True
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        user = serializer.save()
+        GameEngine.sync_player(user)
         return Response(serializer.data)
     
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAdminUser])
@@ -61,6 +63,7 @@ class UserViewSet(viewsets.ModelViewSet):
         user.approved_at = timezone.now()
         user.approved_by = request.user
         user.save()
+        GameEngine.sync_player(user)
         return Response({
             'message': f'User {user.username} approved',
             'user': UserSerializer(user).data
@@ -73,6 +76,7 @@ class UserViewSet(viewsets.ModelViewSet):
         user.is_approved = False
         user.approved_at = None
         user.save()
+        GameEngine.sync_player(user)
         return Response({
             'message': f'User {user.username} approval revoked',
             'user': UserSerializer(user).data
@@ -1,4 +1,5 @@
 import { useAuthStore } from '../stores/authStore';
+import { useGameStore } from '../stores/gameStore';
 import { Bell } from 'lucide-react';
 import { useQuery } from '@tanstack/react-query';
 import { notificationsAPI } from '../utils/api';
@@ -8,15 +9,17 @@ export default function Header() {
   const { user, isSpectator } = useAuthStore();
   const navigate = useNavigate();
 
-  const { data: unreadCount } = useQuery({
+  // The socket pushes changes, the query only covers the time before it connects
+  const pushedCount = useGameStore((state) => state.unreadCount);
+  const { data: fetchedCount } = useQuery({
     queryKey: ['notifications', 'unread-count'],
     queryFn: async () => {
       const response = await notificationsAPI.getUnreadCount();
       return response.data.count;
     },
-    enabled: !!user && !isSpectator,
-    refetchInterval: 30000 // Refetch every 30 seconds
+    enabled: !!user && !isSpectator
   });
+  const unreadCount = pushedCount ?? fetchedCount;
 
   return (
     <header className="bg-primary text-white shadow-lg sticky top-0 z-50">
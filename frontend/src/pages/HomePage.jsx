@@ -15,13 +15,13 @@ export default function HomePage() {
     }
   });
 
+  // Fetched once, the game socket keeps the holder, leaderboard and recent tags current
   const { data: currentHolder } = useQuery({
     queryKey: ['current-holder'],
     queryFn: async () => {
       const response = await gameAPI.getCurrentHolder();
       return response.data;
-    },
-    refetchInterval: 10000 // Refresh every 10 seconds
+    }
   });
 
   const { data: leaderboard } = useQuery({
@@ -29,8 +29,7 @@ export default function HomePage() {
     queryFn: async () => {
       const response = await gameAPI.getLeaderboard();
       return response.data;
-    },
-    refetchInterval: 30000 // Refresh every 30 seconds
+    }
   });
 
   const { data: recentTags } = useQuery({
@@ -38,8 +37,7 @@ export default function HomePage() {
     queryFn: async () => {
       const response = await gameAPI.getTags({ page_size: 5 });
       return response.data.results || response.data;
-    },
-    refetchInterval: 15000
+    }
   });
 
   return (
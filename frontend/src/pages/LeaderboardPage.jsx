@@ -5,13 +5,13 @@ import { formatDuration, intervalToDuration } from 'date-fns';
 import clsx from 'clsx';
 
 export default function LeaderboardPage() {
+  // Fetched once, the game socket pushes changes into the cache
   const { data: leaderboard, isLoading } = useQuery({
     queryKey: ['leaderboard'],
     queryFn: async () => {
       const response = await gameAPI.getLeaderboard();
       return response.data;
-    },
-    refetchInterval: 15000
+    }
   });
 
   const formatTimeHeld = (duration) => {
@@ -1,4 +1,51 @@
 import { create } from 'zustand';
+import toast from 'react-hot-toast';
+import { useAuthStore } from './authStore';
+import { queryClient } from '../utils/queryClient';
+
+// Tags shown in the recent tags list, as fetched by HomePage
+const RECENT_TAGS = 5;
+
+// Apply a leaderboard_patch to a leaderboard, see game.feed.LeaderboardFeed
+const applyLeaderboardPatch = (leaderboard, patch) => {
+  const removed = new Set(patch.removed);
+  const entries = new Map(
+    leaderboard
+      .filter((entry) => !removed.has(entry.user.id))
+      .map((entry) => [entry.user.id, entry])
+  );
+  patch.changed.forEach(({ user_id, user, ...fields }) => {
+    const entry = entries.get(user_id) || {};
+    entries.set(user_id, { ...entry, ...fields, user: { ...entry.user, ...user } });
+  });
+  return [...entries.values()].sort((a, b) => a.rank - b.rank);
+};
+
+// Acknowledge the last handled seq at most once a second, the server
+// closes sockets whose client falls too far behind
+const ACK_INTERVAL = 1000;
+let ackTimer = null;
+
+const scheduleAck = (ws) => {
+  if (ackTimer) return;
+  ackTimer = setTimeout(() => {
+    ackTimer = null;
+    if (ws.readyState === WebSocket.OPEN) {
+      ws.send(JSON.stringify({ type: 'ack', seq: useGameStore.getState().lastSeq }));
+    }
+  }, ACK_INTERVAL);
+};
+
+// Pages read the game state from the query cache, the socket keeps it current
+const cacheLeaderboard = (leaderboard, version) => {
+  useGameStore.setState({ leaderboard, leaderboardVersion: version });
+  queryClient.setQueryData(['leaderboard'], leaderboard);
+};
+
+const cacheHolder = (holder) => {
+  useGameStore.setState({ currentHolder: holder });
+  queryClient.setQueryData(['current-holder'], holder);
+};
 
 export const useGameStore = create((set, get) => ({
   // WebSocket connection
@@ -8,34 +55,118 @@ export const useGameStore = create((set, get) => ({
   // Game state
   currentHolder: null,
   leaderboard: [],
+  leaderboardVersion: null,
   recentTags: [],
   achievements: [],
   gameSettings: null,
+  unreadCount: null,
+  // Sequence number of the last game frame, to resume after reconnecting
+  lastSeq: null,
+  // Seqs the server coalesced away, they never arrive
+  skippedSeqs: [],
   
   // Connect to WebSocket
   connectWebSocket: () => {
     const wsUrl = import.meta.env.VITE_WS_URL || 'ws://localhost:8000/ws/game/';
+    // Authenticates the socket for the player's own events
+    const token = localStorage.getItem('access_token');
+    const params = new URLSearchParams();
+    if (token) params.set('token', token);
+    if (get().lastSeq !== null) params.set('last_seq', get().lastSeq);
+    const query = params.toString();
     
     try {
-      const ws = new WebSocket(wsUrl);
+      const ws = new WebSocket(query ? `${wsUrl}?${query}` : wsUrl);
       
       ws.onopen = () => {
         console.log('WebSocket connected');
         set({ isConnected: true, ws });
+        ws.send(JSON.stringify({ type: 'leaderboard_sync', version: get().leaderboardVersion }));
       };
       
       ws.onmessage = (event) => {
         const data = JSON.parse(event.data);
         
+        if (data.type === 'coalesced') {
+          set((state) => ({ skippedSeqs: [...state.skippedSeqs, ...data.seqs] }));
+          return;
+        }
+        
+        if (data.seq != null && data.type !== 'snapshot') {
+          const { lastSeq, skippedSeqs } = get();
+          if (lastSeq !== null && data.seq <= lastSeq) {
+            // Already seen, replays may overlap live frames
+            return;
+          }
+          let expected = lastSeq + 1;
+          while (skippedSeqs.includes(expected)) expected += 1;
+          if (lastSeq !== null && data.seq > expected) {
+            // Missed frames, the replay includes this one
+            ws.send(JSON.stringify({ type: 'resume', last_seq: lastSeq }));
+            return;
+          }
+          set({ lastSeq: data.seq, skippedSeqs: skippedSeqs.filter((seq) => seq > data.seq) });
+          scheduleAck(ws);
+        }
+        
         switch (data.type) {
+          case 'snapshot':
+            set({
+              lastSeq: data.seq,
+              skippedSeqs: [],
+              recentTags: data.data.recent_tags
+            });
+            cacheHolder(data.data.holder);
+            cacheLeaderboard(data.data.leaderboard.data, data.data.leaderboard.version);
+            queryClient.setQueryData(
+              ['recent-tags'],
+              data.data.recent_tags.slice(0, RECENT_TAGS).map((tag) => tag.tag)
+            );
+            break;
+          
           case 'new_tag':
             set((state) => ({
               recentTags: [data.data, ...state.recentTags].slice(0, 10)
             }));
+            cacheHolder(data.holder);
+            // Lists not fetched yet are fetched whole when a page needs them
+            queryClient.setQueryData(['recent-tags'], (tags) => tags && [
+              data.data.tag,
+              ...tags.filter((tag) => tag.id !== data.data.tag.id)
+            ].slice(0, RECENT_TAGS));
             break;
           
           case 'leaderboard_update':
-            set({ leaderboard: data.data });
+            cacheLeaderboard(data.data, data.version);
+            break;
+          
+          case 'leaderboard_patch':
+            if (get().leaderboardVersion === data.base) {
+              cacheLeaderboard(applyLeaderboardPatch(get().leaderboard, data), data.version);
+            } else {
+              // Missed an update, ask for what we are missing
+              ws.send(JSON.stringify({ type: 'leaderboard_sync', version: get().leaderboardVersion }));
+            }
+            break;
+          
+          case 'tagged':
+            toast(`${data.data.tagger} ťa chytil!`);
+            break;
+          
+          case 'profile':
+            useAuthStore.setState({ user: data.data });
+            break;
+          
+          case 'notification':
+            toast(data.data.title);
+            break;
+          
+          case 'unread_count':
+            set({ unreadCount: data.data.count });
+            break;
+          
+          case 'achievement':
+            toast.success(`${data.data.icon} ${data.data.title}`);
             break;
           
           case 'game_update':
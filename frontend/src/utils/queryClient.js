@@ -0,0 +1,13 @@
+import { QueryClient } from '@tanstack/react-query';
+
+// Shared with the game store, which writes pushed game state into the cache
+export const queryClient = new QueryClient({
+  defaultOptions: {
+    queries: {
+      staleTime: 1000 * 60 * 5, // 5 minutes
+      cacheTime: 1000 * 60 * 30, // 30 minutes
+      refetchOnWindowFocus: true,
+      retry: 1
+    }
+  }
+});